@@ -0,0 +1,591 @@
+#!/usr/bin/python
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Analysis
+#
+#
+# Overview: Offline analysis of the pressure logs written by
+#     SRS.log_pressure() or ROV_SRS_Telemetry, run after a dive (requires
+#     NumPy). A log is parsed once, with vectorized operations, into NumPy
+#     arrays saved next to it (LOG.t.npy, LOG.p.npy and LOG.c.npy) and
+#     memory-mapped on later runs. From these, the tool summarizes the
+#     dive, resamples it to a uniform rate, decimates it into min/max/mean
+#     bins for plotting, and detects pressure spikes, optionally only
+#     those during gripper closures (found from the logged LA Command).
+#
+#     Log lines are "HH:MM:SS<TAB>value", optionally followed by the LA,
+#     CS, SS Commands and trends (as ROV_SRS_Telemetry writes them);
+#     malformed lines are dropped. The date is taken from the
+#     log file name (as created by SRS.setup_logfile()); the samples of
+#     each second are spread evenly over that second; midnight rollovers
+#     are detected. Lines "HH:MM:SS.ffffff<TAB>value" and lines of Unix
+#     time "seconds<TAB>value" are read as well. Logs of normalized
+#     readings (recorded without a calibration) are converted to pressure
+#     with --calibrate, in one vectorized pass (see ROV_SRS_Calibration).
+#     Compact binary logs (ROV_SRS_CompactLog) are recognized by their
+#     magic number and decoded instead of parsed.
+#
+# Usage:    python ROV_SRS_Analysis.py "2015-06-01_ROV SRS Data Log"
+#           python ROV_SRS_Analysis.py LOG --resample 10 --output dive.csv
+#           python ROV_SRS_Analysis.py LOG --decimate 1000 --output plot.csv
+#           python ROV_SRS_Analysis.py LOG --spikes --during 10:02:00-10:03:30
+#           python ROV_SRS_Analysis.py LOG --spikes --closures
+#           python ROV_SRS_Analysis.py LOG --calibrate --temperature 4
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import argparse
+from datetime import datetime
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import ROV_SRS_Calibration as Calibration
+import ROV_SRS_CompactLog as CompactLog
+
+#
+# Constant Definitions.
+#
+
+AN_DATE_FORMAT = "%Y-%m-%d"     # Date prefix of the log file names.
+AN_DAY = 86400.0                # Length of a day [sec].
+AN_CACHE_TIMES = ".t.npy"       # Suffixes of the cached arrays.
+AN_CACHE_VALUES = ".p.npy"
+AN_CACHE_COMMANDS = ".c.npy"
+AN_FIELD_WIDTH = 32             # Longest time stamp [bytes].
+AN_COMMANDS = 6                 # Command and trend columns of a log line.
+AN_LA_COMMAND = 0               # Column of the LA Position Command.
+AN_CLOSURE_MARGIN = 2.0         # Time after a gripper closure searched for
+                                # spikes [sec].
+
+AN_SPIKE_WINDOW = 5.0           # Baseline averaging window [sec].
+AN_SPIKE_SIGMA = 6.0            # Spike threshold [robust std. devs.].
+AN_SPIKE_GAP = 0.5              # Largest gap within one spike [sec].
+AN_GAP_FACTOR = 3.0             # Sample spacing counted as a gap
+                                # [median spacings].
+
+_TAB = ord("\t")
+_NEWLINE = ord("\n")
+_DIGITS = [0, 1, 3, 4, 6, 7]    # Digits of "HH:MM:SS".
+# Bytes allowed in a value field.
+_NUMERIC = None if np is None else np.isin(np.arange(256),
+                                           list(b"0123456789.+-eE"))
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("ROV_SRS_Analysis requires NumPy")
+
+def _log_date(path):
+    """Return the Unix time of midnight on the date of a log file."""
+    name = os.path.basename(path)
+    try:
+        day = datetime.strptime(name[:10], AN_DATE_FORMAT)
+    except ValueError:
+        day = datetime.fromtimestamp(os.path.getmtime(path))
+        day = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    return time.mktime(day.timetuple())
+
+def parse_log(path, date=None):
+    """Parse a pressure log into time, value and Command arrays.
+
+    The file is split into lines and fields at the byte level (NumPy
+    searches for the tab and newline bytes): the values are converted
+    in one pass of np.fromstring(), the Commands and time stamps from
+    their digits. Malformed lines, e.g. a last line cut off at
+    power-down, are dropped.
+
+    Args:
+        path:       A String specifying the log file path.
+        date:       The Unix time of midnight on the day the log started
+                    [sec], or None to take it from the file name (or
+                    its modification time).
+
+    Returns:
+        times:      A float64 array of Unix times [sec].
+        values:     A float32 array of the logged values.
+        commands:   An int8 array of the LA, CS, SS Position Commands and
+                    LA, CS, SS trends of each sample (6 columns), or
+                    without columns if the log has none.
+    """
+    _require_numpy()
+
+    if CompactLog.is_compact(path):
+        times, values, extras = CompactLog.CompactLogReader(path).read()
+        return (np.array(times, np.float64),
+                np.array(values, np.float32),
+                np.array(extras, np.int8).reshape(-1, AN_COMMANDS))
+
+    with open(path, "rb") as log:
+        data = np.frombuffer(log.read(), np.uint8)
+    if len(data) and data[-1] != _NEWLINE:
+        data = np.append(data, np.uint8(_NEWLINE))
+
+    # Lines, and the tabs in each: the time stamp ends at the first tab,
+    # the value at the second (or the end of the line).
+    ends = np.flatnonzero(data == _NEWLINE)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    tabs = np.flatnonzero(data == _TAB)
+    first = np.searchsorted(tabs, starts)
+    counts = np.searchsorted(tabs, ends) - first
+    bounds = np.append(tabs, len(data))
+
+    def field_end(n):
+        return np.minimum(bounds[np.minimum(first + n, len(tabs))], ends)
+
+    # The Command columns are there if the first line has them.
+    tabbed = np.flatnonzero(counts)
+    columns = (AN_COMMANDS if len(tabbed) and counts[tabbed[0]] > AN_COMMANDS
+               else 0)
+    stamp_end = field_end(0)
+    value_end = field_end(1)
+    valid = ((counts > columns) & (stamp_end > starts)
+             & (stamp_end - starts <= AN_FIELD_WIDTH))
+
+    # Command fields are a digit, a signed digit or two digits.
+    commands = np.zeros((len(ends), columns), np.int8)
+    for column in range(columns):
+        begin = np.minimum(field_end(1 + column) + 1, len(data) - 1)
+        size = field_end(2 + column) - begin
+        lead = data[begin].astype(np.int16) - ord("0")
+        last = data[np.maximum(begin + size - 1, 0)].astype(np.int16) - (
+            ord("0"))
+        signed = (size == 2) & (lead == ord("-") - ord("0"))
+        tens = (size == 2) & (lead >= 0) & (lead <= 9)
+        valid &= ((size == 1) | signed | tens) & (last >= 0) & (last <= 9)
+        commands[:, column] = np.where(signed, -last,
+                                       np.where(tens, 10*lead + last, last))
+
+    # Blank all but the values of the valid lines (and lines with
+    # anything but a number there), and convert them in one pass.
+    marks = np.zeros(len(data) + 1, np.int8)
+    marks[stamp_end[valid] + 1] += 1
+    marks[value_end[valid]] -= 1
+    inside = np.cumsum(marks[:-1], dtype=np.int8) > 0
+    text = np.where(inside, data, np.uint8(ord(" ")))
+    bad = np.unique(np.searchsorted(
+        ends, np.flatnonzero(inside & ~_NUMERIC[data])))
+    for line in bad:
+        text[stamp_end[line] + 1:value_end[line]] = ord(" ")
+    valid[bad] = False
+    try:
+        values = np.fromstring(text.tobytes(), sep=" ")
+    except ValueError:
+        values = None
+    if values is None or len(values) != np.count_nonzero(valid):
+        # Empty or garbled values: convert line by line.
+        values, kept = _parse_values(data, stamp_end[valid] + 1,
+                                     value_end[valid])
+        valid[valid] = kept
+    values = values.astype(np.float32)
+    commands = commands[valid]
+
+    stamps = _field(data, starts[valid], stamp_end[valid],
+                    int((stamp_end - starts)[valid].max(initial=1)))
+    if len(stamps) == 0:
+        return np.zeros(0), values, commands
+
+    if b":" not in stamps[0]:
+        # Unix time.
+        times = _numbers(stamps)
+        kept = ~np.isnan(times)
+        return times[kept], values[kept], commands[kept]
+
+    # "HH:MM:SS[.ffffff]": decode the digits of all lines at once.
+    chars = stamps.view(np.uint8).reshape(len(stamps), -1)
+    if chars.shape[1] < 8:
+        return np.zeros(0), values[:0], commands[:0]
+    digits = chars[:, :8].astype(np.int32) - ord("0")
+    kept = ((chars[:, 2] == ord(":")) & (chars[:, 5] == ord(":"))
+            & np.all((digits[:, _DIGITS] >= 0) & (digits[:, _DIGITS] <= 9),
+                     axis=1))
+    chars = chars[kept]
+    digits = digits[kept]
+    values = values[kept]
+    commands = commands[kept]
+    seconds = (3600*(10*digits[:, 0] + digits[:, 1])
+               + 60*(10*digits[:, 3] + digits[:, 4])
+               + 10*digits[:, 6] + digits[:, 7]).astype(np.float64)
+
+    if chars.shape[1] > 9:
+        seconds += _fractions(chars)
+    else:
+        seconds += _spread(seconds)
+
+    # Midnight rollovers (time of day jumping back by more than 12 h).
+    days = np.cumsum(np.diff(seconds, prepend=seconds[:1]) < -AN_DAY/2)
+    if date is None:
+        date = _log_date(path)
+    return date + seconds + AN_DAY*days, values, commands
+
+def _field(data, begin, end, width):
+    """Return data[begin:end] of each line, as an array of width bytes.
+
+    Fields are padded with NUL bytes (and must not be longer).
+    """
+    offsets = begin[:, None] + np.arange(width)
+    chars = data[np.minimum(offsets, max(len(data) - 1, 0))]
+    chars = np.where(offsets < end[:, None], chars, 0).astype(np.uint8)
+    return np.ascontiguousarray(chars).view("S{}".format(width)).ravel()
+
+def _parse_values(data, begin, end):
+    """Convert the values line by line (the slow path).
+
+    Returns:
+        values:     A float64 array of the values that parsed.
+        kept:       A Boolean array, True for each line that parsed.
+    """
+    values = []
+    kept = np.zeros(len(begin), bool)
+    for line, (start, stop) in enumerate(zip(begin, end)):
+        try:
+            values.append(float(data[start:stop].tobytes()))
+            kept[line] = True
+        except ValueError:
+            pass
+    return np.array(values, np.float64), kept
+
+def _numbers(fields):
+    """Convert a bytes array to float64, with NaN for malformed fields."""
+    try:
+        return fields.astype(np.float64)
+    except ValueError:
+        pass
+    # Only logs with malformed stamps take the slow path.
+    numbers = np.full(len(fields), np.nan)
+    for n, field in enumerate(fields):
+        try:
+            numbers[n] = float(field)
+        except ValueError:
+            pass
+    return numbers
+
+def _fractions(chars):
+    """Return the fractions of a second of "HH:MM:SS.ffffff" stamps.
+
+    Args:
+        chars:      A uint8 array of the stamp bytes, one row per stamp.
+    """
+    digits = chars[:, 9:].astype(np.int32) - ord("0")
+    running = np.cumprod((digits >= 0) & (digits <= 9), axis=1)
+    running[chars[:, 8] != ord("."), :] = 0
+    scale = 0.1**np.arange(1, digits.shape[1] + 1)
+    return (digits*running*scale).sum(axis=1)
+
+def _spread(seconds):
+    """Spread the samples of each whole second evenly over that second.
+
+    Returns:
+        offsets:    A float64 array of offsets into each second [sec].
+    """
+    starts = np.flatnonzero(np.diff(seconds, prepend=np.nan) != 0)
+    counts = np.diff(np.append(starts, len(seconds)))
+    first = np.repeat(starts, counts)
+    return (np.arange(len(seconds)) - first)/np.repeat(counts, counts)
+
+def load(path, date=None):
+    """Return the time, value and Command arrays of a log, memory-mapped.
+
+    The log is parsed once; its arrays are cached next to it and reused
+    while the log is not modified.
+
+    Args:
+        path:       A String specifying the log file path.
+        date:       Refer to parse_log().
+
+    Returns:
+        times:      A read-only float64 array of Unix times [sec].
+        values:     A read-only float32 array of the logged values.
+        commands:   A read-only int8 array of the Commands and trends.
+                    Refer to parse_log().
+    """
+    _require_numpy()
+
+    caches = [path + suffix for suffix in (
+        AN_CACHE_TIMES, AN_CACHE_VALUES, AN_CACHE_COMMANDS)]
+    mtime = os.path.getmtime(path)
+    if date is not None or not all(
+            os.path.exists(cache) and os.path.getmtime(cache) >= mtime
+            for cache in caches):
+        for cache, array in zip(caches, parse_log(path, date)):
+            np.save(cache, array)
+
+    return tuple(np.load(cache, mmap_mode="r") for cache in caches)
+
+def closures(times, commands, margin=AN_CLOSURE_MARGIN):
+    """Return the gripper closure windows of a log.
+
+    A closure is a run of samples whose LA Position Command is 0
+    (Extend Linear Actuator, Close Gripper), extended by margin to take
+    in the pressure response. The logged Command is the latched one: it
+    holds for as long as the gripper is commanded closed, whereas the
+    trend is only 0 for the control pass that starts the move.
+
+    Args:
+        times:      An array of sample times [sec], increasing.
+        commands:   The Command array of the samples (see parse_log()).
+        margin:     A Float specifying the time added after each
+                    closure [sec].
+
+    Returns:
+        windows:    A List of (start [sec], end [sec]) Tuples.
+    """
+    _require_numpy()
+    if commands.shape[1] < AN_COMMANDS or len(times) == 0:
+        return []
+    closing = np.concatenate(
+        ([False], commands[:, AN_LA_COMMAND] == 0, [False])).astype(np.int8)
+    edges = np.diff(closing)
+    begins = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    return [(float(times[begin]), float(times[end]) + margin)
+            for begin, end in zip(begins, ends)]
+
+def summarize(times, values):
+    """Return a Dict of whole-dive statistics.
+
+    Gaps are sample spacings longer than AN_GAP_FACTOR times the median
+    spacing.
+    """
+    _require_numpy()
+    if len(times) == 0:
+        return {"samples": 0}
+
+    spacing = np.diff(times)
+    median = float(np.median(spacing)) if len(spacing) else 0.0
+    gaps = spacing > AN_GAP_FACTOR*median if median > 0.0 else spacing < 0
+
+    return {
+        "samples": len(times),
+        "start": float(times[0]),
+        "end": float(times[-1]),
+        "duration": float(times[-1] - times[0]),
+        "rate": 1.0/median if median > 0.0 else 0.0,
+        "gaps": int(np.count_nonzero(gaps)),
+        "gap_time": float(spacing[gaps].sum()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(values.mean(dtype=np.float64)),
+        "std": float(values.std(dtype=np.float64)),
+        }
+
+def resample(times, values, rate):
+    """Linearly interpolate the values onto a uniform time grid.
+
+    Args:
+        times:      An array of sample times [sec], increasing.
+        values:     An array of the sample values.
+        rate:       A Float specifying the output rate [Hz].
+
+    Returns:
+        grid:       A float64 array of the uniform times [sec].
+        resampled:  A float64 array of the interpolated values.
+    """
+    _require_numpy()
+    grid = np.arange(times[0], times[-1], 1.0/rate)
+    return grid, np.interp(grid, times, values)
+
+def decimate(times, values, bins):
+    """Reduce the values to min/max/mean per time bin, for plotting.
+
+    Bins are of equal duration; empty bins (gaps) are omitted.
+
+    Args:
+        times:      An array of sample times [sec], increasing.
+        values:     An array of the sample values.
+        bins:       An Integer specifying the number of bins.
+
+    Returns:
+        starts:     A float64 array of the bin start times [sec].
+        low:        The minimum value of each bin.
+        high:       The maximum value of each bin.
+        mean:       The mean value of each bin.
+    """
+    _require_numpy()
+    edges = np.linspace(times[0], times[-1], bins + 1)
+    first = np.searchsorted(times, edges[:-1])
+    used = np.flatnonzero(np.diff(np.append(first, len(times))) > 0)
+    first = first[used]
+    counts = np.diff(np.append(first, len(times)))
+
+    values = np.asarray(values, np.float64)
+    low = np.minimum.reduceat(values, first)
+    high = np.maximum.reduceat(values, first)
+    mean = np.add.reduceat(values, first)/counts
+    return edges[used], low, high, mean
+
+def find_spikes(times, values, sigma=AN_SPIKE_SIGMA,
+                window=AN_SPIKE_WINDOW, gap=AN_SPIKE_GAP):
+    """Detect pressure spikes against a moving-average baseline.
+
+    A sample belongs to a spike if it deviates from the mean of the
+    surrounding window by more than sigma robust standard deviations
+    (1.4826 times the median absolute deviation). Spike samples less
+    than gap apart are merged into one event.
+
+    Args:
+        times:      An array of sample times [sec], increasing.
+        values:     An array of the sample values.
+        sigma:      A Float specifying the threshold [std. devs.].
+        window:     A Float specifying the baseline window [sec].
+        gap:        A Float specifying the largest gap within one
+                    spike [sec].
+
+    Returns:
+        spikes:     A List of (start [sec], end [sec], peak time [sec],
+                    peak deviation) Tuples.
+    """
+    _require_numpy()
+    values = np.asarray(values, np.float64)
+    if len(values) < 3:
+        return []
+
+    # Centred moving average, from a cumulative sum.
+    spacing = float(np.median(np.diff(times)))
+    half = max(int(window/spacing/2), 1)
+    upper = np.minimum(np.arange(len(values)) + half + 1, len(values))
+    lower = np.maximum(np.arange(len(values)) - half, 0)
+
+    def baseline(signal):
+        sums = np.concatenate(([0.0], np.cumsum(signal)))
+        return (sums[upper] - sums[lower])/(upper - lower)
+
+    deviation = values - baseline(values)
+    scale = 1.4826*np.median(np.abs(deviation - np.median(deviation)))
+    if scale == 0.0:
+        scale = float(np.abs(deviation).max()) or 1.0
+    spiking = np.abs(deviation) > sigma*scale
+
+    # Keep the spikes themselves out of the baseline, and check again.
+    deviation = values - baseline(np.where(spiking, values - deviation,
+                                           values))
+    flagged = np.flatnonzero(np.abs(deviation) > sigma*scale)
+    if len(flagged) == 0:
+        return []
+
+    # Group the flagged samples into events.
+    breaks = np.flatnonzero(np.diff(times[flagged]) > gap) + 1
+    spikes = []
+    for group in np.split(flagged, breaks):
+        peak = group[np.argmax(np.abs(deviation[group]))]
+        spikes.append((float(times[group[0]]), float(times[group[-1]]),
+                       float(times[peak]), float(deviation[peak])))
+    return spikes
+
+def _time_of_day(text, date):
+    """Convert "HH:MM:SS" on the day starting at date to Unix time."""
+    hours, minutes, seconds = (float(part) for part in text.split(":"))
+    return date + 3600*hours + 60*minutes + seconds
+
+def _clock(t):
+    return time.strftime("%H:%M:%S", time.localtime(t)) + (
+        "{:.3f}".format(t % 1.0)[1:])
+
+def main():
+    __parser = argparse.ArgumentParser(
+        description="Summarize an ROV SRS pressure log (requires NumPy).")
+    __parser.add_argument("log", help="pressure log file")
+    __parser.add_argument("--date", metavar="YYYY-MM-DD",
+        help="date the log started (default: from the file name)")
+    __parser.add_argument("--resample", type=float, metavar="HZ",
+        help="write the log resampled to HZ to --output")
+    __parser.add_argument("--decimate", type=int, metavar="BINS",
+        help="write min/max/mean of BINS time bins to --output")
+    __parser.add_argument("--output", metavar="FILE",
+        help="CSV file for --resample/--decimate (default: stdout)")
+    __parser.add_argument("--spikes", action="store_true",
+        help="list pressure spikes")
+    __parser.add_argument("--sigma", type=float, default=AN_SPIKE_SIGMA,
+        help="spike threshold [robust std. devs.]")
+    __parser.add_argument("--calibrate", action="store_true",
+        help="convert normalized readings to pressure [psi]")
+    __parser.add_argument("--temperature", type=float,
+        default=Calibration.PT_CAL_TEMP_REF, metavar="DEGC",
+        help="water temperature for --calibrate")
+    __parser.add_argument("--during", action="append", default=[],
+        metavar="HH:MM:SS-HH:MM:SS",
+        help="only list spikes in this window, e.g. a gripper closure "
+             "(repeatable)")
+    __parser.add_argument("--closures", action="store_true",
+        help="only list spikes during the gripper closures of the log")
+    __args = __parser.parse_args()
+
+    if np is None:
+        sys.stderr.write("ROV_SRS_Analysis requires NumPy\n")
+        return 1
+
+    __date = None
+    if __args.date is not None:
+        __date = time.mktime(datetime.strptime(
+            __args.date, AN_DATE_FORMAT).timetuple())
+
+    __start = time.time()
+    __times, __values, __commands = load(__args.log, __date)
+    if __args.calibrate:
+        __values = Calibration.PressureCalibration(
+            temperature = __args.temperature).convert_batch(__values)
+    __summary = summarize(__times, __values)
+    if __summary["samples"] == 0:
+        print("empty log")
+        return 0
+
+    print("samples   {}".format(__summary["samples"]))
+    print("start     {}".format(time.ctime(__summary["start"])))
+    print("duration  {:.1f} s".format(__summary["duration"]))
+    print("rate      {:.2f} Hz".format(__summary["rate"]))
+    print("gaps      {} ({:.1f} s)".format(
+        __summary["gaps"], __summary["gap_time"]))
+    print("min/max   {:.5f} / {:.5f}".format(
+        __summary["min"], __summary["max"]))
+    print("mean/std  {:.5f} / {:.5f}".format(
+        __summary["mean"], __summary["std"]))
+
+    if __args.spikes:
+        __windows = []
+        __day = _log_date(__args.log) if __date is None else __date
+        for __window in __args.during:
+            __begin, __end = __window.split("-")
+            __windows.append((_time_of_day(__begin, __day),
+                              _time_of_day(__end, __day)))
+        if __args.closures:
+            __closures = closures(__times, __commands)
+            print("closures  {}".format(len(__closures)))
+            __windows.extend(__closures)
+
+        __spikes = find_spikes(__times, __values, __args.sigma)
+        if __windows or __args.closures:
+            __spikes = [__spike for __spike in __spikes
+                        if any(__begin <= __spike[2] <= __end
+                               for __begin, __end in __windows)]
+        print("spikes    {}".format(len(__spikes)))
+        for __begin, __end, __peak, __dev in __spikes:
+            print("    {} - {}  peak {} {:+.5f}".format(
+                _clock(__begin), _clock(__end), _clock(__peak), __dev))
+
+    __columns = None
+    if __args.resample:
+        __columns = resample(__times, __values, __args.resample)
+        __header = "time,value"
+    elif __args.decimate:
+        __columns = decimate(__times, __values, __args.decimate)
+        __header = "time,min,max,mean"
+    if __columns is not None:
+        __out = (sys.stdout if __args.output is None
+                 else open(__args.output, "w"))
+        np.savetxt(__out, np.column_stack(__columns), fmt="%.6f",
+                   delimiter=",", header=__header, comments="")
+        if __out is not sys.stdout:
+            __out.close()
+
+    sys.stderr.write("analysed in {:.2f} s\n".format(time.time() - __start))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
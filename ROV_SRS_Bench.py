@@ -0,0 +1,714 @@
+#!/usr/bin/python
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Bench
+#
+#
+# Overview: Benchmark suite for the SRS control code, run against the
+#     simulated hardware backend (ROV_SRS_Sim). Reports the period of
+#     each main() pipeline, stick-to-actuator latency and CPU use of
+#     main() and of each library function, and flags regressions against
+#     a saved baseline.
+#
+#     Simulated metrics ("sim" time) are deterministic and show how long
+#     the code would block on the BeagleBone. CPU metrics are measured on
+#     the host running the benchmark.
+#
+# Usage:    python ROV_SRS_Bench.py --save baseline.json
+#           python ROV_SRS_Bench.py --compare baseline.json
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import argparse
+from collections import deque
+from contextlib import contextmanager
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ["ROV_SRS_BACKEND"] = "sim"
+
+import ROV_SRS_Calibration as Calibration
+import ROV_SRS_Capture as Capture
+import ROV_SRS_Channels as Channels
+import ROV_SRS_CompactLog as CompactLog
+import ROV_SRS_GpioBank as GpioBank
+import ROV_SRS_Iio as Iio
+import ROV_SRS_Library as SRS
+import ROV_SRS_Main as Main
+import ROV_SRS_Motion as Motion
+import ROV_SRS_Pressure as Pressure
+import ROV_SRS_Stats as Stats
+import ROV_SRS_Telemetry as Telemetry
+from ROV_SRS_Sim import SIM
+from ROV_SRS_Sim import SimulationEnd
+
+#
+# Constant Definitions.
+#
+
+# Simulated RC Controller Pulse Widths [sec].
+BENCH_WIDTH_MAX = (1/Main.PWM_WID_FREQ)*(Main.PWM_WID_MAX/100)
+BENCH_WIDTH_MIN = (1/Main.PWM_WID_FREQ)*(Main.PWM_WID_MIN/100)
+BENCH_WIDTH_MID = (BENCH_WIDTH_MAX + BENCH_WIDTH_MIN)/2
+BENCH_WIDTH_NOISE = 10e-6
+
+BENCH_LA_COAST = 0.01       # Linear Actuator coasting time constant [sec].
+
+BENCH_LOOP_TIME = 30.0      # Simulated duration of main() runs [sec].
+BENCH_STEP_TIME = 2.0       # Time of the stick change in latency runs [sec].
+BENCH_LATENCY_MAX = 10.0    # Longest latency waited for [sec].
+BENCH_CALLS = 200           # Default calls per library function benchmark.
+BENCH_AVG_NUM = 5           # Pulses averaged per get_width() call.
+BENCH_GLITCH_EVERY = 7      # One glitched Pulse in this many.
+BENCH_GLITCH_WIDTH = 0.001  # Added width of a glitched Pulse [sec].
+BENCH_TREND_WINDOW = 1000   # Long trend window (constant-time check).
+BENCH_DROPOUT_TIME = 60.0   # Pulse Width measured across a dropout [sec].
+BENCH_CAPTURE_TIME = 10.0   # Simulated duration of edge capture runs [sec].
+BENCH_PRESSURE_TIME = 30.0  # Simulated duration of pressure runs [sec].
+BENCH_JOG_TIME = 2.0        # Full-stick Shoulder jog duration [sec].
+BENCH_IIO_SCANS = 100000    # Scans read in bulk from the IIO stand-in.
+BENCH_CAL_BATCH = 4096      # Readings per batch pressure conversion.
+BENCH_CHANNEL_NUMS = [3, 12, 48]    # Channel counts of the pipeline runs.
+BENCH_CHANNEL_PASSES = 2000         # Pipeline passes timed per run.
+BENCH_LOG_SAMPLES = 36000   # Logged samples (1 hour at PT_LOG_FREQ).
+BENCH_LOG_QUOTA = 64*1024   # Compact log quota of the rotation run [bytes].
+
+BENCH_THRESHOLD = 10.0      # Allowed regression of sim metrics [%].
+BENCH_CPU_THRESHOLD = 50.0  # Allowed regression of host CPU metrics [%].
+
+# Stick profile used for the "active" main() run: (time, pin, width).
+BENCH_PROFILE = [
+    (2.0,  Main.PIN_LA_IN, BENCH_WIDTH_MAX),    # Open gripper.
+    (6.0,  Main.PIN_LA_IN, BENCH_WIDTH_MIN),    # Close gripper.
+    (10.0, Main.PIN_LA_IN, BENCH_WIDTH_MID),
+    (12.0, Main.PIN_CS_IN, BENCH_WIDTH_MAX),    # Index carousel.
+    (14.0, Main.PIN_CS_IN, BENCH_WIDTH_MID),
+    (16.0, Main.PIN_SS_IN, BENCH_WIDTH_MAX),    # Tilt down.
+    (20.0, Main.PIN_SS_IN, BENCH_WIDTH_MIN),    # Tilt up.
+    (24.0, Main.PIN_SS_IN, BENCH_WIDTH_MID),
+    ]
+
+def setup_sim(end=None):
+    """Reset the simulator and attach the SRS hardware to it.
+
+    Args:
+        end:        The simulated time at which the run stops [sec],
+                    or None to run until the caller returns.
+
+    Returns:
+        N/A
+    """
+    SIM.reset(end)
+
+    SIM.attach_pwm(Main.PIN_LA_IN, Main.PWM_WID_FREQ, BENCH_WIDTH_MID,
+                   phase=0.000, noise=BENCH_WIDTH_NOISE, seed=1)
+    SIM.attach_pwm(Main.PIN_CS_IN, Main.PWM_WID_FREQ, BENCH_WIDTH_MID,
+                   phase=0.004, noise=BENCH_WIDTH_NOISE, seed=2)
+    SIM.attach_pwm(Main.PIN_SS_IN, Main.PWM_WID_FREQ, BENCH_WIDTH_MID,
+                   phase=0.009, noise=BENCH_WIDTH_NOISE, seed=3)
+
+    SIM.attach_linear(Main.PIN_LA_OUT, Main.PIN_LA_POT,
+                      SRS.LA_MAX_STROKE, SRS.LA_MAX_TIME,
+                      position=SRS.LA_MAX_STROKE, coast=BENCH_LA_COAST)
+    SIM.attach_stepper(Main.PIN_CS_OUT)
+    SIM.attach_stepper(Main.PIN_SS_OUT)
+    SIM.attach_pressure(Main.PIN_PT_IN)
+
+@contextmanager
+def workdir():
+    """Run the enclosed code in a scratch directory (for log files)."""
+    __cwd = os.getcwd()
+    __tmp = tempfile.mkdtemp(prefix="rov_srs_bench_")
+    os.chdir(__tmp)
+    try:
+        yield __tmp
+    finally:
+        SRS.close_logfile()
+        os.chdir(__cwd)
+        shutil.rmtree(__tmp, ignore_errors=True)
+
+def run_main(end, profile=()):
+    """Run main() on the simulator until the given simulated time.
+
+    Returns:
+        cpu:        The host CPU time spent [sec].
+    """
+    setup_sim(end)
+    for __when, __pin, __width in profile:
+        SIM.set_width(__pin, __width, __when)
+
+    __cpu = time.process_time()
+    with workdir():
+        try:
+            Main.main()
+        except SimulationEnd:
+            pass
+
+    return time.process_time() - __cpu
+
+def bench_main():
+    """Benchmark the main() pipelines, idle and following a profile."""
+    results = {}
+
+    for __name, __profile in (("idle", ()), ("active", BENCH_PROFILE)):
+        __cpu = run_main(BENCH_LOOP_TIME, __profile)
+
+        __prefix = "main.{}.".format(__name)
+        for __stat in Main.scheduler.report():
+            if __stat["cycles"] < 2:
+                continue
+            __task = __prefix + __stat["name"] + "."
+            results[__task + "period_ms"] = 1e3/__stat["rate_hz"]
+            results[__task + "exec_max_ms"] = 1e3*__stat["exec_max"]
+            results[__task + "misses"] = __stat["misses"]
+        results[__prefix + "cpu_pct"] = 100.0*__cpu/BENCH_LOOP_TIME
+
+    return results
+
+def bench_latency():
+    """Benchmark the stick-to-actuator latency of each channel.
+
+    Each run holds all sticks neutral, moves one stick to its maximum at
+    BENCH_STEP_TIME and waits for the first matching output edge.
+    """
+    results = {}
+
+    __channels = (
+        ("la", Main.PIN_LA_IN, Main.PIN_LA_OUT[1]),     # Retract.
+        ("cs", Main.PIN_CS_IN, Main.PIN_CS_OUT[1]),     # STEP.
+        ("ss", Main.PIN_SS_IN, Main.PIN_SS_OUT[1]),     # STEP.
+        )
+
+    for __name, __pin_in, __pin_out in __channels:
+        run_main(BENCH_STEP_TIME + BENCH_LATENCY_MAX,
+                 [(BENCH_STEP_TIME, __pin_in, BENCH_WIDTH_MAX)])
+
+        __latency = None
+        for __t, __pin, __value in SIM.gpio.log:
+            if (__t >= BENCH_STEP_TIME and __pin == __pin_out
+                    and __value == SRS.GPIO.HIGH):
+                __latency = (__t - BENCH_STEP_TIME)*1e3
+                break
+
+        results["latency.{}_ms".format(__name)] = __latency
+
+    return results
+
+def bench_call(name, calls, func, *args_cycle):
+    """Time repeated calls of one library function on the simulator.
+
+    Args:
+        name:       A String naming the benchmark.
+        calls:      An Integer specifying the number of calls.
+        func:       The callable to benchmark.
+        args_cycle: Tuples of arguments, used in turn for each call.
+
+    Returns:
+        results:    A Dict of per-call simulated time and host CPU time.
+    """
+    __sim = SIM.clock.now
+    __cpu = time.process_time()
+
+    for __i in range(calls):
+        func(*args_cycle[__i % len(args_cycle)])
+
+    __cpu = time.process_time() - __cpu
+    __sim = SIM.clock.now - __sim
+
+    return {
+        "fn.{}.sim_ms".format(name): 1e3*__sim/calls,
+        "fn.{}.cpu_us".format(name): 1e6*__cpu/calls,
+        }
+
+def bench_functions():
+    """Benchmark each library function in isolation."""
+    results = {}
+    __pwm = (Main.PWM_WID_FREQ, Main.PWM_WID_MAX,
+             Main.PWM_WID_MIN, Main.PWM_WID_TOL)
+    __hist = [deque([1, 1, 2, 2, 2], maxlen=5),
+              deque([0, 0, 0, 0, 0], maxlen=5),
+              deque([2, 1, 2, 0, 2], maxlen=5)]
+
+    setup_sim()
+    results.update(bench_call(
+        "get_width", 50, SRS.get_width,
+        (Main.PIN_LA_IN, BENCH_AVG_NUM) + __pwm))
+
+    # Signal loss: get_width() on a flat (0% Duty Cycle) signal, the
+    # longest single call (the loss itself) and the calls while lost.
+    SIM.set_width(Main.PIN_LA_IN, 0.0)
+    __sim = SIM.clock.now
+    SRS.get_width(Main.PIN_LA_IN, BENCH_AVG_NUM, *__pwm)
+    results["fn.get_width_loss.sim_ms"] = 1e3*(SIM.clock.now - __sim)
+    results.update(bench_call(
+        "get_width_lost", 50, SRS.get_width,
+        (Main.PIN_LA_IN, BENCH_AVG_NUM) + __pwm))
+    SIM.set_width(Main.PIN_LA_IN, BENCH_WIDTH_MID)
+
+    # Edge capture: host CPU per captured Pulse (including the simulated
+    # interrupt dispatch) and per non-blocking width read.
+    __pins = [Main.PIN_LA_IN, Main.PIN_CS_IN, Main.PIN_SS_IN]
+    __capture = Capture.EdgeCapture(__pins, *__pwm)
+    __cpu = time.process_time()
+    __capture.start()
+    SIM.clock.sleep(BENCH_CAPTURE_TIME)
+    __cpu = time.process_time() - __cpu
+    __pulses = sum(__capture.count(__pin) for __pin in __pins)
+    results["fn.capture_edge.cpu_us"] = 1e6*__cpu/max(__pulses, 1)
+    results.update(bench_call(
+        "capture_width", 20*BENCH_CALLS, __capture.width,
+        (Main.PIN_LA_IN, BENCH_AVG_NUM)))
+
+    # Reacquisition: time from the end of a dropout to a valid width.
+    SIM.set_width(Main.PIN_LA_IN, 0.0)
+    SIM.clock.sleep(1.0)
+    SIM.set_width(Main.PIN_LA_IN, BENCH_WIDTH_MAX)
+    __sim = SIM.clock.now
+    while __capture.lost(Main.PIN_LA_IN):
+        SIM.clock.sleep(0.001)
+    results["fn.capture_reacquire.sim_ms"] = 1e3*(SIM.clock.now - __sim)
+    results.update(bench_call(
+        "capture_filtered", 20*BENCH_CALLS, __capture.filtered,
+        (Main.PIN_LA_IN,)))
+    __capture.stop()
+
+    # Streaming Pulse filter: cost per Pulse, and the RMS error of its
+    # output on a steady stick with glitched Pulses, against the mean of
+    # the last BENCH_AVG_NUM Pulses.
+    __filter = SRS.PulseFilter(Main.PWM_FILTER_NUM, Main.PWM_TRIM_NUM)
+    results.update(bench_call(
+        "pulse_filter", 20*BENCH_CALLS, __filter.update,
+        (BENCH_WIDTH_MID,), (BENCH_WIDTH_MID + 0.00001,),
+        (BENCH_WIDTH_MID + BENCH_GLITCH_WIDTH,)))
+    __filter = SRS.PulseFilter(Main.PWM_FILTER_NUM, Main.PWM_TRIM_NUM)
+    __mean = SRS.PulseFilter(BENCH_AVG_NUM)
+    __errors = [0.0, 0.0]
+    for __n in range(20*BENCH_CALLS):
+        __width = BENCH_WIDTH_MID
+        if __n % BENCH_GLITCH_EVERY == 0:
+            __width += BENCH_GLITCH_WIDTH
+        __errors[0] += (__filter.update(__width) - BENCH_WIDTH_MID)**2
+        __errors[1] += (__mean.update(__width) - BENCH_WIDTH_MID)**2
+    results["fn.pulse_filter.glitch_err_us"] = 1e6*(
+        __errors[0]/(20*BENCH_CALLS))**0.5
+    results["fn.pulse_mean.glitch_err_us"] = 1e6*(
+        __errors[1]/(20*BENCH_CALLS))**0.5
+
+    results.update(bench_call(
+        "set_position", 20*BENCH_CALLS, SRS.set_position,
+        (BENCH_WIDTH_MAX,) + __pwm, (BENCH_WIDTH_MID,) + __pwm,
+        (BENCH_WIDTH_MIN,) + __pwm))
+
+    # Precomputed calibration, including a Pulse measured across a long
+    # signal dropout.
+    __channel = SRS.PwmChannel(*__pwm)
+    results.update(bench_call(
+        "pwm_correct", 20*BENCH_CALLS, __channel.correct,
+        (BENCH_WIDTH_MID,), (BENCH_WIDTH_MAX + 0.0003,),
+        (BENCH_DROPOUT_TIME + BENCH_WIDTH_MID,)))
+    results.update(bench_call(
+        "pwm_classify", 20*BENCH_CALLS, __channel.classify,
+        (BENCH_WIDTH_MAX,), (BENCH_WIDTH_MID,), (BENCH_WIDTH_MIN,)))
+    # Instrumentation overhead of one timed call (of a no-op).
+    results.update(bench_call(
+        "stats_timed", 20*BENCH_CALLS,
+        Stats.Recorder().timed("bench", lambda: None), ()))
+    results.update(bench_call(
+        "check_trend", 20*BENCH_CALLS, SRS.check_trend,
+        (__hist[0], False), (__hist[1], True), (__hist[2], False)))
+
+    # Command trends, one new Command per call: deque history plus
+    # check_trend() against the incremental TrendFilter.
+    __cmds = [(0,), (2,), (2,), (1,), (2,), (0,), (0,)]
+    for __size in (Main.POS_HIST_NUM, BENCH_TREND_WINDOW):
+        __label = "" if __size == Main.POS_HIST_NUM else "_{}".format(__size)
+        __deque = deque([1]*__size, maxlen=__size)
+        results.update(bench_call(
+            "trend_deque" + __label, 20*BENCH_CALLS,
+            lambda cmd: (__deque.append(cmd),
+                         SRS.check_trend(__deque, True)), *__cmds))
+        results.update(bench_call(
+            "trend_filter" + __label, 20*BENCH_CALLS,
+            SRS.TrendFilter(__size, True).update, *__cmds))
+    # A full close from the retracted stroke target. (move_linear()'s
+    # retract polls from a reading of 0.0, so it never waits.)
+    __actuator = SIM.actuators[Main.PIN_LA_POT]
+
+    def __close(position):
+        __actuator.place(position)
+        SRS.move_linear(0, Main.PIN_LA_OUT, Main.PIN_LA_POT,
+                        Main.LA_STROKE_TARGET)
+
+    results.update(bench_call(
+        "move_linear", 20, __close,
+        (SRS.LA_MAX_STROKE - Main.LA_STROKE_TARGET,)))
+
+    # Linear Actuator position control: full strokes and intermediate
+    # setpoints, driven to completion.
+    __motion = Motion.LinearMotion(
+        Main.PIN_LA_OUT, Main.PIN_LA_POT, Main.LA_STROKE_TARGET)
+    __motion.start()
+    __errors = []
+
+    def __linear_move(move, target):
+        move(target)
+        while __motion.busy():
+            SIM.clock.sleep(0.001)
+        __errors.append(abs(__actuator.pot(SIM.clock.now) - __motion.setpoint))
+
+    __reads = __motion.reads
+    results.update(bench_call(
+        "linear_motion", 20, __linear_move,
+        (__motion.command, 2), (__motion.command, 0)))
+    results["fn.linear_motion.reads"] = (__motion.reads - __reads)/20.0
+    results.update(bench_call(
+        "linear_setpoint", 20, __linear_move,
+        (__motion.move_to, 0.6), (__motion.move_to, 0.35),
+        (__motion.move_to, 0.9), (__motion.move_to, 0.8)))
+    results["fn.linear_motion.error_pct"] = 100.0*max(__errors)
+    __motion.stop()
+
+    # Carousel step generator: one index, driven to completion.
+    __stepper = Motion.StepperEngine(
+        Main.PIN_CS_OUT, SRS.CS_STEP_ANGLE, Motion.CS_STEP_RATE_MAX,
+        Motion.CS_STEP_RATE_MIN, Motion.CS_STEP_ACCEL)
+    __stepper.start()
+
+    def __carousel_index(gripper):
+        __stepper.index(gripper)
+        while __stepper.busy():
+            SIM.clock.sleep(0.001)
+
+    results.update(bench_call(
+        "carousel_index", 5, __carousel_index, (Main.CS_GRIPPER_NUM,)))
+    __stepper.stop()
+
+    results.update(bench_call(
+        "move_carousel", 5, SRS.move_carousel,
+        (2, Main.PIN_CS_OUT, Main.CS_GRIPPER_NUM)))
+    results.update(bench_call(
+        "move_shoulder", BENCH_CALLS, SRS.move_shoulder,
+        (2, Main.PIN_SS_OUT), (0, Main.PIN_SS_OUT)))
+
+    # Whole command patterns: pin by pin through GPIO.output(), and as
+    # precompiled register masks on a file-backed GPIO bank, checking the
+    # bank output levels against the tables.
+    __tables = [(Main.PIN_LA_OUT, SRS.LA_COMMANDS),
+                (Main.PIN_CS_OUT, SRS.CS_COMMANDS),
+                (Main.PIN_SS_OUT, SRS.SS_COMMANDS)]
+    __cmds = [(__n,) for __n in (0, 1, 2, 1)]
+    results.update(bench_call(
+        "command_gpio", 20*BENCH_CALLS,
+        SRS.CommandOutputs(*__tables[2]).write, *__cmds))
+    with workdir():
+        __bank = GpioBank.GpioBanks("gpio.bin")
+        __outputs = [__bank.command_outputs(__out, __table)
+                     for __out, __table in __tables]
+        results.update(bench_call(
+            "command_bank", 20*BENCH_CALLS, __outputs[2].write, *__cmds))
+        __errors = 0
+        for __output in __outputs:
+            for __cmd in range(len(__output.table)):
+                __output.write(__cmd)
+                __errors += sum(
+                    __bank.level(__pin) != __level for __pin, __level
+                    in zip(__output.out, __output.table[__cmd]))
+        results["fn.command_bank.errors"] = __errors
+        del __outputs
+        __bank.close()
+
+    results.update(bench_call(
+        "read_pressure", 20*BENCH_CALLS, SRS.read_pressure,
+        (Main.PIN_PT_IN,)))
+
+    # Buffered IIO ADC on the file-backed stand-in: host CPU per scan
+    # (both analog inputs) read in bulk, and read_pressure() through it.
+    with workdir():
+        __pins = [Main.PIN_LA_POT, Main.PIN_PT_IN]
+        __stand_in = Iio.IioStandIn(os.getcwd(), __pins)
+        __adc = Iio.BufferedADC(__pins, sysfs=__stand_in.sysfs,
+                                dev=__stand_in.dev)
+        __adc.setup()
+        __stand_in.append([(0.5, 0.5)]*BENCH_IIO_SCANS)
+        __cpu = time.process_time()
+        __scans = __adc.drain()
+        __cpu = time.process_time() - __cpu
+        results["fn.adc_block.cpu_us"] = 1e6*__cpu/max(__scans, 1)
+        __adc.install([SRS])
+        results.update(bench_call(
+            "read_pressure_buffered", 20*BENCH_CALLS, SRS.read_pressure,
+            (Main.PIN_PT_IN,)))
+        __adc.uninstall()
+        __adc.close()
+
+    # Pressure calibration: one reading (acquisition path) and a buffer
+    # of readings (per reading).
+    __calibration = Calibration.PressureCalibration(
+        temperature = Main.PT_WATER_TEMP)
+    results.update(bench_call(
+        "pressure_convert", 20*BENCH_CALLS, __calibration.convert,
+        (0.1234,), (0.5,), (0.9876,)))
+    __batch = [__n/float(BENCH_CAL_BATCH) for __n in range(BENCH_CAL_BATCH)]
+    __cpu = time.process_time()
+    for __i in range(BENCH_CALLS):
+        __calibration.convert_batch(__batch)
+    __cpu = time.process_time() - __cpu
+    results["fn.pressure_convert_batch.cpu_us"] = (
+        1e6*__cpu/(BENCH_CALLS*BENCH_CAL_BATCH))
+
+    with workdir():
+        SRS.setup_logfile(Main.PT_LOGFILE)
+        results.update(bench_call(
+            "log_pressure", 20*BENCH_CALLS, SRS.log_pressure,
+            (0.5, Main.PT_LOG_FREQ)))
+
+        # Compact log against the text log of the same samples (bytes per
+        # sample, lower is better), and its write cost.
+        __model = SIM.attach_pressure(Main.PIN_PT_IN)
+        __period = 1.0/Main.PT_LOG_FREQ
+        __samples = [(1.4e9 + __n*__period, round(__model(__n*__period), 4))
+                     for __n in range(BENCH_LOG_SAMPLES)]
+        __extras = (1, 2, 1, 1, 1, 1)
+        __text = sum(len("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(
+            time.strftime("%H:%M:%S", time.localtime(__t)), __value,
+            *__extras)) for __t, __value in __samples)
+        __writer = CompactLog.CompactLogWriter("bench.srsl")
+        __cpu = time.process_time()
+        for __t, __value in __samples:
+            __writer.add(__t, __value, __extras)
+        __writer.close()
+        __cpu = time.process_time() - __cpu
+        __size = (os.path.getsize("bench.srsl")
+                  + os.path.getsize("bench.srsl" + CompactLog.CL_INDEX_SUFFIX))
+        results["fn.log_compact.bytes"] = __size/float(BENCH_LOG_SAMPLES)
+        results["fn.log_text.bytes"] = __text/float(BENCH_LOG_SAMPLES)
+        results["fn.log_compact_write.cpu_us"] = 1e6*__cpu/BENCH_LOG_SAMPLES
+
+        # Rotation within a quota a fraction of the samples' size: bytes
+        # over the quota (0 when bounded).
+        __store = CompactLog.LogStore("bench", quota=BENCH_LOG_QUOTA,
+                                      file_size=BENCH_LOG_QUOTA//8, reserve=0)
+        for __n in range(4):
+            for __t, __value in __samples:
+                __store.add(__t + __n*BENCH_LOG_SAMPLES*__period, __value,
+                            __extras)
+        __store.close()
+        results["fn.log_quota.excess_bytes"] = max(
+            __store.usage() - BENCH_LOG_QUOTA, 0)
+
+    # Shared-memory telemetry records (without the writer process).
+    __ring = Telemetry.TelemetryRing(Main.PT_LOG_RING)
+    results.update(bench_call(
+        "telemetry_push", 20*BENCH_CALLS, __ring.push,
+        (0.0, 0.5, (0, 1, 2), (1, 1, 1))))
+    __ring.release()
+
+    return results
+
+def bench_pressure():
+    """Benchmark pressure acquisition: noise, rate regularity and CPU.
+
+    Noise is the RMS error against the noise-free transducer signal, for
+    single read_pressure() calls and for the oversampled sampler.
+    """
+    results = {}
+    setup_sim()
+    __model = SIM.attach_pressure(Main.PIN_PT_IN)
+
+    def __truth(t):
+        __noise = __model.noise
+        __model.noise = 0.0
+        __value = __model(t)
+        __model.noise = __noise
+        return __value
+
+    # Single (double) reads at the logging rate.
+    __errors = []
+    for __i in range(int(BENCH_PRESSURE_TIME*Main.PT_LOG_FREQ)):
+        __value = SRS.read_pressure(Main.PIN_PT_IN)
+        __errors.append(__value - __truth(SIM.clock.now))
+        SIM.clock.sleep(1.0/Main.PT_LOG_FREQ)
+    results["pressure.read.rms"] = (
+        sum(e*e for e in __errors)/len(__errors))**0.5
+
+    # Oversampled, fixed-rate acquisition.
+    __samples = []
+    __sampler = Pressure.PressureSampler(
+        Main.PIN_PT_IN, Main.PT_LOG_FREQ, Main.PT_OVERSAMPLE,
+        lambda t, value: __samples.append((t, value)))
+    __cpu = time.process_time()
+    __sampler.start()
+    SIM.clock.sleep(BENCH_PRESSURE_TIME)
+    __cpu = time.process_time() - __cpu
+    __sampler.stop()
+
+    __errors = [__v - __truth(__t) for __t, __v in __samples]
+    __gaps = [b[0] - a[0] for a, b in zip(__samples, __samples[1:])]
+    results["pressure.sampler.rms"] = (
+        sum(e*e for e in __errors)/len(__errors))**0.5
+    results["pressure.sampler.jitter_ms"] = 1e3*max(
+        abs(g - 1.0/Main.PT_LOG_FREQ) for g in __gaps)
+    results["pressure.sampler.cpu_us"] = 1e6*__cpu/len(__samples)
+
+    return results
+
+def bench_shoulder():
+    """Benchmark Shoulder jogging: top speed and soft end stop overrun.
+
+    main() runs with the Shoulder stick at full deflection for
+    BENCH_JOG_TIME (without end stops), then against the soft end stop.
+    """
+    results = {}
+
+    __step_pin = Main.PIN_SS_OUT[1]
+    # SS_LIMITS is changed in place (it is part of the channel table).
+    __limits = list(Main.SS_LIMITS)
+    Main.SS_LIMITS[:] = [-BENCH_JOG_TIME*360.0, BENCH_JOG_TIME*360.0]
+    try:
+        run_main(BENCH_STEP_TIME + BENCH_JOG_TIME,
+                 [(BENCH_STEP_TIME, Main.PIN_SS_IN, BENCH_WIDTH_MAX)])
+    finally:
+        Main.SS_LIMITS[:] = __limits
+    __steps = abs(SIM.steppers[__step_pin].position)
+    results["shoulder.jog.ms_per_deg"] = (
+        1e3*BENCH_JOG_TIME/(__steps*SRS.SS_STEP_ANGLE) if __steps else None)
+
+    __limit = Main.SS_LIMITS[1]/SRS.SS_STEP_ANGLE
+    run_main(BENCH_STEP_TIME + BENCH_LATENCY_MAX,
+             [(BENCH_STEP_TIME, Main.PIN_SS_IN, BENCH_WIDTH_MAX)])
+    results["shoulder.limit.overrun_steps"] = max(
+        SIM.steppers[__step_pin].position - __limit, 0.0)
+
+    return results
+
+def bench_channels():
+    """Benchmark the per-channel cost of a channel pipeline pass.
+
+    Each run drives that many simulated RC channels through one task of
+    a channel table (without actuators), stepping the simulated time
+    one task period between passes.
+    """
+    results = {}
+    __pwm = (Main.PWM_WID_FREQ, Main.PWM_WID_MAX,
+             Main.PWM_WID_MIN, Main.PWM_WID_TOL)
+
+    for __num in BENCH_CHANNEL_NUMS:
+        SIM.reset()
+        __table = []
+        for __n in range(__num):
+            __pin = "CH{}".format(__n)
+            SIM.attach_pwm(__pin, Main.PWM_WID_FREQ,
+                           (BENCH_WIDTH_MAX, BENCH_WIDTH_MID,
+                            BENCH_WIDTH_MIN)[__n % 3],
+                           phase=0.0001*__n, noise=BENCH_WIDTH_NOISE,
+                           seed=__n)
+            __table.append(["ch{}".format(__n), "bench", Main.LA_TASK_FREQ,
+                            __pin, [], SRS.LA_COMMANDS, __n % 2 == 0,
+                            True, ("none",)])
+        __capture = Capture.EdgeCapture(
+            [__row[3] for __row in __table], *__pwm,
+            window=Main.PWM_FILTER_NUM, trim=Main.PWM_TRIM_NUM)
+        __capture.start()
+        __channels = Channels.Channels(
+            __table, __capture, Main.POS_HIST_NUM)
+        __name, __freq, __indices = __channels.tasks()[0]
+        SIM.clock.sleep(0.1)
+
+        __cpu = 0.0
+        for __i in range(BENCH_CHANNEL_PASSES):
+            SIM.clock.sleep(1.0/__freq)
+            __start = time.process_time()
+            __channels.step(__indices)
+            __cpu += time.process_time() - __start
+        __capture.stop()
+
+        results["channels.{}.cpu_us_per_channel".format(__num)] = (
+            1e6*__cpu/(BENCH_CHANNEL_PASSES*__num))
+
+    return results
+
+BENCHMARKS = [
+    ("main", bench_main),
+    ("latency", bench_latency),
+    ("shoulder", bench_shoulder),
+    ("fn", bench_functions),
+    ("pressure", bench_pressure),
+    ("channels", bench_channels),
+    ]
+
+def compare(baseline, results, threshold, cpu_threshold):
+    """List the metrics which regressed against a baseline.
+
+    All metrics are "lower is better". A metric that no longer produces
+    a value (e.g. a latency that timed out) counts as a regression.
+
+    Returns:
+        regressions: A List of Strings describing each regression.
+    """
+    regressions = []
+
+    for __name in sorted(results):
+        __old = baseline.get(__name)
+        __new = results[__name]
+        __limit = cpu_threshold if "cpu" in __name else threshold
+        if __old is None:
+            continue
+        if __new is None:
+            regressions.append("{}: {:.3f} -> timeout".format(__name, __old))
+        elif __new > __old*(1 + __limit/100.0):
+            regressions.append("{}: {:.3f} -> {:.3f} (+{:.1f}%)".format(
+                __name, __old, __new, 100.0*(__new - __old)/max(__old, 1e-12)))
+
+    return regressions
+
+def main():
+    __parser = argparse.ArgumentParser(
+        description="Benchmark the ROV SRS control code on the simulator.")
+    __parser.add_argument("--only", action="append", default=[],
+        help="only run benchmarks with this name (repeatable)")
+    __parser.add_argument("--save", metavar="FILE",
+        help="save the results as JSON")
+    __parser.add_argument("--compare", metavar="FILE",
+        help="compare the results against a saved JSON baseline")
+    __parser.add_argument("--threshold", type=float, default=BENCH_THRESHOLD,
+        help="allowed regression of sim metrics [%%]")
+    __parser.add_argument("--cpu-threshold", type=float,
+        default=BENCH_CPU_THRESHOLD,
+        help="allowed regression of host CPU metrics [%%]")
+    __args = __parser.parse_args()
+
+    results = {}
+    for __name, __bench in BENCHMARKS:
+        if not __args.only or __name in __args.only:
+            results.update(__bench())
+
+    for __name in sorted(results):
+        __value = results[__name]
+        print("{:<36} {}".format(__name, "timeout" if __value is None
+                                 else "{:14.4f}".format(__value)))
+
+    if __args.save:
+        with open(__args.save, "w") as __f:
+            json.dump(results, __f, indent=2, sort_keys=True)
+
+    if __args.compare:
+        with open(__args.compare) as __f:
+            __baseline = json.load(__f)
+        __regressions = compare(
+            __baseline, results, __args.threshold, __args.cpu_threshold)
+        for __line in __regressions:
+            print("REGRESSION " + __line)
+        if __regressions:
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
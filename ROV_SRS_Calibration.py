@@ -0,0 +1,144 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Calibration
+#
+#
+# Overview: Pressure transducer calibration. The calibration points of
+#     the transducer (normalized ADC reading, pressure differential) are
+#     interpolated piecewise-linearly, corrected for temperature (zero
+#     and span shifts) and the zero offset, and precomputed into a lookup
+#     table spanning the ADC range with one entry per 12-bit code. A
+#     single reading then converts in constant time (one table index and
+#     one multiply-add), and whole buffers convert as vectorized NumPy
+#     operations (per sample without NumPy).
+#
+#     The temperature terms are applied when the table is built; call
+#     set_temperature() when the water temperature changes. With the
+#     default (identity) points and coefficients, readings convert to
+#     themselves, so logs keep their uncalibrated units until the
+#     transducer's calibration sheet is entered.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#
+# Constant Definitions.
+#
+
+# Transducer calibration: (normalized reading, pressure differential [psi]).
+# The identity table keeps the normalized reading, as read_pressure()
+# returned before calibration; enter the points of the transducer's
+# calibration sheet to log pressures in psi.
+PT_CAL_POINTS = [(0.0, 0.0),
+                 (1.0, 1.0)]
+PT_CAL_OFFSET = 0.0         # Zero offset (e.g. read at the surface) [psi].
+PT_CAL_ZERO_COEFF = 0.0     # Zero shift with temperature [psi/degC].
+PT_CAL_SPAN_COEFF = 0.0     # Span shift with temperature [%/degC].
+PT_CAL_TEMP_REF = 20.0      # Temperature of the calibration points [degC].
+PT_LUT_SIZE = 4095          # Table intervals over the ADC range (12-bit).
+
+class PressureCalibration(object):
+    """Lookup table conversion of normalized readings to pressure.
+
+    Attributes:
+        points:     The calibration points, sorted by reading.
+        temperature: The temperature the table is built for [degC].
+    """
+
+    def __init__(self, points=PT_CAL_POINTS, offset=PT_CAL_OFFSET,
+                 zero_coeff=PT_CAL_ZERO_COEFF, span_coeff=PT_CAL_SPAN_COEFF,
+                 temp_ref=PT_CAL_TEMP_REF, temperature=None,
+                 size=PT_LUT_SIZE):
+        """Build the lookup table.
+
+        Args:
+            points:     A List of (normalized reading, pressure [psi])
+                        calibration points; at least two readings.
+                        A point repeated exactly is merged; two
+                        pressures at one reading are rejected. Readings
+                        outside them are extrapolated from the end
+                        segments.
+            offset:     A Float specifying the zero offset [psi],
+                        subtracted from every pressure.
+            zero_coeff: A Float specifying the zero shift [psi/degC].
+            span_coeff: A Float specifying the span shift [%/degC].
+            temp_ref:   A Float specifying the temperature of the
+                        calibration points [degC].
+            temperature: A Float specifying the current temperature
+                        [degC], or None for temp_ref.
+            size:       An Integer specifying the number of table
+                        intervals over the normalized range 0.0 - 1.0.
+        """
+        self.points = sorted(set((float(x), float(p)) for x, p in points))
+        for (x0, p0), (x1, p1) in zip(self.points, self.points[1:]):
+            if x0 == x1:
+                raise ValueError("Two calibration pressures at reading "
+                                 "{}: {}, {}".format(x0, p0, p1))
+        if len(self.points) < 2:
+            raise ValueError("At least two calibration points are needed")
+        self.offset = offset
+        self.zero_coeff = zero_coeff
+        self.span_coeff = span_coeff
+        self.temp_ref = temp_ref
+        self.size = size
+        self.set_temperature(temp_ref if temperature is None
+                             else temperature)
+
+    def set_temperature(self, temperature):
+        """Rebuild the table for a new temperature [degC]."""
+        self.temperature = temperature
+        shift = temperature - self.temp_ref
+        gain = 1.0 + self.span_coeff*shift/100.0
+        zero = self.zero_coeff*shift - self.offset
+
+        table = [gain*self._interpolate(n/float(self.size)) + zero
+                 for n in range(self.size + 1)]
+        # Base and slope of each interval (readings beyond the range are
+        # extrapolated from the end intervals).
+        self._base = table[:-1]
+        self._slope = [table[n + 1] - table[n] for n in range(self.size)]
+        if np is not None:
+            self._base_array = np.array(self._base)
+            self._slope_array = np.array(self._slope)
+
+    def convert(self, value):
+        """Convert one normalized reading to pressure [psi]."""
+        x = value*self.size
+        index = int(x)
+        if index < 0:
+            index = 0
+        elif index >= self.size:
+            index = self.size - 1
+        return self._base[index] + self._slope[index]*(x - index)
+
+    def convert_batch(self, values):
+        """Convert a buffer of normalized readings to pressure [psi].
+
+        Args:
+            values:     A Sequence (or NumPy array) of readings.
+
+        Returns:
+            pressures:  A NumPy array of Floats (a List without NumPy).
+        """
+        if np is None:
+            return [self.convert(value) for value in values]
+        x = np.asarray(values, dtype=float)*self.size
+        index = np.clip(x.astype(np.intp), 0, self.size - 1)
+        return self._base_array[index] + self._slope_array[index]*(x - index)
+
+    def _interpolate(self, x):
+        points = self.points
+        for n in range(1, len(points) - 1):
+            if x < points[n][0]:
+                break
+        else:
+            n = len(points) - 1
+        (x0, p0), (x1, p1) = points[n - 1], points[n]
+        return p0 + (p1 - p0)*(x - x0)/(x1 - x0)
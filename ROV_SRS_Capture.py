@@ -0,0 +1,233 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Capture
+#
+#
+# Overview: Interrupt-driven Pulse Width capture for the RC Controller
+#     PWM inputs. Edge callbacks on every input pin timestamp the pulses
+#     into per-channel ring buffers, so the latest Pulse Width of every
+#     channel can be read without waiting on the signal.
+#
+#     Every Pulse also goes through the streaming filter of its channel
+#     (SRS.PulseFilter, a sliding-window trimmed mean) and is classified,
+#     so an updated filtered width and Position Command are ready after
+#     each Pulse, rather than after a block of Pulses.
+#
+#     A channel without a Pulse for SRS.PWM_LOSS_PERIODS signal periods
+#     (a receiver dropout, or a 0 or 100% Duty Cycle) is lost: its width
+#     reads as the hold Pulse Width until Pulses return. The Pulses from
+#     before a loss are then ignored, so the first new Pulse is used at
+#     once.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+from ROV_SRS_Hardware import GPIO
+from ROV_SRS_Hardware import clock
+import ROV_SRS_Library as SRS
+
+#
+# Constant Definitions.
+#
+
+CAP_RING_SIZE = 32          # Pulse Widths kept per channel (power of 2).
+CAP_POLL_TIME = 0.001       # Sleep between checks for new Pulses [sec].
+CAP_FILTER_NUM = 3          # Pulses in the sliding filter window.
+CAP_TRIM_NUM = 1            # Pulses trimmed from each end of the window.
+CAP_GLITCH_TIME = 100e-6    # Highs shorter than this are glitches, not
+                            # Pulses [sec].
+
+class EdgeCapture(object):
+    """Captures the Pulse Widths of several PWM input signals at once.
+
+    Edge callbacks are registered on every pin at the same time. On each
+    Falling Edge (told from a Rising Edge by the order of the edges),
+    the Pulse Width is corrected by the calibration of its channel (see
+    SRS.PwmChannel) and stored, along with the time it completed, in the
+    ring buffer of its channel; the filtered width and its Position
+    Command are updated. Readers never block on the signal itself.
+
+    Attributes:
+        pins:       A List of Strings specifying the input pin names.
+        channels:   A Dict of the SRS.PwmChannel calibration of each pin.
+        timeout:    The time without a Pulse after which a channel is
+                    lost [sec].
+        losses:     A Dict of the number of signal losses of each pin
+                    (counted when the signal returns).
+    """
+
+    def __init__(self, pins, freq, max, min, tol, size=CAP_RING_SIZE,
+                 learn=0, loss=SRS.PWM_LOSS_PERIODS, window=CAP_FILTER_NUM,
+                 trim=CAP_TRIM_NUM):
+        """Create the ring buffers for each pin.
+
+        Args:
+            pins:       A List of Strings specifying the pin names on
+                        which the PWM signals are expected.
+            freq:       A Float specifying the expected frequency
+                        of the PWM signals [Hz].
+            max:        A Float specifying the maximum expected
+                        duty cycle of the PWM signals [%].
+            min:        A Float specifying the minimum expected
+                        duty cycle of the PWM signals [%].
+            tol:        A Float specifying the acceptable tolerance
+                        on deviations in the measured Pulse Width [%].
+                        Refer to SRS.get_width() for further details.
+            size:       An Integer specifying the ring buffer length.
+                        Must be a power of 2.
+            learn:      An Integer specifying the number of Pulses each
+                        channel learns its Pulse Width range from at
+                        start-up (0 disables). Refer to SRS.PwmChannel.
+            loss:       A Float specifying the signal periods without a
+                        Pulse after which a channel is lost.
+            window:     An Integer specifying the Pulses in the filter
+                        window of each channel.
+            trim:       An Integer specifying the Pulses trimmed from
+                        each end of the filter window (refer to
+                        SRS.PulseFilter).
+        """
+        self.pins = list(pins)
+        self.channels = dict(
+            (pin, SRS.PwmChannel(freq, max, min, tol, learn))
+            for pin in self.pins)
+        self._mask = size - 1
+        self._rise = dict((pin, None) for pin in self.pins)
+        self._last = dict(self._rise)
+        self._widths = dict((pin, [0.0]*size) for pin in self.pins)
+        self._times = dict((pin, [0.0]*size) for pin in self.pins)
+        self._count = dict((pin, 0) for pin in self.pins)
+        self._seen = dict(self._count)
+        self.timeout = loss/float(freq)
+        self.losses = dict(self._count)
+        # Count of the first Pulse since the signal was (re)acquired.
+        self._since = dict(self._count)
+        self._filters = dict((pin, SRS.PulseFilter(window, trim))
+                             for pin in self.pins)
+        self._commands = dict((pin, 1) for pin in self.pins)
+
+    def start(self):
+        """Register the edge callbacks on every pin."""
+        for pin in self.pins:
+            GPIO.add_event_detect(pin, GPIO.BOTH, callback=self._edge)
+
+    def stop(self):
+        """Remove the edge callbacks from every pin."""
+        for pin in self.pins:
+            GPIO.remove_event_detect(pin)
+
+    def _edge(self, pin):
+        now = clock.monotonic()
+        last = self._last[pin]
+        self._last[pin] = now
+
+        # The edge direction follows from the order of the edges, not the
+        # pin level (read late if the callback is late): edges alternate,
+        # and an edge after longer than any Pulse is Rising (so a missed
+        # edge costs one Pulse).
+        channel = self.channels[pin]
+        rise = self._rise[pin]
+        if rise is None or now - last > channel.width_max + (
+                channel.width_tol):
+            self._rise[pin] = now
+            return
+        self._rise[pin] = None
+        if now - rise < CAP_GLITCH_TIME:
+            return
+
+        count = self._count[pin]
+        if count and now - self._times[pin][(count - 1) & self._mask] > (
+                self.timeout):
+            # Reacquired: ignore the Pulses from before the loss.
+            self._since[pin] = count
+            self.losses[pin] += 1
+            self._filters[pin].reset()
+
+        width = channel.correct(now - rise)
+        if channel.learning:
+            channel.learn(width)
+        self._commands[pin] = channel.classify(
+            self._filters[pin].update(width))
+
+        index = count & self._mask
+        self._widths[pin][index] = width
+        self._times[pin][index] = now
+        self._count[pin] = count + 1
+
+    def count(self, pin):
+        """Return the number of Pulses captured on a pin so far."""
+        return self._count[pin]
+
+    def latest(self, pin):
+        """Return the time [sec] and width [sec] of the newest Pulse.
+
+        Returns (None, 0.0) if no Pulse has been captured yet.
+        """
+        count = self._count[pin]
+        if count == 0:
+            return None, 0.0
+        index = (count - 1) & self._mask
+        return self._times[pin][index], self._widths[pin][index]
+
+    def lost(self, pin):
+        """Return True if the signal of a pin is lost (or not yet seen)."""
+        count = self._count[pin]
+        return count == 0 or clock.monotonic() - self._times[pin][
+            (count - 1) & self._mask] > self.timeout
+
+    def filtered(self, pin):
+        """Return the filtered width [sec] and Position Command of a pin.
+
+        Both are updated on every Pulse (see SRS.PulseFilter). While the
+        signal is lost, they are the hold Pulse Width and Command (1).
+        """
+        if self.lost(pin):
+            return self.channels[pin].width_hold, 1
+        return self._filters[pin].width, self._commands[pin]
+
+    def width(self, pin, size=1):
+        """Return the average width of the newest Pulses on a pin.
+
+        Args:
+            pin:        A String specifying the input pin name.
+            size:       An Integer specifying the number of Pulses to
+                        average. Fewer are used if fewer were captured
+                        since the signal was (re)acquired.
+
+        Returns:
+            width:      The average Pulse Width [sec], or the hold Pulse
+                        Width (see SRS.PwmChannel) if the signal is lost.
+        """
+        if self.lost(pin):
+            return self.channels[pin].width_hold
+        count = self._count[pin]
+        size = min(size, count - self._since[pin], self._mask + 1)
+
+        widths = self._widths[pin]
+        total = 0.0
+        for i in range(count - size, count):
+            total += widths[i & self._mask]
+        return total/size
+
+    def wait(self, timeout):
+        """Wait until every pin has a Pulse newer than the last wait.
+
+        Args:
+            timeout:    A Float specifying the longest time to wait [sec].
+
+        Returns:
+            fresh:      A Boolean, False if the timeout expired first.
+        """
+        deadline = clock.monotonic() + timeout
+        fresh = False
+
+        while True:
+            fresh = all(self._count[pin] != self._seen[pin]
+                        for pin in self.pins)
+            if fresh or clock.monotonic() >= deadline:
+                break
+            clock.sleep(CAP_POLL_TIME)
+
+        self._seen = dict(self._count)
+        return fresh
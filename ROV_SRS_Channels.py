@@ -0,0 +1,280 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Channels
+#
+#
+# Overview: Table-driven actuator channels for main(). Each row of a
+#     channel table declares one RC channel and the actuator it drives
+#     (see Channels); the state of every channel (calibration, trend
+#     filter, latest Position Command and trend, driver) is kept in
+#     arrays indexed by channel. The channels of one ROV_SRS_Scheduler
+#     task are processed in a single pass through the capture, classify,
+#     trend and actuate stages, so adding a channel (e.g. a second
+#     gripper arm) is a new table row rather than a new pipeline. A
+#     channel whose signal is lost (see ROV_SRS_Capture) skips the latch
+#     and trend stages and holds at once.
+#
+#     A hold forced by the deadline watchdog (Channels.hold()) lasts only
+#     while the pipeline is overdue: a move it cut short is resumed by
+#     the next pass, as a latched Command continues (1) rather than
+#     restarting it.
+#
+#     Actuator drivers are declared by a Tuple of a kind and its
+#     arguments (see make_driver()):
+#         ("linear", pot, stroke):    Linear Actuator position control.
+#         ("index", step_angle, rate_max, rate_min, accel, gripper):
+#                                     Stepper indexing to the next of
+#                                     gripper slots on a Command of 2.
+#         ("jog", step_angle, rate_max, rate_min, accel, limits):
+#                                     Stepper jogging at a rate
+#                                     proportional to the stick
+#                                     deflection, within soft end stops
+#                                     (limits, [degrees]).
+#         ("step",):                  One Shoulder step per pass
+#                                     (Motion.move_shoulder_async()).
+#         ("none",):                  No actuator (Commands only).
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+from collections import OrderedDict
+
+import ROV_SRS_Library as SRS
+import ROV_SRS_Motion as Motion
+
+class LinearDriver(object):
+    """Linear Actuator position control (Motion.LinearMotion)."""
+
+    def __init__(self, out, pot, stroke):
+        self.motion = Motion.LinearMotion(out, pot, stroke)
+        self._resume = None
+
+    def start(self):
+        self.motion.start()
+
+    def actuate(self, trend, width, pwm):
+        if self._resume is not None:
+            # Held mid-move: continue it, unless a new Command replaces it.
+            setpoint, self._resume = self._resume, None
+            if trend == 1:
+                self.motion.move_to(setpoint)
+                return
+        self.motion.command(trend)
+
+    def hold(self):
+        if self.motion.busy():
+            self._resume = self.motion.setpoint
+        self.motion.halt()
+
+class IndexDriver(object):
+    """Stepper indexing between gripper slots (Motion.StepperEngine)."""
+
+    def __init__(self, out, step_angle, rate_max, rate_min, accel, gripper):
+        self.stepper = Motion.StepperEngine(
+            out, step_angle, rate_max, rate_min, accel)
+        self.gripper = gripper
+        self._resume = None
+
+    def start(self):
+        self.stepper.start()
+
+    def actuate(self, trend, width, pwm):
+        if self._resume is not None:
+            # Held mid-index: finish it (then index on from there).
+            target, self._resume = self._resume, None
+            self.stepper.move_to(target)
+        if trend == 2:
+            self.stepper.index(self.gripper)
+
+    def hold(self):
+        if self.stepper.busy():
+            self._resume = self.stepper.target
+        self.stepper.halt()
+
+class JogDriver(object):
+    """Proportional stepper jogging (Motion.StepperEngine velocity mode)."""
+
+    def __init__(self, out, step_angle, rate_max, rate_min, accel, limits):
+        self.stepper = Motion.StepperEngine(
+            out, step_angle, rate_max, rate_min, accel,
+            [angle/step_angle for angle in limits])
+
+    def start(self):
+        self.stepper.start()
+
+    def actuate(self, trend, width, pwm):
+        # Stop on an invalid signal.
+        rate = pwm.deflection(width)
+        self.stepper.jog(0.0 if rate is None
+                         else rate*self.stepper.rate_max)
+
+    def hold(self):
+        self.stepper.halt()
+
+class StepDriver(object):
+    """One Shoulder step per pass (awaited by the pipeline)."""
+
+    def __init__(self, out):
+        self.out = list(out)
+
+    def start(self):
+        pass
+
+    def actuate(self, trend, width, pwm):
+        return Motion.move_shoulder_async(trend, self.out)
+
+    def hold(self):
+        pass
+
+class NullDriver(object):
+    """No actuator: the channel's Commands are only recorded."""
+
+    def __init__(self, out):
+        pass
+
+    def start(self):
+        pass
+
+    def actuate(self, trend, width, pwm):
+        pass
+
+    def hold(self):
+        pass
+
+_DRIVERS = {
+    "linear": LinearDriver,
+    "index": IndexDriver,
+    "jog": JogDriver,
+    "step": StepDriver,
+    "none": NullDriver,
+    }
+
+def make_driver(out, spec):
+    """Create the actuator driver declared by a driver Tuple.
+
+    Args:
+        out:        An Array of Strings specifying the output pin names.
+        spec:       A Tuple of the driver kind and its arguments (see
+                    the Overview).
+
+    Returns:
+        driver:     The driver (not yet started).
+    """
+    driver = _DRIVERS.get(spec[0])
+    if driver is None:
+        raise ValueError("Unknown actuator driver: {}".format(spec[0]))
+    return driver(out, *spec[1:])
+
+async def _await_all(pending):
+    for step in pending:
+        await step
+
+class Channels(object):
+    """The actuator channels of a channel table, in arrays by channel.
+
+    Each table row is: name, task name, task rate [Hz], input pin,
+    output pins, command table (e.g. SRS.LA_COMMANDS, row 1 holding),
+    continuous trends (see SRS.check_trend()), latch (a hold Command
+    keeps the last Command) and driver Tuple. Rows sharing a task name
+    are processed together by one step() at the rate of the first.
+
+    Attributes:
+        names:      The channel names.
+        pins:       The input pin names.
+        commands:   The latest Position Command of each channel.
+        trends:     The latest Command trend of each channel.
+        drivers:    The actuator driver of each channel.
+    """
+
+    def __init__(self, table, capture, size, release=1, dwell=0):
+        """Set up the state and drivers of every channel.
+
+        Args:
+            table:      A List of channel rows (see above).
+            capture:    The Capture.EdgeCapture of the input pins, which
+                        filters and classifies every Pulse.
+            size:       An Integer specifying the trend history length.
+            release:    Refer to SRS.TrendFilter.
+            dwell:      Refer to SRS.TrendFilter.
+        """
+        self.capture = capture
+        self.names = [row[0] for row in table]
+        self.pins = [row[3] for row in table]
+        self.outputs = [SRS.command_outputs(row[4], row[5]) for row in table]
+        self.pwms = [capture.channels[pin] for pin in self.pins]
+        self.filters = [SRS.TrendFilter(size, row[6], release, dwell)
+                        for row in table]
+        self.latch = [bool(row[7]) for row in table]
+        self.drivers = [make_driver(row[4], row[8]) for row in table]
+        self.commands = [1]*len(table)
+        self.trends = [1]*len(table)
+        self._tasks = OrderedDict()
+        for index, row in enumerate(table):
+            self._tasks.setdefault(row[1], (row[2], []))[1].append(index)
+
+    def tasks(self):
+        """Return the (name, rate [Hz], channel indices) of every task."""
+        return [(name, freq, indices)
+                for name, (freq, indices) in self._tasks.items()]
+
+    def start(self):
+        """Start every actuator driver."""
+        for driver in self.drivers:
+            driver.start()
+
+    def step(self, indices):
+        """Run one pass of the pipeline over some channels.
+
+        Args:
+            indices:    A List of the channel indices to process.
+
+        Returns:
+            pending:    None, or a coroutine to await when a driver has
+                        steps still to run (e.g. the "step" driver).
+        """
+        capture = self.capture
+        pending = None
+        for index in indices:
+            pin = self.pins[index]
+            pwm = self.pwms[index]
+            trend_filter = self.filters[index]
+            if capture.lost(pin):
+                # Signal lost: hold now, without a latched Command.
+                width = pwm.width_hold
+                cmd = 1
+                trend = trend_filter.reset()
+            else:
+                # Filtered Pulse Width and its Position Command (updated
+                # on every Pulse).
+                width, cmd = capture.filtered(pin)
+
+                # Add new Position Command to History.
+                if cmd == 1 and self.latch[index]:
+                    cmd = trend_filter.last
+
+                # Check for Position Command Persistance.
+                trend = trend_filter.update(cmd)
+            self.commands[index] = cmd
+            self.trends[index] = trend
+
+            # Process Position Command.
+            result = self.drivers[index].actuate(trend, width, pwm)
+            if result is not None:
+                if pending is None:
+                    pending = []
+                pending.append(result)
+
+        if pending is not None:
+            return _await_all(pending)
+        return None
+
+    def hold(self):
+        """Force every actuator to its hold command (see Watchdog).
+
+        A move cut short is resumed by the next step() (see the Overview).
+        """
+        for index, driver in enumerate(self.drivers):
+            driver.hold()
+            self.outputs[index].write(1)
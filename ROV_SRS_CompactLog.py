@@ -0,0 +1,588 @@
+#!/usr/bin/python
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_CompactLog
+#
+#
+# Overview: Compact binary pressure log with bounded disk use. Samples
+#     (time, pressure, and the LA, CS, SS Position Commands and trends)
+#     are stored as fixed-width records, delta encoded against the
+#     previous record, in zlib-compressed blocks each carrying a CRC-32.
+#     A sidecar index (LOG.idx) holds the time span and offset of every
+#     block, so any time range is read without decoding the rest of the
+#     file; a damaged block is skipped and counted, and a missing index
+#     is rebuilt by scanning the blocks.
+#
+#     LogStore rotates to a new file every CL_FILE_SIZE bytes and keeps
+#     the log files of a name within a quota, and the free space of the
+#     file system above a reserve (checked at each rotation). Over either
+#     limit, the oldest file is downsampled (rewritten at half its sample
+#     rate, pairs of samples averaged, one block in memory at a time)
+#     rather than logging being stopped; only files already at
+#     CL_LEVEL_MAX are deleted. A LogStore is also
+#     written like a text file of log lines (see LogStore.write()), so it
+#     can stand in for the file of SRS.setup_logfile().
+#
+#     File Format (little-endian):
+#         Header: magic (4s), version (H), downsample level (H), time
+#                 and value quanta (2d).
+#         Block:  magic (4s), record count (I), payload size (I),
+#                 payload CRC-32 (I), first and last time (2d) [Unix
+#                 time, sec], first value [value quanta] (q), then the
+#                 zlib-compressed records.
+#         Record: time step [time quanta] (I), value step [value quanta]
+#                 (i), LA, CS, SS Commands and trends (6b).
+#
+# Usage:    python ROV_SRS_CompactLog.py LOG [--from HH:MM:SS] [--to HH:MM:SS]
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import argparse
+from bisect import bisect_left
+from bisect import bisect_right
+from datetime import datetime
+import glob
+import os
+import shutil
+import struct
+import sys
+import time
+import zlib
+
+#
+# Constant Definitions.
+#
+
+CL_MAGIC = b"SRSL"          # File and block magic numbers.
+CL_BLOCK_MAGIC = b"SRSB"
+CL_VERSION = 1
+CL_SUFFIX = ".srsl"         # Log file and index suffixes.
+CL_INDEX_SUFFIX = ".idx"
+
+CL_BLOCK_RECORDS = 1024     # Records per compressed block.
+CL_BLOCK_MIN = 128          # Fewest records per block at the end of a
+                            # rotated file.
+CL_FLUSH_TIME = 30.0        # Longest time span of a block [sec].
+CL_TIME_QUANTUM = 1e-6      # Time resolution [sec].
+CL_VALUE_QUANTUM = 1e-5     # Value resolution [value units].
+CL_COMPRESSION = 6          # zlib compression level.
+
+CL_FILE_SIZE = 4*1024*1024      # Rotation size of a log file [bytes].
+CL_QUOTA = 256*1024*1024        # Disk use of the log files of a name [bytes].
+CL_RESERVE = 64*1024*1024       # Free space kept on the file system [bytes].
+CL_LEVEL_MAX = 64               # Deepest downsampling before deleting.
+CL_DAY = 86400.0                # Length of a day [sec].
+
+_HEADER = struct.Struct("<4sHHdd")
+_BLOCK = struct.Struct("<4sIIIddq")
+_RECORD = struct.Struct("<Ii6b")
+_ENTRY = struct.Struct("<ddQI")
+_NO_EXTRAS = (0, 0, 0, 0, 0, 0)
+
+class CompactLogWriter(object):
+    """Appends samples to a compact log file (see the Overview).
+
+    Attributes:
+        path:       The log file path.
+        level:      The downsample level of the file (1 = full rate).
+        records:    The number of samples written so far.
+    """
+
+    def __init__(self, path, level=1, time_quantum=CL_TIME_QUANTUM,
+                 value_quantum=CL_VALUE_QUANTUM,
+                 block_records=CL_BLOCK_RECORDS, flush_time=CL_FLUSH_TIME):
+        """Create the log file and its index (replacing any old ones).
+
+        A block is written once it holds block_records samples or spans
+        flush_time [sec], whichever comes first (so at most flush_time of
+        samples is lost if the process dies).
+        """
+        self.path = path
+        self.level = level
+        self.records = 0
+        self._time_quantum = time_quantum
+        self._value_quantum = value_quantum
+        self._block_records = block_records
+        self._flush_time = flush_time
+        self._block = bytearray(block_records*_RECORD.size)
+        self._count = 0
+        self._first = None
+        self._last = None
+        self._file = open(path, "wb")
+        self._index = open(path + CL_INDEX_SUFFIX, "wb")
+        self._file.write(_HEADER.pack(CL_MAGIC, CL_VERSION, level,
+                                      time_quantum, value_quantum))
+        self._size = _HEADER.size
+
+    def add(self, t, value, extras=_NO_EXTRAS):
+        """Append one sample.
+
+        Args:
+            t:          The sample time [Unix time, sec], not before the
+                        previous sample.
+            value:      The sample value (e.g. pressure [psi]).
+            extras:     The 6 Position Commands and trends (LA, CS, SS),
+                        or zeros.
+        """
+        tick = int(round(t/self._time_quantum))
+        quanta = int(round(value/self._value_quantum))
+        if self._count == 0:
+            self._first = (t, tick, quanta)
+            step, delta = 0, 0
+        else:
+            step = tick - self._last[0]
+            delta = quanta - self._last[1]
+            if not (0 <= step <= 0xFFFFFFFF
+                    and -0x80000000 <= delta <= 0x7FFFFFFF):
+                # Out of range of a step: start a new block here.
+                self.flush()
+                self.add(t, value, extras)
+                return
+        _RECORD.pack_into(self._block, self._count*_RECORD.size,
+                          step, delta, *extras)
+        self._last = (tick, quanta, t)
+        self._count += 1
+        self.records += 1
+        if (self._count == self._block_records
+                or t - self._first[0] >= self._flush_time):
+            self.flush()
+
+    def flush(self):
+        """Write the pending samples as a block (and index them)."""
+        if self._count == 0:
+            return
+        payload = zlib.compress(
+            bytes(self._block[:self._count*_RECORD.size]), CL_COMPRESSION)
+        t_first, tick, quanta = self._first
+        self._file.write(_BLOCK.pack(
+            CL_BLOCK_MAGIC, self._count, len(payload), zlib.crc32(payload),
+            t_first, self._last[2], quanta) + payload)
+        self._file.flush()
+        self._index.write(_ENTRY.pack(t_first, self._last[2], self._size,
+                                      self._count))
+        self._index.flush()
+        self._size += _BLOCK.size + len(payload)
+        self._count = 0
+
+    def size(self):
+        """Return the bytes written to the file and index so far."""
+        return self._size + self._index.tell()
+
+    def pending(self, count=None):
+        """Return the most bytes a block of pending samples can take.
+
+        Args:
+            count:      The number of samples, or None for those pending.
+        """
+        size = (self._count if count is None else count)*_RECORD.size
+        # zlib's worst case (deflateBound()) plus the headers.
+        return _BLOCK.size + _ENTRY.size + size + size//1024 + 16
+
+    def close(self):
+        """Write the pending samples and close the files."""
+        self.flush()
+        self._file.close()
+        self._index.close()
+
+class CompactLogReader(object):
+    """Random access to the samples of a compact log file.
+
+    Attributes:
+        path:       The log file path.
+        level:      The downsample level of the file (1 = full rate).
+        blocks:     A List of the (first time, last time, offset, count)
+                    of every block.
+        errors:     The number of damaged blocks skipped so far.
+    """
+
+    def __init__(self, path):
+        """Read the header and the index (rebuilt if missing or stale).
+
+        Raises:
+            ValueError: The file is not a compact log.
+        """
+        self.path = path
+        self.errors = 0
+        with open(path, "rb") as log:
+            header = log.read(_HEADER.size)
+        if len(header) < _HEADER.size or header[:4] != CL_MAGIC:
+            raise ValueError("Not a compact log: {}".format(path))
+        (magic, version, self.level, self._time_quantum,
+         self._value_quantum) = _HEADER.unpack(header)
+        self.blocks = self._load_index()
+        self._starts = [block[0] for block in self.blocks]
+        self._ends = [block[1] for block in self.blocks]
+
+    def count(self):
+        """Return the number of samples in the file."""
+        return sum(block[3] for block in self.blocks)
+
+    def span(self):
+        """Return the first and last sample times, or (None, None)."""
+        if not self.blocks:
+            return None, None
+        return self.blocks[0][0], self.blocks[-1][1]
+
+    def read(self, start=None, end=None):
+        """Return the samples between two times (inclusive).
+
+        Args:
+            start:      The earliest time [Unix time, sec], or None.
+            end:        The latest time [Unix time, sec], or None.
+
+        Returns:
+            times:      A List of the sample times [Unix time, sec].
+            values:     A List of the sample values.
+            extras:     A List of the 6-Tuples of Commands and trends.
+        """
+        times = []
+        values = []
+        extras = []
+        for block in self.read_blocks(start, end):
+            times.extend(block[0])
+            values.extend(block[1])
+            extras.extend(block[2])
+        return times, values, extras
+
+    def read_blocks(self, start=None, end=None):
+        """Generate the samples between two times, one block at a time.
+
+        Only one decoded block is held in memory at once; damaged blocks
+        are skipped (refer to read()).
+
+        Yields:
+            times:      A List of the sample times of a block.
+            values:     A List of the sample values of a block.
+            extras:     A List of the 6-Tuples of a block.
+        """
+        first = 0 if start is None else bisect_left(self._ends, start)
+        last = (len(self.blocks) if end is None
+                else bisect_right(self._starts, end))
+        with open(self.path, "rb") as log:
+            for block in self.blocks[first:last]:
+                decoded = self._decode(log, block[2])
+                if decoded is None:
+                    self.errors += 1
+                    continue
+                times, values, extras = decoded
+                if not times or ((start is None or times[0] >= start)
+                                 and (end is None or times[-1] <= end)):
+                    yield decoded
+                    continue
+                keep = [n for n, t in enumerate(times)
+                        if ((start is None or t >= start)
+                            and (end is None or t <= end))]
+                yield ([times[n] for n in keep], [values[n] for n in keep],
+                       [extras[n] for n in keep])
+
+    def _decode(self, log, offset):
+        log.seek(offset)
+        header = log.read(_BLOCK.size)
+        if len(header) < _BLOCK.size:
+            return None
+        magic, count, size, crc, t_first, t_last, quanta = _BLOCK.unpack(
+            header)
+        payload = log.read(size)
+        if (magic != CL_BLOCK_MAGIC or len(payload) < size
+                or zlib.crc32(payload) != crc):
+            return None
+        try:
+            records = zlib.decompress(payload)
+        except zlib.error:
+            return None
+        if len(records) != count*_RECORD.size:
+            return None
+
+        tick = int(round(t_first/self._time_quantum))
+        times = []
+        values = []
+        extras = []
+        for record in _RECORD.iter_unpack(records):
+            tick += record[0]
+            quanta += record[1]
+            times.append(tick*self._time_quantum)
+            values.append(quanta*self._value_quantum)
+            extras.append(record[2:])
+        return times, values, extras
+
+    def _load_index(self):
+        size = os.path.getsize(self.path)
+        try:
+            with open(self.path + CL_INDEX_SUFFIX, "rb") as index:
+                data = index.read()
+            blocks = [entry for entry in _ENTRY.iter_unpack(
+                data[:len(data) - len(data) % _ENTRY.size])]
+        except OSError:
+            blocks = []
+        if blocks and blocks[-1][2] < size:
+            # The index ends with a block of this file: trust it, but
+            # pick up blocks written after its last entry.
+            offset = blocks[-1][2]
+            with open(self.path, "rb") as log:
+                log.seek(offset)
+                header = log.read(_BLOCK.size)
+            if len(header) == _BLOCK.size:
+                offset += _BLOCK.size + _BLOCK.unpack(header)[2]
+                return blocks + self._scan(offset)
+        return self._scan(_HEADER.size)
+
+    def _scan(self, offset):
+        # Rebuild index entries by walking the block headers.
+        blocks = []
+        with open(self.path, "rb") as log:
+            while True:
+                log.seek(offset)
+                header = log.read(_BLOCK.size)
+                if len(header) < _BLOCK.size:
+                    return blocks
+                magic, count, size, crc, t_first, t_last, quanta = (
+                    _BLOCK.unpack(header))
+                if magic != CL_BLOCK_MAGIC:
+                    return blocks
+                blocks.append((t_first, t_last, offset, count))
+                offset += _BLOCK.size + size
+
+def downsample(path, factor=2):
+    """Rewrite a compact log at a lower sample rate, in place.
+
+    Each run of factor samples is replaced by one: the first time, the
+    mean value and the last Commands and trends.
+
+    Returns:
+        saved:      The number of bytes freed.
+    """
+    before = _size(path)
+    reader = CompactLogReader(path)
+    temp = path + ".tmp"
+    writer = CompactLogWriter(temp, reader.level*factor,
+                              reader._time_quantum, reader._value_quantum,
+                              flush_time=float("inf"))
+    # Runs carry over from one block to the next, so the file is
+    # streamed a block at a time rather than read whole.
+    group = []
+    for times, values, extras in reader.read_blocks():
+        for t, value, extra in zip(times, values, extras):
+            if not group:
+                first = t
+            group.append(value)
+            if len(group) == factor:
+                writer.add(first, sum(group)/factor, extra)
+                group = []
+    if group:
+        writer.add(first, sum(group)/len(group), extra)
+    writer.close()
+    os.replace(temp + CL_INDEX_SUFFIX, path + CL_INDEX_SUFFIX)
+    os.replace(temp, path)
+    return before - _size(path)
+
+def _size(path):
+    size = 0
+    for part in (path, path + CL_INDEX_SUFFIX):
+        try:
+            size += os.path.getsize(part)
+        except OSError:
+            pass
+    return size
+
+class LogStore(object):
+    """Rotating compact log files within a disk quota (see the Overview).
+
+    Attributes:
+        path:       The current log file path.
+        downsampled: The number of file downsamplings done.
+        deleted:    The number of files deleted.
+        malformed:  The number of malformed lines passed to write().
+    """
+
+    def __init__(self, name, directory=".", quota=CL_QUOTA,
+                 file_size=CL_FILE_SIZE, reserve=CL_RESERVE):
+        """Start a new log file.
+
+        Args:
+            name:       A String specifying the log name. Each file is
+                        named after its start date and time, then name.
+            directory:  A String specifying the log directory.
+            quota:      An Integer specifying the largest disk use of
+                        all the log files of name [bytes].
+            file_size:  An Integer specifying the rotation size [bytes].
+            reserve:    An Integer specifying the free space to keep on
+                        the file system [bytes].
+        """
+        self.name = name
+        self.directory = directory
+        self.quota = quota
+        self.file_size = file_size
+        self.reserve = reserve
+        self.downsampled = 0
+        self.deleted = 0
+        self.malformed = 0
+        self.path = None
+        self._partial = ""
+        self._day = None
+        self._writer = None
+        self._sequence = 0
+        self._rotate()
+
+    def add(self, t, value, extras=_NO_EXTRAS):
+        """Append one sample (refer to CompactLogWriter.add()).
+
+        The pending block is written early rather than let the file grow
+        past file_size, and the file is rotated once a block of
+        CL_BLOCK_MIN samples might not fit.
+        """
+        writer = self._writer
+        writer.add(t, value, extras)
+        if writer.size() + writer.pending() >= self.file_size:
+            writer.flush()
+            if (writer.size() + writer.pending(CL_BLOCK_MIN)
+                    >= self.file_size):
+                self._rotate()
+
+    def write(self, text):
+        """Append log lines, as written to a text log.
+
+        Lines are "HH:MM:SS[.ffffff]<TAB>value", optionally followed by
+        the 6 Commands and trends. A line left incomplete is kept until
+        its end is written. Times of day are taken on the day nearest to
+        now, so a log runs on across midnight. Malformed lines are
+        counted and skipped.
+
+        Args:
+            text:       A String of log lines.
+        """
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        now = time.time()
+        for line in lines:
+            fields = line.split("\t")
+            try:
+                t = self._date(fields[0], now)
+                value = float(fields[1])
+                extras = (tuple(int(field) for field in fields[2:8])
+                          if len(fields) >= 8 else _NO_EXTRAS)
+            except (ValueError, IndexError):
+                self.malformed += 1
+                continue
+            self.add(t, value, extras)
+
+    def flush(self):
+        """Write the pending samples of the current file."""
+        self._writer.flush()
+
+    def close(self):
+        """Close the current file."""
+        self._writer.close()
+
+    def files(self):
+        """Return the log files of the name, oldest first."""
+        return sorted(glob.glob(os.path.join(
+            glob.escape(self.directory), "*_" + glob.escape(self.name)
+            + "*" + CL_SUFFIX)))
+
+    def usage(self):
+        """Return the disk use of the log files of the name [bytes]."""
+        return sum(_size(path) for path in self.files())
+
+    def enforce(self):
+        """Downsample or delete old files until within the limits.
+
+        Room is kept for the current file to reach file_size, so the disk
+        use never exceeds quota.
+        """
+        usage = self.usage()
+        while usage + self.file_size > self.quota or (
+                shutil.disk_usage(self.directory).free < self.reserve):
+            old = [path for path in self.files() if path != self.path]
+            if not old:
+                return
+            for path in old:
+                if CompactLogReader(path).level < CL_LEVEL_MAX:
+                    saved = downsample(path)
+                    self.downsampled += 1
+                    if saved <= 0:
+                        # Too few samples left to shrink: delete it.
+                        saved = self._delete(path)
+                    break
+            else:
+                saved = self._delete(old[0])
+            usage -= saved
+
+    def _delete(self, path):
+        saved = _size(path)
+        for part in (path, path + CL_INDEX_SUFFIX):
+            if os.path.exists(part):
+                os.remove(part)
+        self.deleted += 1
+        return saved
+
+    def _date(self, stamp, now):
+        # Midnight of the current day, recomputed once a day.
+        if self._day is None or not 0.0 <= now - self._day < CL_DAY:
+            self._day = time.mktime(datetime.fromtimestamp(now).replace(
+                hour=0, minute=0, second=0, microsecond=0).timetuple())
+        t = _time_of_day(stamp, self._day)
+        if t - now > CL_DAY/2:
+            t -= CL_DAY
+        elif now - t > CL_DAY/2:
+            t += CL_DAY
+        return t
+
+    def _rotate(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._sequence += 1
+        self.path = os.path.join(self.directory, "{}-{:03d}_{}{}".format(
+            datetime.now().strftime("%Y-%m-%d_%H%M%S"), self._sequence,
+            self.name, CL_SUFFIX))
+        self._writer = CompactLogWriter(self.path)
+        self.enforce()
+
+def is_compact(path):
+    """Return True if a file is a compact log."""
+    try:
+        with open(path, "rb") as log:
+            return log.read(len(CL_MAGIC)) == CL_MAGIC
+    except OSError:
+        return False
+
+def _time_of_day(text, day):
+    hours, minutes, seconds = (float(part) for part in text.split(":"))
+    return day + 3600*hours + 60*minutes + seconds
+
+def main():
+    __parser = argparse.ArgumentParser(
+        description="Print a compact ROV SRS pressure log as text.")
+    __parser.add_argument("log", help="compact log file")
+    __parser.add_argument("--from", dest="start", metavar="HH:MM:SS",
+        help="first time of day to print")
+    __parser.add_argument("--to", dest="end", metavar="HH:MM:SS",
+        help="last time of day to print")
+    __args = __parser.parse_args()
+
+    __reader = CompactLogReader(__args.log)
+    __first, __last = __reader.span()
+    if __first is None:
+        return 0
+    __day = time.mktime(datetime.fromtimestamp(__first).replace(
+        hour=0, minute=0, second=0, microsecond=0).timetuple())
+    __start = None if __args.start is None else _time_of_day(
+        __args.start, __day)
+    __end = None if __args.end is None else _time_of_day(__args.end, __day)
+
+    __times, __values, __extras = __reader.read(__start, __end)
+    __lines = []
+    for __t, __value, __extra in zip(__times, __values, __extras):
+        __lines.append("{}{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(
+            time.strftime("%H:%M:%S", time.localtime(__t)),
+            "{:.6f}".format(__t % 1.0)[1:], round(__value, 5), *__extra))
+    sys.stdout.write("".join(__lines))
+    if __reader.errors:
+        sys.stderr.write("{} damaged block(s) skipped\n".format(
+            __reader.errors))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
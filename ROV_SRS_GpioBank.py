@@ -0,0 +1,214 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_GpioBank
+#
+#
+# Overview: Output backend writing the AM335x GPIO bank registers
+#     directly through a memory map of /dev/mem. Command tables (e.g.
+#     LA_COMMANDS) are precompiled per actuator into one CLEARDATAOUT and
+#     one SETDATAOUT mask per bank, so a whole command pattern (e.g.
+#     DIR + STEP) is output in one or two register writes rather than
+#     one GPIO.output() call per pin. Pins must still be set up (muxed
+#     and made outputs) with GPIO.setup(); inputs are unaffected.
+#
+#     install() makes the SRS library and motion code use the bank for
+#     every command output (see SRS.command_outputs()). Output changes
+#     written this way bypass the GPIO module, so they are not seen by
+#     ROV_SRS_Trace or the simulator.
+#
+#     A regular file may be given in place of /dev/mem: the banks are
+#     then laid out one after another from the start of the file, and
+#     the DATAOUT register is updated from the SET/CLEAR writes as the
+#     hardware would, so outputs can be read back and timed on any Linux
+#     machine.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import mmap
+import os
+import stat
+
+import ROV_SRS_Library as SRS
+
+#
+# Constant Definitions.
+#
+
+GPIO_BANK_BASES = (0x44E07000,  # GPIO0 to GPIO3 register base addresses.
+                   0x4804C000,
+                   0x481AC000,
+                   0x481AE000)
+GPIO_BANK_SIZE = 0x1000         # Register space of one bank [bytes].
+GPIO_BANK_PINS = 32             # GPIO lines per bank.
+
+# Register offsets [bytes].
+GPIO_OE = 0x134                 # Output enable (0 = output).
+GPIO_DATAOUT = 0x13C            # Output levels.
+GPIO_CLEARDATAOUT = 0x190       # Write 1s to clear output bits.
+GPIO_SETDATAOUT = 0x194         # Write 1s to set output bits.
+
+# BeagleBone Black header pin to GPIO line (bank*32 + bit).
+GPIO_LINES = {
+    "P8_3": 38, "P8_4": 39, "P8_5": 34, "P8_6": 35, "P8_7": 66,
+    "P8_8": 67, "P8_9": 69, "P8_10": 68, "P8_11": 45, "P8_12": 44,
+    "P8_13": 23, "P8_14": 26, "P8_15": 47, "P8_16": 46, "P8_17": 27,
+    "P8_18": 65, "P8_19": 22, "P8_20": 63, "P8_21": 62, "P8_22": 37,
+    "P8_23": 36, "P8_24": 33, "P8_25": 32, "P8_26": 61, "P8_27": 86,
+    "P8_28": 88, "P8_29": 87, "P8_30": 89, "P8_31": 10, "P8_32": 11,
+    "P8_33": 9, "P8_34": 81, "P8_35": 8, "P8_36": 80, "P8_37": 78,
+    "P8_38": 79, "P8_39": 76, "P8_40": 77, "P8_41": 74, "P8_42": 75,
+    "P8_43": 72, "P8_44": 73, "P8_45": 70, "P8_46": 71,
+    "P9_11": 30, "P9_12": 60, "P9_13": 31, "P9_14": 50, "P9_15": 48,
+    "P9_16": 51, "P9_17": 5, "P9_18": 4, "P9_21": 3, "P9_22": 2,
+    "P9_23": 49, "P9_24": 15, "P9_25": 117, "P9_26": 14, "P9_27": 115,
+    "P9_28": 113, "P9_29": 111, "P9_30": 112, "P9_31": 110,
+    "P9_41": 20, "P9_42": 7,
+    }
+
+def bank_bit(pin):
+    """Return the bank number and bit of a header pin.
+
+    Raises:
+        ValueError: The pin is not a GPIO pin.
+    """
+    line = GPIO_LINES.get(pin)
+    if line is None:
+        raise ValueError("Not a GPIO pin: {}".format(pin))
+    return divmod(line, GPIO_BANK_PINS)
+
+class GpioBanks(object):
+    """Memory map of the four GPIO banks.
+
+    Attributes:
+        path:       The mapped device (or file) path.
+        emulated:   True if path is a regular file (see the Overview).
+    """
+
+    def __init__(self, path="/dev/mem"):
+        """Map the banks.
+
+        Args:
+            path:       A String specifying /dev/mem, or a regular file
+                        standing in for it (created or extended to hold
+                        the four banks).
+        """
+        self.path = path
+        self.emulated = not (os.path.exists(path)
+                             and stat.S_ISCHR(os.stat(path).st_mode))
+        if self.emulated:
+            bases = [n*GPIO_BANK_SIZE for n in range(len(GPIO_BANK_BASES))]
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if os.fstat(fd).st_size < bases[-1] + GPIO_BANK_SIZE:
+                os.ftruncate(fd, bases[-1] + GPIO_BANK_SIZE)
+        else:
+            bases = GPIO_BANK_BASES
+            fd = os.open(path, os.O_RDWR | os.O_SYNC)
+
+        try:
+            self._maps = [mmap.mmap(fd, GPIO_BANK_SIZE, mmap.MAP_SHARED,
+                                    mmap.PROT_READ | mmap.PROT_WRITE,
+                                    offset=base)
+                          for base in bases]
+        finally:
+            os.close(fd)
+        # 32-bit register views, indexed by offset/4.
+        self.registers = [memoryview(bank).cast("I") for bank in self._maps]
+
+    def close(self):
+        """Unmap the banks (uninstall() first if installed)."""
+        for registers in self.registers:
+            registers.release()
+        self.registers = []
+        for bank in self._maps:
+            bank.close()
+        self._maps = []
+
+    def install(self):
+        """Output every SRS command table through the banks from now on.
+
+        Command outputs created earlier keep using GPIO.output().
+        """
+        SRS.output_bank = self
+        SRS._outputs.clear()
+
+    def uninstall(self):
+        """Return to GPIO.output() for new command outputs."""
+        if SRS.output_bank is self:
+            SRS.output_bank = None
+            SRS._outputs.clear()
+
+    def command_outputs(self, out, table):
+        """Return the BankOutputs of pins and a command table."""
+        return BankOutputs(self, out, table)
+
+    def output(self, pin, value):
+        """Set one output pin (GPIO.output() equivalent)."""
+        bank, bit = bank_bit(pin)
+        self.write(bank, GPIO_SETDATAOUT if value else GPIO_CLEARDATAOUT,
+                   1 << bit)
+
+    def level(self, pin):
+        """Return the output level of a pin (from DATAOUT)."""
+        bank, bit = bank_bit(pin)
+        return (self.registers[bank][GPIO_DATAOUT//4] >> bit) & 1
+
+    def write(self, bank, offset, mask):
+        """Write a SET or CLEAR mask to one bank."""
+        registers = self.registers[bank]
+        registers[offset//4] = mask
+        if self.emulated:
+            self._emulate(registers, offset, mask)
+
+    def _emulate(self, registers, offset, mask):
+        # The hardware applies SET/CLEAR writes to DATAOUT.
+        if offset == GPIO_SETDATAOUT:
+            registers[GPIO_DATAOUT//4] |= mask
+        elif offset == GPIO_CLEARDATAOUT:
+            registers[GPIO_DATAOUT//4] &= ~mask & 0xFFFFFFFF
+
+class BankOutputs(object):
+    """A command table precompiled into GPIO bank register writes.
+
+    Same interface as SRS.CommandOutputs. Each row becomes a CLEAR then
+    a SET write per bank used (clearing first, so an H-bridge is never
+    driven both ways at once within a bank).
+
+    Attributes:
+        out:        The output pin names.
+        table:      The command table (rows of levels, one per pin).
+    """
+
+    def __init__(self, banks, out, table):
+        self.out = list(out)
+        self.table = [list(row) for row in table]
+        self._banks = banks
+        self._writes = [self._compile(row) for row in self.table]
+
+    def _compile(self, row):
+        clear = {}
+        set_ = {}
+        for pin, level in zip(self.out, row):
+            bank, bit = bank_bit(pin)
+            masks = set_ if level else clear
+            masks[bank] = masks.get(bank, 0) | (1 << bit)
+
+        writes = []
+        for offset, masks in ((GPIO_CLEARDATAOUT, clear),
+                              (GPIO_SETDATAOUT, set_)):
+            for bank in sorted(masks):
+                writes.append((self._banks.registers[bank], offset//4,
+                               masks[bank]))
+        return writes
+
+    def write(self, cmd):
+        """Drive every pin to row cmd of the table."""
+        if self._banks.emulated:
+            for registers, index, mask in self._writes[cmd]:
+                registers[index] = mask
+                self._banks._emulate(registers, index*4, mask)
+            return
+        for registers, index, mask in self._writes[cmd]:
+            registers[index] = mask
@@ -0,0 +1,76 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Hardware
+#
+#
+# Overview: Selects the hardware backend (GPIO, ADC and clock) used by
+#     the ROV SRS scripts. The backend is chosen at import time from the
+#     ROV_SRS_BACKEND environment variable:
+#         bbio:   Adafruit_BBIO on the BeagleBone Black (default).
+#         sim:    The virtual-clock simulator in ROV_SRS_Sim.
+#
+#     Background tasks (step generators, samplers, ...) are run through
+#     Worker, which uses a thread on the hardware and the virtual clock
+#     in the simulator. Likewise, new_event_loop() returns an asyncio
+#     event loop running on the backend's clock.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import asyncio
+import os
+import threading
+
+#
+# Constant Definitions.
+#
+
+HW_BACKEND = os.environ.get("ROV_SRS_BACKEND", "bbio")
+
+class _ThreadWorker(object):
+    """Runs a background task in a daemon thread.
+
+    The task is a generator function. Each value it yields is the time
+    to sleep [sec] before it is resumed; returning ends the task.
+    """
+
+    def __init__(self, target, name=None):
+        self._target = target
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive() and (
+                self._thread is not threading.current_thread()):
+            self._thread.join()
+
+    def alive(self):
+        return self._thread.is_alive()
+
+    def _run(self):
+        for delay in self._target():
+            if self._stop.wait(delay):
+                break
+
+if HW_BACKEND == "bbio":
+    from Adafruit_BBIO import ADC
+    from Adafruit_BBIO import GPIO
+    import time as clock
+    Worker = _ThreadWorker
+    new_event_loop = asyncio.new_event_loop
+elif HW_BACKEND == "sim":
+    from ROV_SRS_Sim import ADC
+    from ROV_SRS_Sim import GPIO
+    from ROV_SRS_Sim import Worker
+    from ROV_SRS_Sim import clock
+    from ROV_SRS_Sim import new_event_loop
+else:
+    raise ImportError(
+        "Unknown ROV SRS hardware backend: {}".format(HW_BACKEND))
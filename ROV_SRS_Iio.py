@@ -0,0 +1,268 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Iio
+#
+#
+# Overview: Buffered (continuous mode) ADC acquisition through the Linux
+#     IIO interface of the BeagleBone's TI AM335x ADC. The channels are
+#     enabled once and the ADC converts them continuously into the
+#     kernel buffer; samples are then read in blocks of whole scans (one
+#     sample of every enabled channel) into a preallocated array, instead
+#     of one sysfs read per sample.
+#
+#     BufferedADC offers the read()/read_raw() calls of the ADC module,
+#     and install() puts it in place of the ADC module of the SRS
+#     modules. Every read returns the newest conversion, so the double
+#     read workaround of Adafruit_BBIO is not needed (fresh is True).
+#     Until the first scan has been read there is no conversion, and
+#     read() returns None rather than a made-up value. Each channel also
+#     accumulates every sample read, for consumers which average
+#     (take()).
+#
+#     IioStandIn builds the sysfs attributes and a sample file in a
+#     directory, so the reader can be run and timed on any machine:
+#     append() writes scans which the reader then reads back as it would
+#     from the character device.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+from array import array
+import os
+import threading
+
+#
+# Constant Definitions.
+#
+
+IIO_SYSFS = "/sys/bus/iio/devices/iio:device0"     # ADC sysfs directory.
+IIO_DEV = "/dev/iio:device0"                        # ADC buffer device.
+IIO_BLOCK = 256             # Scans read per read() system call.
+IIO_BUFFER_LEN = 4096       # Kernel buffer length [scans].
+IIO_FULL_SCALE = 4095.0     # 12-bit conversion of the full scale.
+IIO_RAW_SCALE = 1800.0      # read_raw() full scale [mV], as Adafruit_BBIO.
+
+# BeagleBone Black analog input pins to ADC channel (AIN0 - AIN6).
+IIO_CHANNELS = {"P9_39": 0, "P9_40": 1, "P9_37": 2, "P9_38": 3,
+                "P9_33": 4, "P9_36": 5, "P9_35": 6}
+
+def scan_order(pins):
+    """Return the pins in the order of their samples in a scan."""
+    for pin in pins:
+        if pin not in IIO_CHANNELS:
+            raise ValueError("Not an analog input pin: {}".format(pin))
+    return sorted(set(pins), key=IIO_CHANNELS.get)
+
+class BufferedADC(object):
+    """Continuous-mode IIO ADC acquisition of a set of analog pins.
+
+    Attributes:
+        pins:       The pin names, in scan order.
+        fresh:      True: every read returns a new conversion.
+        scans:      The number of scans read.
+        reads:      The number of read() system calls which returned data.
+    """
+
+    fresh = True
+
+    def __init__(self, pins, block=IIO_BLOCK, sysfs=IIO_SYSFS, dev=IIO_DEV,
+                 length=IIO_BUFFER_LEN):
+        """Allocate the sample block.
+
+        Args:
+            pins:       A List of the analog input pin names to acquire.
+            block:      An Integer specifying the scans read at once.
+            sysfs:      A String specifying the IIO device sysfs directory.
+            dev:        A String specifying the IIO buffer device (or the
+                        sample file of an IioStandIn).
+            length:     An Integer specifying the kernel buffer length
+                        [scans].
+        """
+        self.pins = scan_order(pins)
+        self.sysfs = sysfs
+        self.dev = dev
+        self.length = length
+        self.scans = 0
+        self.reads = 0
+        self._width = len(self.pins)
+        self._index = {pin: n for n, pin in enumerate(self.pins)}
+        self._block = array("H", bytes(2*block*self._width))
+        self._view = memoryview(self._block)
+        self._bytes = self._view.cast("B")
+        self._latest = [None]*self._width
+        self._sums = [0]*self._width
+        self._counts = [0]*self._width
+        self._last = 0
+        self._fd = None
+        self._installed = []
+        self._lock = threading.Lock()
+
+    def setup(self):
+        """Enable the channels and the buffer, and open the device."""
+        if self._fd is not None:
+            return
+        self._attribute("buffer/enable", 0)
+        for pin, channel in IIO_CHANNELS.items():
+            path = "scan_elements/in_voltage{}_en".format(channel)
+            if os.path.exists(os.path.join(self.sysfs, path)):
+                self._attribute(path, int(pin in self._index))
+        self._attribute("buffer/length", self.length)
+        self._attribute("buffer/enable", 1)
+        self._fd = os.open(self.dev, os.O_RDONLY | os.O_NONBLOCK)
+
+    def close(self):
+        """Disable the buffer and close the device."""
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        self._fd = None
+        self._attribute("buffer/enable", 0)
+
+    def install(self, modules):
+        """Read the analog inputs of modules through this reader.
+
+        The ADC global of each module is replaced (undone by uninstall()).
+        """
+        for module in modules:
+            if hasattr(module, "ADC"):
+                self._installed.append((module, module.ADC))
+                module.ADC = self
+
+    def uninstall(self):
+        """Restore the modules' own ADC globals."""
+        while self._installed:
+            module, original = self._installed.pop()
+            module.ADC = original
+
+    def drain(self):
+        """Read every complete scan waiting in the buffer.
+
+        Returns:
+            scans:      The number of scans read.
+        """
+        total = 0
+        with self._lock:
+            while True:
+                scans = self._read_block()
+                total += scans
+                if scans*self._width < len(self._block):
+                    return total
+
+    def read(self, pin):
+        """Return the newest value of an analog pin [normalized, 0 - 1].
+
+        Returns None before the first scan has been read.
+        """
+        self.drain()
+        value = self._latest[self._index[pin]]
+        if value is None:
+            return None
+        return value/IIO_FULL_SCALE
+
+    def read_raw(self, pin):
+        """Return the newest value of an analog pin [mV], or None."""
+        value = self.read(pin)
+        if value is None:
+            return None
+        return value*IIO_RAW_SCALE
+
+    def take(self, pin):
+        """Return and reset the samples accumulated for a pin.
+
+        Returns:
+            total:      The sum of the samples [normalized].
+            count:      The number of samples.
+        """
+        self.drain()
+        with self._lock:
+            index = self._index[pin]
+            total = self._sums[index]/IIO_FULL_SCALE
+            count = self._counts[index]
+            self._sums[index] = 0
+            self._counts[index] = 0
+        return total, count
+
+    def samples(self, pin):
+        """Return the raw samples of a pin from the last block read.
+
+        Returns:
+            samples:    A memoryview of the 12-bit samples (valid until
+                        the next read).
+        """
+        index = self._index[pin]
+        return self._view[index:self._last*self._width:self._width]
+
+    def _read_block(self):
+        try:
+            size = os.readv(self._fd, [self._bytes])
+        except BlockingIOError:
+            size = 0
+        scans = size//(2*self._width)
+        if scans == 0:
+            return 0
+
+        self._last = scans
+        end = scans*self._width
+        for index in range(self._width):
+            channel = self._view[index:end:self._width]
+            self._sums[index] += sum(channel)
+            self._counts[index] += scans
+            self._latest[index] = channel[-1]
+        self.scans += scans
+        self.reads += 1
+        return scans
+
+    def _attribute(self, path, value):
+        with open(os.path.join(self.sysfs, path), "w") as attribute:
+            attribute.write(str(value))
+
+class IioStandIn(object):
+    """File-backed stand-in for the IIO ADC device (see the Overview).
+
+    Attributes:
+        pins:       The pin names, in scan order (as BufferedADC).
+        sysfs:      The stand-in sysfs directory.
+        dev:        The stand-in sample file.
+    """
+
+    def __init__(self, root, pins):
+        """Create the stand-in in a directory.
+
+        Args:
+            root:       A String specifying an existing directory.
+            pins:       A List of the analog input pin names sampled.
+        """
+        self.pins = scan_order(pins)
+        self.sysfs = os.path.join(root, "iio:device0")
+        self.dev = os.path.join(root, "iio:device0.dev")
+        os.makedirs(os.path.join(self.sysfs, "scan_elements"), exist_ok=True)
+        os.makedirs(os.path.join(self.sysfs, "buffer"), exist_ok=True)
+        for channel in IIO_CHANNELS.values():
+            self._attribute("scan_elements/in_voltage{}_en".format(channel), 0)
+        self._attribute("buffer/length", 0)
+        self._attribute("buffer/enable", 0)
+        open(self.dev, "wb").close()
+
+    def append(self, scans):
+        """Append scans of normalized values (one per pin, in scan order)."""
+        samples = array("H", (int(round(min(max(value, 0.0), 1.0)
+                                        *IIO_FULL_SCALE))
+                              for scan in scans for value in scan))
+        with open(self.dev, "ab") as dev:
+            samples.tofile(dev)
+
+    def enabled(self):
+        """Return the pins whose channels are enabled."""
+        return [pin for pin, channel in IIO_CHANNELS.items()
+                if self._read("scan_elements/in_voltage{}_en".format(
+                    channel)) == "1"]
+
+    def _attribute(self, path, value):
+        with open(os.path.join(self.sysfs, path), "w") as attribute:
+            attribute.write(str(value))
+
+    def _read(self, path):
+        with open(os.path.join(self.sysfs, path)) as attribute:
+            return attribute.read().strip()
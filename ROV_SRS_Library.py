@@ -11,13 +11,19 @@
 # Authors:  Giles Fernandes, Jonathan Lee
 #
 
+from bisect import bisect_left
+from bisect import bisect_right
+from bisect import insort
 from collections import deque
 from datetime import datetime
+import math
 import sys
 import time
 
-from Adafruit_BBIO import ADC
-from Adafruit_BBIO import GPIO
+from ROV_SRS_Hardware import ADC
+from ROV_SRS_Hardware import GPIO
+from ROV_SRS_Hardware import Worker
+from ROV_SRS_Hardware import clock
 
 #
 # Constant Definitions.
@@ -48,13 +54,397 @@ SS_COMMANDS = [[GPIO.HIGH, GPIO.HIGH],    # Take one Step CCW.
                [GPIO.LOW, GPIO.LOW],      # Hold Stepper in place.
                [GPIO.LOW, GPIO.HIGH]]     # Take one Step CW.
 
+# Command Library for a single pin (e.g. STEP or DIR alone).
+PIN_LEVELS = [[GPIO.LOW],                 # Drive the pin LOW.
+              [GPIO.HIGH]]                # Drive the pin HIGH.
+
+# PWM Calibration Constants.
+PWM_LEARN_SPAN = 50.0            # Smallest learned/nominal width span [%].
+PWM_DEADBAND = 5.0               # Proportional dead band about the centre
+                                 # [% of the width span].
+PWM_LOSS_PERIODS = 3.0           # Signal lost after this long without an
+                                 # edge or Pulse [signal periods].
+PWM_POLL_TIME = 0.0005           # Check period while waiting for an edge
+                                 # [sec].
+
+# Data Logging Constants.
+LOG_BUFFER_SIZE = 4096           # Samples held in memory before dropping.
+LOG_BATCH_SIZE = 256             # Samples which trigger a flush.
+LOG_FLUSH_TIME = 5.0             # Longest time between flushes [sec].
+LOG_POLL_TIME = 0.25             # Background writer check period [sec].
+
+# Data Log (set up by setup_logfile()).
+file = None
+log_buffer = None
+
+# PwmChannels of the module-level Pulse Width functions, by calibration.
+_channels = {}
+
+# Output backend of the command tables: None for GPIO.output(), or a
+# ROV_SRS_GpioBank GpioBanks (set by its install()).
+output_bank = None
+
+# Command outputs, by pins and command table (see command_outputs()).
+_outputs = {}
+
+# Input pins whose PWM signal was lost (see get_width()).
+_signal_lost = set()
+
+# Pressure conversion of read_pressure(): None for the normalized reading,
+# or a ROV_SRS_Calibration PressureCalibration.
+pressure_calibration = None
+
+class LogBuffer(object):
+    """Preallocated in-memory buffer of pressure samples.
+
+    The control loop push()es samples, which only stores them with a
+    monotonic timestamp. A background Worker formats and writes them to
+    the file in batches, once LOG_BATCH_SIZE samples are pending or
+    LOG_FLUSH_TIME has passed. Time of day is derived from a wall-clock
+    base cached at creation, and formatted once per second at most.
+    Samples pushed while the buffer is full are dropped and counted.
+
+    Attributes:
+        dropped:    The number of samples dropped on a full buffer.
+        written:    The number of samples written to the file.
+        next_due:   The earliest time of the next logged sample [sec]
+                    (maintained by log_pressure()).
+    """
+
+    def __init__(self, file, size=LOG_BUFFER_SIZE, batch=LOG_BATCH_SIZE,
+                 period=LOG_FLUSH_TIME):
+        self.dropped = 0
+        self.written = 0
+        self.next_due = 0.0
+        self._file = file
+        self._size = size
+        self._batch = batch
+        self._period = period
+        self._times = [0.0]*size
+        self._values = [0.0]*size
+        self._head = 0
+        self._tail = 0
+        self._mono_base = clock.monotonic()
+        self._wall_base = clock.time()
+        self._last_flush = self._mono_base
+        self._stamp_sec = None
+        self._stamp = ""
+        self._worker = Worker(self._run, name="LogBuffer")
+
+    def start(self):
+        """Start the background writer."""
+        self._worker.start()
+
+    def close(self):
+        """Stop the background writer and write any pending samples."""
+        self._worker.stop()
+        self.flush()
+
+    def push(self, value, t=None):
+        """Store one sample. Never blocks on the file.
+
+        Args:
+            value:      The sample value.
+            t:          The monotonic sample time [sec], or None for now.
+        """
+        head = self._head
+        if head - self._tail >= self._size:
+            self.dropped += 1
+            return
+
+        index = head % self._size
+        self._times[index] = clock.monotonic() if t is None else t
+        self._values[index] = value
+        self._head = head + 1
+
+    def flush(self):
+        """Format and write all pending samples."""
+        head = self._head
+        tail = self._tail
+        if head == tail:
+            return
+
+        lines = []
+        for n in range(tail, head):
+            index = n % self._size
+            lines.append(self._format(self._times[index], self._values[index]))
+        self._tail = head
+
+        self._file.write("".join(lines))
+        self._file.flush()
+        self.written += head - tail
+
+    def _format(self, t, value):
+        # Log Format: Time, Pressure
+        sec = int(self._wall_base + (t - self._mono_base))
+        if sec != self._stamp_sec:
+            self._stamp_sec = sec
+            self._stamp = time.strftime('%H:%M:%S', time.localtime(sec))
+        return self._stamp + "\t" + str(value) + "\n"
+
+    def _run(self):
+        while True:
+            yield LOG_POLL_TIME
+            now = clock.monotonic()
+            if (self._head - self._tail >= self._batch
+                    or now - self._last_flush >= self._period):
+                self.flush()
+                self._last_flush = now
+
+class PwmChannel(object):
+    """Precomputed Pulse Width calibration of one PWM input signal.
+
+    The width thresholds are computed once from the expected frequency,
+    duty cycles and tolerance (see get_width()), rather than on every
+    call. correct() folds faulty widths back into range in constant time,
+    however many periods were missed, and classify() looks the width up
+    in a sorted threshold table.
+
+    With learn > 0, the channel learns the real minimum and maximum
+    Pulse Widths of its transmitter from the first learn Pulses passed to
+    learn() (the sticks should be moved to both ends meanwhile). If the
+    learned span is at least PWM_LEARN_SPAN [%] of the nominal span, the
+    thresholds are recomputed from it; otherwise the nominal calibration
+    is kept.
+
+    Attributes:
+        period:     The expected PWM period [sec].
+        width_max:  The maximum expected Pulse Width [sec].
+        width_min:  The minimum expected Pulse Width [sec].
+        width_tol:  The tolerance on the Pulse Width [sec].
+        width_hold: The Pulse Width of the hold Command (the centre of
+                    the range) [sec], reported while the signal is lost.
+        learning:   True until the learning Pulses have been seen.
+        learned:    True if the thresholds were learned.
+    """
+
+    # Position Commands, by number of thresholds at or below the width.
+    COMMANDS = (-1, 0, 1, 2)
+
+    def __init__(self, freq, max, min, tol, learn=0):
+        """Compute the thresholds.
+
+        Args:
+            freq:       A Float specifying the expected frequency
+                        of the PWM signal [Hz].
+            max:        A Float specifying the maximum expected
+                        duty cycle of the PWM signal [%].
+            min:        A Float specifying the minimum expected
+                        duty cycle of the PWM signal [%].
+            tol:        A Float specifying the acceptable tolerance
+                        on deviations in the measured Pulse Width [%],
+                        below 50. Refer to get_width() for further
+                        details.
+            learn:      An Integer specifying the number of Pulses to
+                        learn the Pulse Width range from (0 disables).
+        """
+        if not 0.0 < tol < 50.0:
+            raise ValueError(
+                "PWM tolerance must be between 0 and 50%: {}".format(tol))
+
+        self.period = 1.0/freq
+        self.tol = tol
+        self.learning = learn > 0
+        self.learned = False
+        self._learn = learn
+        self._seen = 0
+        self._low = None
+        self._high = None
+        self._calibrate(self.period*(max/100.0), self.period*(min/100.0))
+
+    def _calibrate(self, width_max, width_min):
+        self.width_max = width_max
+        self.width_min = width_min
+        self.width_tol = (width_max - width_min)*(self.tol/100.0)
+
+        # Widths folded back into range end up within [_lower, _upper].
+        self._upper = width_max + self.width_tol
+        self._lower = width_min - self.width_tol
+        self._thresholds = (width_min - self.width_tol,
+                            width_min + self.width_tol,
+                            width_max - self.width_tol)
+        self._centre = (width_max + width_min)/2.0
+        self.width_hold = self._centre
+        self._half = (width_max - width_min)/2.0
+
+    def correct(self, sample):
+        """Correct a measured Pulse Width for faulty values.
+
+        Equivalent to correct_width(), in constant time.
+
+        Args:
+            sample:     A Float specifying the measured Pulse Width [sec].
+
+        Returns:
+            sample:     The corrected Pulse Width [sec].
+        """
+        # Correct for faulty values (missed edge events, etc.)
+        if sample >= self.period:
+            sample %= self.period
+        if sample > self._upper:
+            sample -= self.width_tol*math.ceil(
+                (sample - self._upper)/self.width_tol)
+        elif sample < self._lower:
+            sample += self.width_tol*math.ceil(
+                (self._lower - sample)/self.width_tol)
+        return sample
+
+    def classify(self, width):
+        """Return the Position Command of a Pulse Width.
+
+        Equivalent to set_position(). Refer to set_position() for the
+        returned Position Commands.
+        """
+        return self.COMMANDS[bisect_right(self._thresholds, width)]
+
+    def deflection(self, width, deadband=PWM_DEADBAND):
+        """Return the proportional stick deflection of a Pulse Width.
+
+        Widths map linearly from -1.0 (width_min) to 1.0 (width_max).
+        Widths within deadband [% of the span] of the centre read 0.0;
+        the rest of the range is rescaled to stay continuous.
+
+        Returns:
+            deflection: A Float from -1.0 to 1.0, or None for an invalid
+                        width (Position Command -1).
+        """
+        if width < self._thresholds[0]:
+            return None
+        value = (width - self._centre)/self._half
+        band = deadband/50.0
+        if abs(value) <= band:
+            return 0.0
+        return math.copysign(min((abs(value) - band)/(1.0 - band), 1.0),
+                             value)
+
+    def learn(self, width):
+        """Learn the Pulse Width range from one corrected Pulse Width.
+
+        Returns:
+            learning:   True while more Pulses are needed.
+        """
+        if not self.learning:
+            return False
+
+        if self._seen == 0:
+            self._low = self._high = width
+        elif width < self._low:
+            self._low = width
+        elif width > self._high:
+            self._high = width
+        self._seen += 1
+
+        if self._seen >= self._learn:
+            self.learning = False
+            span = self.width_max - self.width_min
+            if self._high - self._low >= span*(PWM_LEARN_SPAN/100.0):
+                self._calibrate(self._high, self._low)
+                self.learned = True
+        return self.learning
+
+class PulseFilter(object):
+    """Sliding-window trimmed mean of the newest Pulse Widths.
+
+    Each update() adds one Pulse Width to the window (dropping the
+    oldest) and returns the mean of the window without its trim smallest
+    and trim largest widths: the median of the window when trim is
+    (size - 1)/2, the plain mean when trim is 0. Up to trim glitched
+    Pulses in the window are rejected outright rather than skewing the
+    result, and a stick change shows once it fills more than half of a
+    median window (2 Pulses of 3), instead of after a block of Pulses.
+
+    Attributes:
+        size:       The window length [Pulses].
+        trim:       The Pulses dropped from each end of the window.
+        width:      The latest filtered Pulse Width [sec], or None.
+    """
+
+    def __init__(self, size, trim=0):
+        if not 0 <= 2*trim < size:
+            raise ValueError(
+                "Pulse filter trims too much: {} of {}".format(trim, size))
+        self.size = size
+        self.trim = trim
+        self.width = None
+        self._window = deque()
+        self._sorted = []
+
+    def reset(self):
+        """Empty the window (e.g. on signal loss); width is kept."""
+        self._window.clear()
+        self._sorted = []
+
+    def update(self, width):
+        """Add one Pulse Width [sec] and return the filtered width [sec]."""
+        window = self._window
+        ordered = self._sorted
+        if len(window) == self.size:
+            del ordered[bisect_left(ordered, window.popleft())]
+        window.append(width)
+        insort(ordered, width)
+
+        # Trim less while the window is filling.
+        trim = min(self.trim, (len(ordered) - 1)//2)
+        kept = ordered[trim:len(ordered) - trim]
+        self.width = sum(kept)/len(kept)
+        return self.width
+
+def pwm_channel(freq, max, min, tol):
+    """Return the shared PwmChannel of a calibration (built once)."""
+    key = (freq, max, min, tol)
+    channel = _channels.get(key)
+    if channel is None:
+        channel = _channels[key] = PwmChannel(freq, max, min, tol)
+    return channel
+
+class CommandOutputs(object):
+    """Output pins driven together from the rows of a command table.
+
+    Attributes:
+        out:        The output pin names.
+        table:      The command table (rows of levels, one per pin).
+    """
+
+    def __init__(self, out, table):
+        self.out = list(out)
+        self.table = [list(row) for row in table]
+        self._rows = [list(zip(self.out, row)) for row in self.table]
+
+    def write(self, cmd):
+        """Drive every pin to row cmd of the table."""
+        for pin, level in self._rows[cmd]:
+            GPIO.output(pin, level)
+
+def command_outputs(out, table):
+    """Return the shared command outputs of pins and a table (built once).
+
+    The outputs are written through output_bank when one is installed,
+    with each table precompiled into register masks, else pin by pin.
+    """
+    key = (tuple(out), id(table))
+    outputs = _outputs.get(key)
+    if outputs is None:
+        if output_bank is None:
+            outputs = CommandOutputs(out, table)
+        else:
+            outputs = output_bank.command_outputs(out, table)
+        _outputs[key] = outputs
+    return outputs
+
 def get_width(pin, size, freq, max, min, tol):
     """Calculate the Pulse Width of a PWM input signal.
 
     This function stores the time of day on a Rising Edge and subsequent 
     Falling Edge event, calculates the average of multiple such events, 
-    and returns the difference in milliseconds. Function will halt if run 
-    on 0 or 100% Duty Cycle signals.
+    and returns the difference in milliseconds.
+
+    Every edge is waited for at most PWM_LOSS_PERIODS signal periods, and
+    the whole call at most size + PWM_LOSS_PERIODS periods, so a 0 or 100%
+    Duty Cycle signal or a receiver dropout cannot halt the caller. If no
+    Pulse arrives in time the signal is lost: the hold Pulse Width (see
+    PwmChannel) is returned, and later calls on the pin only probe one
+    signal period for a Pulse until it is back, returning it at once
+    (fast reacquisition).
 
     Args:
         pin:        A String specifying the pin name on which the PWM 
@@ -77,41 +467,126 @@ def get_width(pin, size, freq, max, min, tol):
                     and minimum possible Pulse Widths [%].
 
     Returns:
-        width:      The calculated Pulse Width [milliseconds].
+        width:      The calculated Pulse Width [milliseconds], or the
+                    hold Pulse Width if the signal is lost.
     """
-    __WIDTH_MAX = ((1/freq)*(max/100))
-    __WIDTH_MIN = ((1/freq)*(min/100))
-    __WIDTH_TOL = (__WIDTH_MAX - __WIDTH_MIN)*(tol/100)
-
     width = 0.0
 
-    __rise_flag = 0.0
-    __fall_flag = 0.0
     __sample = 0.0
+    __count = 0
 
-    for i in range(size):
+    __timeout = PWM_LOSS_PERIODS/freq
+    __deadline = clock.monotonic() + (size + PWM_LOSS_PERIODS)/freq
+
+    # While the signal is lost, probe one period for a single Pulse.
+    if pin in _signal_lost:
+        size = 1
+        __deadline = clock.monotonic() + (1.0 + max/100.0)/freq
+
+    __channel = pwm_channel(freq, max, min, tol)
+    for __sample in _pulses(pin, size, __timeout, __deadline,
+                            __channel.width_max + __channel.width_tol):
         # Determine incoming signal Pulse Width.
-        GPIO.wait_for_edge(pin, GPIO.RISING)
-        __rise_flag = time.time()
+        width += correct_width(__sample, freq, max, min, tol)
+        __count += 1
 
-        GPIO.wait_for_edge(pin, GPIO.FALLING)
-        __fall_flag = time.time()
+    if __count == 0:
+        # Signal lost: report the hold Pulse Width.
+        _signal_lost.add(pin)
+        return pwm_channel(freq, max, min, tol).width_hold
+    _signal_lost.discard(pin)
 
-        __sample = __fall_flag - __rise_flag
+    width /= __count
 
-        # Correct for faulty values (missed edge events, etc.)
-        while __sample >= (1/freq):
-            __sample -= (1/freq)
-        while __sample > (__WIDTH_MAX + __WIDTH_TOL):
-            __sample -= __WIDTH_TOL
-        while __sample < (__WIDTH_MIN - __WIDTH_TOL):
-            __sample += __WIDTH_TOL
+    return width
 
-        width += __sample
+def _pulses(pin, size, timeout, deadline, longest):
+    """Measure the next Pulses of a pin.
 
-    width /= size
+    Both edges are detected from the start of the call to its end (as in
+    ROV_SRS_Capture), so no edge is missed between a Rising and the
+    following Falling Edge; each is timed by the detection callback, on
+    the monotonic clock of the timeouts. The direction of an edge follows
+    from the pin level at the start and the order of the edges: edges
+    alternate, and an edge after longer than any Pulse is Rising (so a
+    missed edge costs one Pulse).
 
-    return width
+    Args:
+        pin:        A String specifying the input pin name.
+        size:       An Integer specifying the number of Pulses wanted.
+        timeout:    A Float specifying the longest wait for each edge
+                    [sec].
+        deadline:   A Float specifying the monotonic time to give up at
+                    [sec].
+        longest:    A Float specifying the longest Pulse expected [sec].
+
+    Returns:
+        widths:     A List of the measured Pulse Widths [sec], fewer than
+                    size if the edges did not arrive in time.
+    """
+    widths = []
+
+    __edges = []
+
+    def __stamp(channel):
+        __edges.append(clock.monotonic())
+
+    # A Pulse under way: its Falling Edge comes first.
+    __rise = None
+    __last = None
+    __skip = GPIO.input(pin) == GPIO.HIGH
+    __seen = 0
+    __end = min(clock.monotonic() + timeout, deadline)
+
+    GPIO.add_event_detect(pin, GPIO.BOTH, callback=__stamp)
+    try:
+        while len(widths) < size:
+            if __seen == len(__edges):
+                __wait = __end - clock.monotonic()
+                if __wait <= 0.0:
+                    break
+                clock.sleep(min(PWM_POLL_TIME, __wait))
+                continue
+
+            __edge = __edges[__seen]
+            __seen += 1
+            __end = min(__edge + timeout, deadline)
+            if __skip:
+                __skip = False
+            elif __rise is None or __edge - __last > longest:
+                __rise = __edge
+            else:
+                widths.append(__edge - __rise)
+                __rise = None
+            __last = __edge
+    finally:
+        GPIO.remove_event_detect(pin)
+
+    return widths
+
+def correct_width(sample, freq, max, min, tol):
+    """Correct a measured Pulse Width for faulty values.
+
+    This function folds a Pulse Width measured across missed edge events
+    (etc.) back into the range of expected Pulse Widths. The calibration
+    is computed once per set of arguments (see PwmChannel).
+
+    Args:
+        sample:     A Float specifying the measured Pulse Width [sec].
+        freq:       A Float specifying the expected frequency
+                    of the PWM signal [Hz].
+        max:        A Float specifying the maximum expected
+                    duty cycle of the PWM signal [%].
+        min:        A Float specifying the minimum expected
+                    duty cycle of the PWM signal [%].
+        tol:        A Float specifying the acceptable tolerance
+                    on deviations in the measured Pulse Width [%].
+                    Refer to get_width() for further details.
+
+    Returns:
+        sample:     The corrected Pulse Width [sec].
+    """
+    return pwm_channel(freq, max, min, tol).correct(sample)
 
 def set_position(width, freq, max, min, tol):
     """Set the Position Command corresponding to a PWM Pulse Width.
@@ -144,22 +619,9 @@ def set_position(width, freq, max, min, tol):
                     2  == Maximum Pulse Width.
                     1  == Intermediate Pulse Width .
                     0  == Minimum Pulse Width.
+                    -1 == Pulse Width below range.
     """
-    __WIDTH_MAX = ((1/freq)*(max/100))
-    __WIDTH_MIN = ((1/freq)*(min/100))
-    __WIDTH_TOL = (__WIDTH_MAX - __WIDTH_MIN)*(tol/100)
-
-    cmd = -1
-
-    # Check pulse width bracket.
-    if width >= (__WIDTH_MAX - __WIDTH_TOL):
-        cmd = 2
-    elif width >= (__WIDTH_MIN + __WIDTH_TOL):
-        cmd = 1
-    elif width >= (__WIDTH_MIN - __WIDTH_TOL):
-        cmd = 0
-
-    return cmd
+    return pwm_channel(freq, max, min, tol).classify(width)
 
 def check_trend(hist, cont):
     """Check for Position Command persistance.
@@ -194,14 +656,14 @@ def check_trend(hist, cont):
 
     # Check for duration of oldest Command.
     while __start_flag is True and __start_index < (len(hist) // 2):
-        if hist[__start_index] is hist[0]:
+        if hist[__start_index] == hist[0]:
             __start_index += 1
         else:
             __start_flag = False
 
     # Check for duration of newest Command.
     while __end_flag is True and __end_index >= (len(hist) // 2):
-        if hist[__end_index] is hist[len(hist) - 1]:
+        if hist[__end_index] == hist[len(hist) - 1]:
             __end_index -= 1
         else:
             __end_flag = False
@@ -210,11 +672,117 @@ def check_trend(hist, cont):
     if cont is True and __end_flag is True:
         trend = hist[len(hist) - 1]
     elif __start_flag is True and __end_flag is True:
-        if hist[0] is not hist[len(hist) - 1]:
+        if hist[0] != hist[len(hist) - 1]:
             trend = hist[len(hist) - 1]
 
     return trend
 
+class TrendFilter(object):
+    """Incremental Position Command trend check for one channel.
+
+    Equivalent to keeping a history deque of the last size Commands and
+    calling check_trend() on it, but the history is kept as run lengths
+    and updated in constant time per Command, whatever the window size.
+
+    Two optional rules debounce continuous trends further:
+        release:    The number of consecutive differing Commands needed
+                    to end a continuous trend (hysteresis). A trend
+                    which has not been released stays in force.
+        dwell:      The minimum number of Commands between two changes
+                    of the trend. In 50/50 mode, the minimum number of
+                    Commands between two reported transitions.
+
+    Attributes:
+        trend:      The most recent trend. Refer to check_trend().
+        last:       The most recent Position Command.
+    """
+
+    def __init__(self, size, cont, release=1, dwell=0, initial=1):
+        """Fill the history with the initial Command.
+
+        Args:
+            size:       An Integer specifying the history length.
+            cont:       A Boolean indicating whether a continuous
+                        command sequence is expected. Refer to
+                        check_trend() for further details.
+            release:    An Integer specifying the differing Commands
+                        needed to end a continuous trend.
+            dwell:      An Integer specifying the minimum Commands
+                        between changes of the trend.
+            initial:    The Position Command filling the history.
+        """
+        self.size = size
+        self.cont = cont
+        self.release = release
+        self.dwell = dwell
+
+        # Run lengths of the older and newer halves of the history.
+        self._start_len = size // 2
+        self._end_len = size - size // 2
+        self.reset(initial)
+
+    def reset(self, initial=1):
+        """Refill the history with one Command (e.g. on signal loss).
+
+        Returns:
+            trend:      The resulting trend (1, hold).
+        """
+        self.trend = 1
+        self.last = initial
+        self._runs = deque([[initial, self.size]])
+        self._differ = 0
+        self._age = self.dwell
+        return self.trend
+
+    def update(self, cmd):
+        """Append a Position Command and return the resulting trend."""
+        runs = self._runs
+
+        # Append to the newest run, and drop the oldest Command.
+        if runs[-1][0] == cmd:
+            runs[-1][1] += 1
+        else:
+            runs.append([cmd, 1])
+        runs[0][1] -= 1
+        if runs[0][1] == 0:
+            runs.popleft()
+        self.last = cmd
+        self._age += 1
+
+        end_flag = runs[-1][1] >= self._end_len
+        if self.cont:
+            trend = self._continuous(cmd, end_flag)
+            if trend != self.trend:
+                if self._age < self.dwell:
+                    trend = self.trend
+                else:
+                    self._age = 0
+        else:
+            start_flag = runs[0][1] >= self._start_len
+            trend = 1
+            if start_flag and end_flag and runs[0][0] != cmd:
+                if self._age >= self.dwell:
+                    trend = cmd
+                    self._age = 0
+
+        self.trend = trend
+        return trend
+
+    def _continuous(self, cmd, end_flag):
+        if end_flag:
+            self._differ = 0
+            return cmd
+
+        # Hold an established trend until enough Commands differ.
+        if self.trend != 1:
+            if cmd == self.trend:
+                self._differ = 0
+                return self.trend
+            self._differ += 1
+            if self._differ < self.release:
+                return self.trend
+        return 1
+
 def move_linear(cmd, out, pot, stroke):
     """Move the Linear Actuator to match the desired Position Command.
 
@@ -243,20 +811,18 @@ def move_linear(cmd, out, pot, stroke):
 
     if cmd >= 0:
         # Begin Linear Actuator motion.
-        for __col in range(len(out)):
-            GPIO.output(out[__col], LA_COMMANDS[__col][cmd])
+        command_outputs(out, LA_COMMANDS).write(cmd)
 
         # Check Potentiometer Signal.
-        if cmd is 2:
+        if cmd == 2:
             while __pot_pos > __LOWER_LIM:
                 __pot_pos = ADC.read(pot)
-        elif cmd is 0:
+        elif cmd == 0:
             while __pot_pos < __UPPER_LIM:
                 __pot_pos = ADC.read(pot)
 
     # Hold Linear Actuator at desired Position.
-    for __index in range(len(out)):
-        GPIO.output(out[__index], GPIO.LOW)
+    command_outputs(out, LA_COMMANDS).write(1)
 
 def move_carousel(cmd, out, gripper):
     """Move the Carousel Stepper to match the desired Position Command.
@@ -279,20 +845,20 @@ def move_carousel(cmd, out, gripper):
     """
     __path_steps = ((1/float(gripper))*360)/(CS_STEP_ANGLE)
 
-    if cmd is 2:
+    if cmd == 2:
         # Loop over single-step command.
+        __outputs = command_outputs(out, CS_COMMANDS)
+        __step = command_outputs(out[1:2], PIN_LEVELS)
         for __steps in range(int(__path_steps)):
-            for __col in range((len(out))):
-                GPIO.output(out[__col], CS_COMMANDS[cmd][__col])
-            time.sleep(CS_DRIVE_STEP_PERSIST)
+            __outputs.write(cmd)
+            clock.sleep(CS_DRIVE_STEP_PERSIST)
 
-            GPIO.output(out[1], GPIO.LOW)
-            time.sleep(CS_DRIVE_STEP_PERSIST)
+            __step.write(0)
+            clock.sleep(CS_DRIVE_STEP_PERSIST)
 
     else:
         # Hold Carousel Stepper at desired Position.
-        for __index in range(len(out)):
-            GPIO.output(out[__index], GPIO.LOW)
+        command_outputs(out, CS_COMMANDS).write(1)
 
 def move_shoulder(cmd, out):
     """Move the Shoulder Stepper to match the desired Position Command.
@@ -312,83 +878,129 @@ def move_shoulder(cmd, out):
         next:       An Integer specifying the next Phase sequence for
                     continued rotation.
     """
-    if cmd is 2 or cmd is 0:
-        for __col in range((len(out))):
-            GPIO.output(out[__col], SS_COMMANDS[cmd][__col])
-        time.sleep(SS_DRIVE_STEP_PERSIST)
+    if cmd == 2 or cmd == 0:
+        command_outputs(out, SS_COMMANDS).write(cmd)
+        clock.sleep(SS_DRIVE_STEP_PERSIST)
 
-        GPIO.output(out[1], GPIO.LOW)
-        time.sleep(SS_DRIVE_STEP_PERSIST)
+        command_outputs(out[1:2], PIN_LEVELS).write(0)
+        clock.sleep(SS_DRIVE_STEP_PERSIST)
 
     else:
         # Hold Shoulder Stepper at desired Position.
-        for __index in range(len(out)):
-            GPIO.output(out[__index], GPIO.LOW)
+        command_outputs(out, SS_COMMANDS).write(1)
 
-def setup_logfile(name):
+def setup_logfile(name, log=None):
     """Create File for data logging.
 
     This function creates a CSV file, appends the current date to the
-    filename, and opens the file for data recording.
+    filename, opens the file for data recording and starts the
+    background writer of the log buffer.
 
     Args:
         name:       A String specifying the desired file name. The current
                     date will be appended to this string.
+        log:        A file-like object (write(), flush() and close()) to
+                    log to instead, e.g. a ROV_SRS_CompactLog LogStore,
+                    or None.
 
     Returns:
         N/A 
     """
+    global file
+    global log_buffer
+
     __fmt = '%Y-%m-%d_{}'.format(name)
 
     # Create name with timestamp appended.
     __datename = datetime.now().strftime(__fmt).format(name = name)
 
     # Open the file in write mode.
-    file = open(__datename,'w')
+    if log is None:
+        file = open(__datename,'w')
+    else:
+        file = log
+
+    # Buffer samples in memory; write them in the background.
+    log_buffer = LogBuffer(file)
+    log_buffer.start()
+
+def close_logfile():
+    """Write any buffered samples and close the log file.
+
+    Args:
+        N/A
+
+    Returns:
+        N/A
+    """
+    global file
+    global log_buffer
+
+    if log_buffer is not None:
+        log_buffer.close()
+        log_buffer = None
+    if file is not None:
+        file.close()
+        file = None
 
 def read_pressure(pin):
     """Read the pressure sensor value.
 
     This function reads the analog input from the pressure sensor and 
-    returns the corresponding pressure differential value.
+    returns the corresponding pressure differential value (converted by
+    pressure_calibration, if set).
 
     Args:
         pin:        A String specifying the pin name on which the 
                     pressure sensor signal is expected.
 
     Returns:
-        __diff:     The calculated pressure difference [psi].
+        __diff:     The calculated pressure difference [psi], or the
+                    normalized reading without pressure_calibration
+                    (None before a buffered ADC's first scan).
     """
     # Read the pressure transducer sensor signal.
     # BUG: Adafruit_BBIO ADC Library requires two read operations
-    # to obtain an updated analog signal value.
-    __diff = ADC.read(pin)
+    # to obtain an updated analog signal value (a buffered ADC, see
+    # ROV_SRS_Iio, does not).
     __diff = ADC.read(pin)
+    if not getattr(ADC, "fresh", False):
+        __diff = ADC.read(pin)
 
-    # TODO: Map value to pressure differential.  
+    # Map value to pressure differential.
+    if pressure_calibration is not None and __diff is not None:
+        __diff = pressure_calibration.convert(__diff)
 
     return __diff
 
-def log_pressure(diff, freq):
+def log_pressure(diff, freq, t=None):
     """Log the pressure difference into the log file.
 
-    This function reads the pressure from the sensor and writes a time 
-    stamp and pressure value to a CSV log file.
+    This function stores a time stamp and pressure value in the log
+    buffer, which writes them to a CSV log file in the background.
+    Samples arriving faster than the logging frequency are skipped.
 
     Args:
         diff:       A Float specifying the previously calculated
                     pressure differential [psi].
         freq:       An Integer specifying the desired logging 
                     frequency [Hz].
+        t:          A Float specifying the monotonic time at which the
+                    value was sampled [sec], or None for now.
 
     Returns:
         N/A 
     """
-    # TODO: Check if memory has been filled.
-    # If memory has not been filled, write to file.
-
-    # Log Format: Time, Pressure
-    file.write(datetime.now().strftime('%H:%M:%S'))
-    file.write("\t")
-    file.write(str(diff))
-    file.write("\n")
+    __period = 1.0/freq
+    __now = clock.monotonic() if t is None else t
+
+    # Keep to the logging frequency (half a period early is on time).
+    if __now < log_buffer.next_due - __period/2:
+        return
+    log_buffer.next_due = max(log_buffer.next_due, __now) + __period
+
+    # Memory use is bounded by the log buffer (LOG_BUFFER_SIZE), and
+    # disk use by the quota of a compact log (see setup_logfile()).
+
+    # Log Format: Time, Pressure (formatted by the background writer).
+    log_buffer.push(diff, __now)
@@ -11,32 +11,89 @@
 # Authors:  Jonathan Lee
 #
 
-from collections import deque
-
-from Adafruit_BBIO import ADC
-from Adafruit_BBIO import GPIO
-from Adafruit_BBIO import PWM
+import functools
+
+from ROV_SRS_Hardware import ADC
+from ROV_SRS_Hardware import GPIO
+from ROV_SRS_Hardware import clock
+import ROV_SRS_Calibration as Calibration
+import ROV_SRS_Capture as Capture
+import ROV_SRS_Channels as Channels
+import ROV_SRS_GpioBank as GpioBank
+import ROV_SRS_Iio as Iio
 import ROV_SRS_Library as SRS
+import ROV_SRS_Motion as Motion
+import ROV_SRS_Pressure as Pressure
+import ROV_SRS_Realtime as Realtime
+import ROV_SRS_Scheduler as Scheduler
+from ROV_SRS_Stats import STATS
+import ROV_SRS_Telemetry as Telemetry
+import ROV_SRS_Trace as Trace
 
 #
 # Constant Definitions.
 #
 
 # General Program Constants.
-PWM_AVG_NUM  = 5        # Pulses to average before saving Commands.
+PWM_FILTER_NUM = 3      # Pulses in the sliding Pulse Width filter window.
+PWM_TRIM_NUM = 1        # Pulses trimmed from each end of the window (the
+                        # median of 3 rejects single glitched Pulses).
 
 PWM_WID_FREQ = 70.0     # Expected signal frequency [Hz].
 PWM_WID_MAX  = 14.1     # Input signal maximum duty cycle [%].
 PWM_WID_MIN  = 6.9      # Input signal minimum duty cycle [%].
 PWM_WID_TOL  = 25.0     # Tolerance on Pulse Width Deviations [%].
+PWM_LEARN_NUM = 0       # Pulses to learn Pulse Widths from (0 disables).
 
-POS_HIST_NUM = 5        # Number of Position Commands to store.
+POS_HIST_NUM = 2        # Number of Position Commands to store. Was 5
+                        # (3 agreeing Commands to change the trend), from
+                        # before the Pulse Width filter rejected glitched
+                        # Pulses; now 1 filtered Command changes it.
+POS_RELEASE_NUM = 1     # Commands needed to release a continuous trend.
+POS_DWELL_NUM = 0       # Minimum Commands between trend changes.
 
 LA_CONTINUOUS = False   # Command Trend check modes.
 CS_CONTINUOUS = False
 SS_CONTINUOUS = True
 
+SS_VELOCITY = True      # Proportional Shoulder jogging (else one step/pass).
+SS_LIMITS = [-90.0, 90.0]   # Shoulder soft end stops [degrees from start].
+
 PT_LOGFILE = "ROV SRS Data Log"
+PT_LOG_FREQ = 10        # Pressure logging frequency [Hz].
+PT_LOG_RING = 4096      # Telemetry records buffered for the log writer.
+PT_LOG_COMPACT = True   # Compact binary log files (ROV_SRS_CompactLog).
+PT_LOG_QUOTA = 256*1024*1024    # Disk use of the compact log files [bytes].
+
+TELEM_ADDRESS = None        # Topside (host, port) to stream telemetry to.
+TELEM_PROTOCOL = "udp"      # Telemetry stream protocol ("udp" or "tcp").
+TELEM_BANDWIDTH = 2000.0    # Tether budget of the stream [bytes/sec].
+TELEM_TIMING_TIME = 1.0     # Period of task timing records [sec].
+PT_OVERSAMPLE = 16      # Pressure ADC reads averaged per logged value.
+PT_WATER_TEMP = 4.0     # Water temperature for the pressure calibration
+                        # [degC] (see ROV_SRS_Calibration).
+
+LA_TASK_FREQ = 70.0     # Control pipeline task rates [Hz].
+CS_TASK_FREQ = 70.0
+SS_TASK_FREQ = 40.0
+
+SCHED_REPORT_TIME = 60.0    # Period of task rate reports [sec].
+
+STATS_ENABLE = True         # Time the control loop calls (see STATS).
+STATS_SOCKET = None         # Local socket path serving the stats, or None.
+
+TRACE_FILE = None           # Raw edge/ADC trace file to record, or None.
+
+RT_ENABLE = False           # Real-time mode and watchdog (Linux, as root).
+RT_PRIORITY = 40            # SCHED_FIFO priority of the control process.
+RT_CPUS = [0]               # CPUs the control process runs on.
+RT_WATCHDOG_GRACE = 0.010   # Allowed overrun of a task deadline [sec].
+
+ADC_BUFFERED = False        # Read the analog inputs in bulk from the IIO
+                            # buffer (ROV_SRS_Iio) instead of one by one.
+
+GPIO_BANK_DEV = None        # GPIO register memory ("/dev/mem") to write the
+                            # actuator outputs to directly, or None.
 
 # Linear Actuator Hardware Constants.
 PIN_LA_IN  =  "P8_8"        # Pin for Input PWM from RC Controller.
@@ -62,15 +119,72 @@ PIN_SS_OUT = ["P8_17",      # Pin for "DIR" Signal (high/low direction).
 PIN_PT_IN  = "P9_39"        # Pin for Input from Transducer.
 # TODO: Define additional Pins as necessary.
 
+# Actuator Drivers (see ROV_SRS_Channels).
+LA_DRIVER = ("linear", PIN_LA_POT, LA_STROKE_TARGET)
+CS_DRIVER = ("index", SRS.CS_STEP_ANGLE, Motion.CS_STEP_RATE_MAX,
+             Motion.CS_STEP_RATE_MIN, Motion.CS_STEP_ACCEL, CS_GRIPPER_NUM)
+SS_DRIVER = (("jog", SRS.SS_STEP_ANGLE, Motion.SS_STEP_RATE_MAX,
+              Motion.SS_STEP_RATE_MIN, Motion.SS_STEP_ACCEL, SS_LIMITS)
+             if SS_VELOCITY else ("step",))
+
+# Actuator Channel Table, one row per RC channel: name, task, task rate,
+# input pin, output pins, command table, continuous trends, latch and
+# driver (see ROV_SRS_Channels.Channels). The first three channels (LA,
+# CS, SS) are logged.
+CHANNELS = [["la", "la", LA_TASK_FREQ, PIN_LA_IN, PIN_LA_OUT, SRS.LA_COMMANDS,
+             LA_CONTINUOUS, True,  LA_DRIVER],
+            ["cs", "cs", CS_TASK_FREQ, PIN_CS_IN, PIN_CS_OUT, SRS.CS_COMMANDS,
+             CS_CONTINUOUS, True,  CS_DRIVER],
+            ["ss", "ss", SS_TASK_FREQ, PIN_SS_IN, PIN_SS_OUT, SRS.SS_COMMANDS,
+             SS_CONTINUOUS, False, SS_DRIVER]]
+
+# Control pipeline scheduler (set up by main()).
+scheduler = None
+
+def instrument():
+    """Time the control loop calls into the shared STATS Recorder.
+
+    Dump the stats at runtime with "kill -USR1 <pid>", or read them from
+    STATS_SOCKET if set. Undone by STATS.restore().
+    """
+    STATS.reset()
+    STATS.instrument(Pressure.PressureSampler, ["read"],
+                     "Pressure.PressureSampler")
+    STATS.instrument(Calibration.PressureCalibration, ["convert"],
+                     "Calibration.PressureCalibration")
+    STATS.instrument(SRS.PwmChannel, ["classify"], "SRS.PwmChannel")
+    STATS.instrument(SRS.TrendFilter, ["update"], "SRS.TrendFilter")
+    STATS.instrument(Telemetry.TelemetryRing, ["push"],
+                     "Telemetry.TelemetryRing")
+    STATS.instrument(Capture.EdgeCapture, ["filtered"], "Capture.EdgeCapture")
+    STATS.instrument(Channels.Channels, ["step"], "Channels.Channels")
+    STATS.instrument(Motion.LinearMotion, ["command"], "Motion.LinearMotion")
+    if SS_VELOCITY:
+        STATS.instrument(Motion.StepperEngine, ["index", "jog"],
+                         "Motion.StepperEngine")
+    else:
+        STATS.instrument(Motion.StepperEngine, ["index"],
+                         "Motion.StepperEngine")
+        STATS.instrument(Motion, ["move_shoulder_async"], "Motion")
+
+    STATS.install_signal()
+    if STATS_SOCKET is not None:
+        STATS.serve(STATS_SOCKET)
+
 def main():
     """Translates RC Controller Input to appropriate actuator signals.
 
     This function utilizes a set of initial variable values to setup
     desired functionality parameters (e.g. actuator stroke length), then 
-    enters a polling loop to continually check the state of the input 
-    signals. Upon proper conditions being met, changes in these inputs 
-    cause the program to enter and iterate through one of three state 
-    machines (one for each of the actuators on the SRS).
+    schedules one periodic pipeline per task of the channel table
+    (CHANNELS), each pass running every channel of its task through the
+    same stages (see ROV_SRS_Channels). Each pipeline runs at its own
+    rate on the ROV_SRS_Scheduler event loop, so a slow stage only delays
+    its own pipeline. The pressure transducer is sampled at a fixed rate in
+    the background; each sample, with the latest Position Commands and
+    trends, is logged by a separate writer process (ROV_SRS_Telemetry).
+    In real-time mode (RT_ENABLE), a watchdog forces every actuator to
+    hold when a pipeline misses its deadline.
 
     Args:
         n/A
@@ -78,147 +192,136 @@ def main():
     Returns:
         N/A
     """
-    #
-    # Initialize External dependencies.
-    #
-    ADC.setup()
-
-    # Linear Actuator.
-    GPIO.setup(PIN_LA_IN, GPIO.IN)
-    for __col in range(len(PIN_LA_OUT)):
-        GPIO.setup(PIN_LA_OUT[__col], GPIO.OUT)
-
-    # Carousel Stepper.
-    GPIO.setup(PIN_CS_IN, GPIO.IN)
-    for __col in range(len(PIN_CS_OUT)):
-        GPIO.setup(PIN_CS_OUT[__col], GPIO.OUT)
-
-    # Shoulder Stepper.
-    GPIO.setup(PIN_SS_IN, GPIO.IN)
-    for __col in range(len(PIN_SS_OUT)):
-        GPIO.setup(PIN_SS_OUT[__col], GPIO.OUT)
-
-    # Pressure Transducer.
-    SRS.setup_logfile(PT_LOGFILE)
+    global scheduler
 
     #
-    # Initialize Variables.
+    # Initialize External dependencies.
     #
 
-    # Pulse Width Averages.
-    la_avg = 0.0
-    cs_avg = 0.0
-    ss_avg = 0.0
+    # Log writer process (forked before any background thread starts).
+    telemetry = Telemetry.Telemetry(
+        PT_LOGFILE, PT_LOG_RING, TELEM_ADDRESS, TELEM_PROTOCOL,
+        TELEM_BANDWIDTH, PT_LOG_COMPACT, PT_LOG_QUOTA)
+    telemetry.start()
 
-    # Position Commands.
-    la_cmd = 1
-    la_cmd_hist = deque(
-        (1 for i in range(POS_HIST_NUM)), maxlen = POS_HIST_NUM)
+    # Real-time mode (inherited by every thread started from here on).
+    if RT_ENABLE:
+        for __failure in Realtime.enter(RT_PRIORITY, RT_CPUS):
+            print("Real-time mode: {} (skipped)".format(__failure))
 
-    cs_cmd = 1
-    cs_cmd_hist = deque(
-        (1 for i in range(POS_HIST_NUM)), maxlen = POS_HIST_NUM)
+    if STATS_ENABLE:
+        instrument()
 
-    ss_cmd = 1
-    ss_cmd_hist = deque(
-        (1 for i in range(POS_HIST_NUM)), maxlen = POS_HIST_NUM)
-
-    # Command Trends.
-    la_trend = 0
-    cs_trend = 0
-    ss_trend = 0
+    # Analog inputs (loads the ADC driver, which creates the IIO device
+    # read in buffered mode).
+    ADC.setup()
 
-    # Pressure Differential.
-    pt_diff = 0.0
+    # Buffered analog inputs (IIO continuous mode).
+    adc = None
+    if ADC_BUFFERED:
+        adc = Iio.BufferedADC([PIN_LA_POT, PIN_PT_IN])
+        adc.setup()
+        adc.install([Motion, Pressure, SRS])
+
+    # Raw hardware event recording (see ROV_SRS_Replay).
+    trace = None
+    if TRACE_FILE is not None:
+        trace = Trace.TraceWriter(TRACE_FILE)
+        trace.install([Capture, Motion, Pressure, SRS])
+        trace.start()
+
+    # Direct GPIO bank output, with the command tables precompiled into
+    # register masks (not seen by the trace).
+    if GPIO_BANK_DEV is not None:
+        GpioBank.GpioBanks(GPIO_BANK_DEV).install()
+        for __row in CHANNELS:
+            SRS.command_outputs(__row[4], __row[5])
+            SRS.command_outputs(__row[4][1:2], SRS.PIN_LEVELS)
+
+    # Actuator channel pins.
+    for __row in CHANNELS:
+        GPIO.setup(__row[3], GPIO.IN)
+        for __pin in __row[4]:
+            GPIO.setup(__pin, GPIO.OUT)
+
+    # RC Controller Pulse Width capture (all channels in parallel), each
+    # Pulse filtered and classified as it arrives.
+    capture = Capture.EdgeCapture(
+        [__row[3] for __row in CHANNELS],
+        PWM_WID_FREQ, PWM_WID_MAX, PWM_WID_MIN, PWM_WID_TOL,
+        learn = PWM_LEARN_NUM, window = PWM_FILTER_NUM,
+        trim = PWM_TRIM_NUM)
+
+    # Actuator channels: calibrations, Position Command trends, latest
+    # Commands and trends (for the log) and actuator drivers.
+    channels = Channels.Channels(
+        CHANNELS, capture, POS_HIST_NUM, POS_RELEASE_NUM, POS_DWELL_NUM)
+    channels.start()
+
+    # Pressure Transducer (sampled, converted to pressure and logged in
+    # the background).
+    pt_calibration = Calibration.PressureCalibration(
+        temperature = PT_WATER_TEMP)
+    SRS.pressure_calibration = pt_calibration
+    pt_sampler = Pressure.PressureSampler(
+        PIN_PT_IN, PT_LOG_FREQ, PT_OVERSAMPLE,
+        lambda t, diff: telemetry.ring.push(
+            t, diff, channels.commands, channels.trends),
+        calibration = pt_calibration)
+    pt_sampler.start()
+
+    capture.start()
+
+    def report():
+        print(scheduler.format_report())
+
+    def hold():
+        # Watchdog: force every actuator to its hold command.
+        channels.hold()
+
+    def timing():
+        now = clock.monotonic()
+        for stat in scheduler.report():
+            telemetry.ring.push_timing(now, stat)
 
     #
-    # Main program polling loop.
+    # Run the pipelines.
     #
-    while True:
-        #
-        # Linear Actuator polling.
-        #
-
-        # Determine Average Pulse Width.
-        la_avg = SRS.get_width(
-            PIN_LA_IN, PWM_AVG_NUM, PWM_WID_FREQ,
-            PWM_WID_MAX, PWM_WID_MIN, PWM_WID_TOL)
-
-        # Add new Position Command to History.
-        la_cmd = SRS.set_position(
-            la_avg,
-            PWM_WID_FREQ, PWM_WID_MAX, PWM_WID_MIN, PWM_WID_TOL)
-        if la_cmd is 1:
-            la_cmd = la_cmd_hist[POS_HIST_NUM - 1]
-        la_cmd_hist.append(la_cmd)
-
-        # Check for Position Command Persistance.
-        la_trend = SRS.check_trend(
-            la_cmd_hist,
-            LA_CONTINUOUS)
-
-        # Process Position Command.
-        SRS.move_linear(
-            la_trend,
-            PIN_LA_OUT, PIN_LA_POT, LA_STROKE_TARGET)
-
-        #
-        # Carousel Stepper polling.
-        #
-
-        # Determine Average Pulse Width.
-        cs_avg = SRS.get_width(
-            PIN_CS_IN, PWM_AVG_NUM, PWM_WID_FREQ,
-            PWM_WID_MAX, PWM_WID_MIN, PWM_WID_TOL)
-
-        # Add new Position Command to History.
-        cs_cmd = SRS.set_position(
-            cs_avg,
-            PWM_WID_FREQ, PWM_WID_MAX, PWM_WID_MIN, PWM_WID_TOL)
-        if cs_cmd is 1:
-            cs_cmd = cs_cmd_hist[POS_HIST_NUM - 1]
-        cs_cmd_hist.append(cs_cmd)
-
-        # Check for Position Command Persistance.
-        cs_trend = SRS.check_trend(
-            cs_cmd_hist,
-            CS_CONTINUOUS)
-
-        # Process Position Command.
-        SRS.move_carousel(
-            cs_trend,
-            PIN_CS_OUT, CS_GRIPPER_NUM)
-
-        #
-        # Shoulder Stepper polling.
-        #
-
-        # Determine Average Pulse Width.
-        ss_avg = SRS.get_width(
-            PIN_SS_IN, PWM_AVG_NUM, PWM_WID_FREQ,
-            PWM_WID_MAX, PWM_WID_MIN, PWM_WID_TOL)
-
-        # Add new Position Command to History.
-        ss_cmd_hist.append(SRS.set_position(
-            ss_avg,
-            PWM_WID_FREQ, PWM_WID_MAX, PWM_WID_MIN, PWM_WID_TOL))
-
-        # Check for Position Command Persistance.
-        ss_trend = SRS.check_trend(
-            ss_cmd_hist,
-            SS_CONTINUOUS)
-
-        # Process Position Command.
-        SRS.move_shoulder(
-            ss_trend,
-            PIN_SS_OUT)
-
-        #
-        # Pressure Transducer polling.
-        #
-
-        # Read Pressure value.
-        pt_diff = SRS.read_pressure(PIN_PT_IN)
-
-        # Save Pressure value to Log.
-        SRS.log_pressure(pt_diff)
\ No newline at end of file
+    scheduler = Scheduler.Scheduler(STATS)
+    STATS.sources = [
+        scheduler.format_report,
+        lambda: "telemetry.dropped {}".format(telemetry.dropped())]
+    for __name, __freq, __indices in channels.tasks():
+        scheduler.add(__name, __freq, functools.partial(
+            channels.step, __indices))
+    scheduler.add("report", 1.0/SCHED_REPORT_TIME, report,
+                  delay = SCHED_REPORT_TIME)
+    scheduler.add("telemetry", 1.0/TELEM_TIMING_TIME, timing,
+                  delay = TELEM_TIMING_TIME)
+
+    # Deadline watchdog (real-time mode).
+    watchdog = None
+    if RT_ENABLE:
+        watchdog = Realtime.Watchdog(
+            scheduler, hold, RT_WATCHDOG_GRACE,
+            priority = RT_PRIORITY + 1)
+        watchdog.start()
+        STATS.sources.append(
+            lambda: "watchdog.trips {}".format(watchdog.trips))
+        Realtime.freeze()
+
+    try:
+        scheduler.run()
+    finally:
+        if watchdog is not None:
+            watchdog.stop()
+        pt_sampler.stop()
+        SRS.pressure_calibration = None
+        telemetry.close()
+        STATS.close()
+        STATS.restore()
+        if trace is not None:
+            trace.close()
+        if adc is not None:
+            adc.uninstall()
+            adc.close()
@@ -0,0 +1,569 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Motion
+#
+#
+# Overview: Non-blocking motion control for the SRS Actuators. Moves are
+#     run as incremental state machines updated by a background Worker,
+#     or as coroutines for the ROV_SRS_Scheduler event loop, so the
+#     control pipelines keep servicing every channel while they run.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import asyncio
+import math
+import threading
+
+from ROV_SRS_Hardware import ADC
+from ROV_SRS_Hardware import GPIO
+from ROV_SRS_Hardware import Worker
+from ROV_SRS_Hardware import clock
+import ROV_SRS_Library as SRS
+
+#
+# Constant Definitions.
+#
+
+LA_SAMPLE_FREQ = 200.0      # Highest Potentiometer sample rate [Hz].
+LA_SAMPLE_TIME_MAX = 0.05   # Longest time between samples in a move [sec].
+LA_LOOKAHEAD = 0.5          # Sample interval, as a fraction of time-to-go.
+LA_MOVE_TIMEOUT = 2.5       # Longest Linear Actuator move [sec].
+
+# Linear Actuator position control.
+LA_POSITION_TOL = 0.01      # Settled position tolerance [normalized].
+LA_FILTER_GAIN = 0.5        # Position filter gain (alpha, 0 - 1).
+LA_SPEED_GAIN = 0.2         # Speed estimate gain (beta, 0 - 1).
+LA_SETTLE_TIME = 0.03       # Wait after stopping before measuring [sec].
+LA_CORRECT_GAIN = 0.8       # Correction pulse length per error [0 - 1].
+LA_CORRECT_NUM = 3          # Correction pulses per move.
+LA_OVERRUN_GAIN = 0.5       # Overrun estimate gain (0 - 1).
+
+# Linear Actuator motion states (Position Command driving the move).
+LA_EXTEND = 0
+LA_HOLD = 1
+LA_RETRACT = 2
+
+# Linear Actuator controller phases.
+_LA_IDLE = 0                # Holding, nothing to do.
+_LA_DRIVE = 1               # Driving, sampling the Potentiometer.
+_LA_STOP = 2                # Driving until the predicted arrival.
+_LA_SETTLE = 3              # Stopped, waiting to measure the position.
+
+# Stepper motion profiles.
+CS_STEP_RATE_MAX = 500.0    # Carousel top step rate [steps/sec].
+CS_STEP_RATE_MIN = 50.0     # Carousel start/stop step rate [steps/sec].
+CS_STEP_ACCEL = 2000.0      # Carousel acceleration [steps/sec^2].
+SS_STEP_RATE_MAX = 200.0    # Shoulder top jog rate [steps/sec].
+SS_STEP_RATE_MIN = 10.0     # Shoulder start/stop step rate [steps/sec].
+SS_STEP_ACCEL = 400.0       # Shoulder acceleration [steps/sec^2].
+
+STEP_IDLE_TIME = 0.005      # Target check period while stopped [sec].
+STEP_TRAVEL_MAX = 2**31     # Travel without soft end stops [steps].
+STEP_DIR_CW = GPIO.LOW      # "DIR" levels (see CS_COMMANDS/SS_COMMANDS).
+STEP_DIR_CCW = GPIO.HIGH
+
+# Command Library for the stepper "DIR" pin, by direction.
+STEP_DIR_COMMANDS = [[STEP_DIR_CW],         # Clockwise.
+                     [STEP_DIR_CCW]]        # Counter-Clockwise.
+
+# Command Library for the stepper "DIR" and "STEP" pins.
+STEP_RELEASE_COMMANDS = [[GPIO.LOW, GPIO.LOW]]  # Release the outputs.
+
+class LinearMotion(object):
+    """Closed-loop position control of the Linear Actuator.
+
+    The Linear Actuator driver is either on or off, so positions are
+    reached by timing the stop. While driving, the Potentiometer is
+    filtered (an alpha-beta filter on position and speed, seeded with
+    the rated LA_MAX_STROKE/LA_MAX_TIME speed), and the time-to-go to
+    the setpoint is predicted from the filtered position and speed. The
+    next sample is taken after a fraction (LA_LOOKAHEAD) of the
+    time-to-go, so samples are sparse far from the setpoint; once the
+    setpoint is due before the next sample, the stop is scheduled at the
+    predicted arrival instead of waiting for the limit to be crossed.
+    After stopping, the position is measured; the distance the shaft
+    ran on after the stop is learned (LA_OVERRUN_GAIN) and allowed for
+    in later stops. Any error over LA_POSITION_TOL is corrected with
+    drive pulses proportional to the error (LA_CORRECT_GAIN), up to
+    LA_CORRECT_NUM times.
+
+    update(), which start() runs in a background Worker, advances the
+    controller. A new setpoint pre-empts the move in progress, and may
+    reverse it.
+
+    BUG: Adafruit_BBIO ADC Library requires two read operations to
+    obtain an updated analog signal value. While driving, every read is
+    taken as the conversion from the previous read (and timed as such),
+    so one read per sample suffices. A fresh value is read twice. Neither
+    applies to a buffered ADC (ROV_SRS_Iio), whose reads are fresh.
+
+    Attributes:
+        state:      The current drive state (LA_EXTEND, LA_HOLD or
+                    LA_RETRACT).
+        setpoint:   The target position [normalized, 1.0 = fully
+                    extended].
+        position:   The filtered position estimate [normalized], or
+                    None before the first sample.
+        speed:      The estimated shaft speed [normalized/sec].
+        overrun:    The estimated run-on after a stop [normalized].
+        reads:      The number of Potentiometer reads taken.
+    """
+
+    def __init__(self, out, pot, stroke, freq=LA_SAMPLE_FREQ):
+        """Set up the move limits.
+
+        Args:
+            out:        An Array of Strings specifying the pin names on
+                        which the output signals should be sent.
+            pot:        A String specifying the pin name on which the
+                        input Potentiometer signal is expected.
+            stroke:     A Float specifying the stroke length desired
+                        for the shaft movement [inch].
+            freq:       A Float specifying the highest Potentiometer
+                        sample rate during moves [Hz].
+        """
+        self.out = list(out)
+        self.pot = pot
+        self._outputs = SRS.command_outputs(self.out, SRS.LA_COMMANDS)
+        self.state = LA_HOLD
+        self.setpoint = None
+        self.position = None
+        self.speed = 1.0/SRS.LA_MAX_TIME
+        self.overrun = 0.0
+        self.reads = 0
+        self._upper = 1.0
+        self._lower = 1.0 - stroke/SRS.LA_MAX_STROKE
+        self._period = 1.0/freq
+        self._phase = _LA_IDLE
+        self._wake = 0.0
+        self._deadline = 0.0
+        self._corrections = 0
+        self._sample_time = 0.0
+        self._read_time = None
+        self._stop_position = None
+        self._stop_direction = 0.0
+        self._lock = threading.Lock()
+        self._worker = Worker(self._run, name="LinearMotion")
+
+    def start(self):
+        """Measure the position and start the controller."""
+        with self._lock:
+            self._measure()
+        self._worker.start()
+
+    def stop(self):
+        """Stop the background updates and hold the Linear Actuator."""
+        self._worker.stop()
+        with self._lock:
+            self._drive(LA_HOLD)
+            self._phase = _LA_IDLE
+
+    def halt(self):
+        """Hold the Linear Actuator now, ending any move.
+
+        Safe to call from another thread while update() is stuck: the
+        outputs are driven to hold without waiting for the lock.
+        """
+        self._phase = _LA_IDLE
+        self._outputs.write(LA_HOLD)
+        self.state = LA_HOLD
+
+    def command(self, cmd):
+        """Enact a Position Command.
+
+        Args:
+            cmd:        The Position Command to enact.
+                        2  == Retract Linear Actuator (Open Gripper).
+                        1  == Continue the move in progress, if any.
+                        0  == Extend Linear Actuator (Close Gripper).
+                        -1 == Invalid signal, hold current Position.
+        """
+        if cmd < 0:
+            with self._lock:
+                self._drive(LA_HOLD)
+                self._phase = _LA_IDLE
+        elif cmd != LA_HOLD:
+            setpoint = self._upper if cmd == LA_EXTEND else self._lower
+            if not (self.busy() and self.setpoint == setpoint):
+                self.move_to(setpoint)
+
+    def move_to(self, setpoint):
+        """Start a move to any position.
+
+        Args:
+            setpoint:   A Float specifying the target position
+                        [normalized, 0.0 - 1.0, 1.0 = fully extended].
+        """
+        with self._lock:
+            now = clock.monotonic()
+            self.setpoint = min(max(setpoint, 0.0), 1.0)
+            self._deadline = now + LA_MOVE_TIMEOUT
+            self._corrections = 0
+
+            error = None
+            if self.position is not None:
+                error = self.setpoint - self._estimate(now)
+            if error is None or abs(error) <= LA_POSITION_TOL:
+                # Measure first (the ADC is read by update() only).
+                self._drive(LA_HOLD)
+                self._phase = _LA_SETTLE
+                self._wake = now
+                return
+
+            self._drive(LA_EXTEND if error > 0.0 else LA_RETRACT)
+            self._phase = _LA_DRIVE
+            self._wake = now
+
+    def busy(self):
+        """Return True while a move is in progress."""
+        return self._phase != _LA_IDLE
+
+    def update(self):
+        """Advance the controller.
+
+        Returns:
+            delay:      The time until the next update is due [sec].
+        """
+        with self._lock:
+            now = clock.monotonic()
+            if self._phase == _LA_IDLE:
+                return self._period
+            if now < self._wake:
+                return self._wake - now
+            if now >= self._deadline:
+                self._drive(LA_HOLD)
+                self._phase = _LA_IDLE
+                return self._period
+
+            if self._phase == _LA_DRIVE:
+                delay = self._sample(now)
+            elif self._phase == _LA_STOP:
+                delay = self._stop()
+            else:
+                delay = self._settle(now)
+
+            self._wake = now + delay
+            return delay
+
+    def _sample(self, now):
+        # The read returns the conversion of the previous read.
+        measured = self._read_time
+        value = self._read()
+        if value is None:
+            # No conversion yet (see _measure()): sample again later.
+            return self._period
+        if getattr(ADC, "fresh", False):
+            measured = self._read_time
+        direction = 1.0 if self.state == LA_EXTEND else -1.0
+
+        predicted = self._estimate(measured)
+        residual = value - predicted
+        elapsed = measured - self._sample_time
+        self.position = predicted + LA_FILTER_GAIN*residual
+        if elapsed > 0.0:
+            self.speed = max(self.speed + LA_SPEED_GAIN*direction
+                             *residual/elapsed, 0.1/SRS.LA_MAX_TIME)
+        self._sample_time = measured
+
+        remaining = ((self.setpoint - self._estimate(now))*direction
+                     - self.overrun)
+        if remaining <= 0.0:
+            # Overshot: stop now.
+            return self._stop()
+
+        to_go = remaining/self.speed
+        if to_go <= self._period:
+            self._phase = _LA_STOP
+            return to_go
+        return min(max(LA_LOOKAHEAD*to_go, self._period),
+                   LA_SAMPLE_TIME_MAX)
+
+    def _stop(self):
+        direction = 1.0 if self.state == LA_EXTEND else -1.0
+        self._drive(LA_HOLD)
+        self._stop_position = self.position
+        self._stop_direction = direction
+        self._phase = _LA_SETTLE
+        return LA_SETTLE_TIME
+
+    def _settle(self, now):
+        self._measure()
+        if self.position is None:
+            # Nothing measured yet: hold until the timeout.
+            return self._period
+        if self._stop_position is not None:
+            overrun = (self.position - self._stop_position)*(
+                self._stop_direction)
+            self.overrun = max(self.overrun + LA_OVERRUN_GAIN
+                               *(overrun - self.overrun), 0.0)
+            self._stop_position = None
+        error = self.setpoint - self.position
+        if (abs(error) <= LA_POSITION_TOL
+                or self._corrections >= LA_CORRECT_NUM):
+            self._phase = _LA_IDLE
+            return self._period
+
+        self._drive(LA_EXTEND if error > 0.0 else LA_RETRACT)
+        pulse = LA_CORRECT_GAIN*max(abs(error) - self.overrun,
+                                    0.0)/self.speed
+        if pulse > LA_SAMPLE_TIME_MAX:
+            # Far off (e.g. a first move): drive under feedback.
+            self._phase = _LA_DRIVE
+            return self._period
+
+        # Proportional correction pulse.
+        self._corrections += 1
+        self._phase = _LA_STOP
+        return pulse
+
+    def _estimate(self, t):
+        # Filtered position extrapolated to time t (the shaft is taken
+        # to be still before the last sample or drive change).
+        elapsed = max(t - self._sample_time, 0.0)
+        if self.state == LA_EXTEND:
+            return self.position + self.speed*elapsed
+        elif self.state == LA_RETRACT:
+            return self.position - self.speed*elapsed
+        return self.position
+
+    def _read(self):
+        value = ADC.read(self.pot)
+        self._read_time = clock.monotonic()
+        self.reads += 1
+        return value
+
+    def _measure(self):
+        # BUG: Adafruit_BBIO ADC Library requires two read operations
+        # to obtain an updated analog signal value.
+        # A buffered ADC returns None before its first scan; the
+        # position is then left unknown (None).
+        if not getattr(ADC, "fresh", False):
+            self._read()
+        value = self._read()
+        if value is not None:
+            self.position = value
+            self._sample_time = self._read_time
+
+    def _drive(self, state):
+        if state != self.state and self.position is not None:
+            # Rebase the estimate on the drive change.
+            now = clock.monotonic()
+            self.position = self._estimate(now)
+            self._sample_time = now
+        self._outputs.write(state)
+        self.state = state
+
+    def _run(self):
+        while True:
+            yield self.update()
+
+class StepperEngine(object):
+    """Background step generator with trapezoidal speed ramps.
+
+    Step pulses are generated by a background Worker. Moves start and
+    end at rate_min and accelerate at accel up to rate_max, decelerating
+    in time to stop on the target. The target may be changed at any time,
+    including during a move. Position is tracked in absolute steps from
+    the position at start-up (Clockwise positive).
+
+    In velocity mode (jog()), the stepper runs continuously at a signed
+    step rate, reached at accel, until the rate is changed or a soft end
+    stop is reached (decelerating in time to stop on it). Targets are
+    always kept within the soft end stops.
+
+    Attributes:
+        out:        The "DIR" and "STEP" pin names.
+        position:   The absolute position [steps].
+        target:     The absolute target position [steps].
+        steps:      The total number of steps generated.
+        limits:     The soft end stops [steps], (lowest, highest).
+        rate_limit: The top step rate of the current move [steps/sec].
+    """
+
+    def __init__(self, out, step_angle, rate_max, rate_min, accel,
+                 limits=None):
+        """Set up the motion profile.
+
+        Args:
+            out:        An Array of Strings specifying the "DIR" and
+                        "STEP" pin names.
+            step_angle: A Float specifying the motor step angle [degrees].
+            rate_max:   A Float specifying the top step rate [steps/sec].
+            rate_min:   A Float specifying the start/stop step rate
+                        [steps/sec].
+            accel:      A Float specifying the acceleration
+                        [steps/sec^2].
+            limits:     A (lowest, highest) Tuple specifying the soft end
+                        stops [steps from the start-up position], or
+                        None for unlimited travel.
+        """
+        self.out = list(out)
+        self._dir = SRS.command_outputs(self.out[:1], STEP_DIR_COMMANDS)
+        self._step = SRS.command_outputs(self.out[1:2], SRS.PIN_LEVELS)
+        self._release = SRS.command_outputs(self.out, STEP_RELEASE_COMMANDS)
+        self.steps_per_rev = int(round(360.0/step_angle))
+        self.rate_max = rate_max
+        self.rate_min = rate_min
+        self.accel = accel
+        if limits is None:
+            limits = (-STEP_TRAVEL_MAX, STEP_TRAVEL_MAX)
+        self.limits = (int(limits[0]), int(limits[1]))
+        self.rate_limit = rate_max
+        self.position = 0
+        self.target = 0
+        self.steps = 0
+        self._direction = 0
+        self._rate = 0.0
+        self._lock = threading.Lock()
+        self._worker = Worker(self._run, name="StepperEngine")
+
+    def start(self):
+        """Start the background step generator."""
+        self._worker.start()
+
+    def stop(self):
+        """Stop the step generator (abruptly) and release the outputs."""
+        self._worker.stop()
+        self._release.write(0)
+
+    def halt(self):
+        """Stop stepping now (without a ramp) and hold in place."""
+        with self._lock:
+            self.target = self.position
+            self._direction = 0
+            self._rate = 0.0
+            self._release.write(0)
+
+    def move_to(self, target):
+        """Set a new absolute target position [steps]."""
+        with self._lock:
+            self._move(target)
+
+    def move_by(self, steps):
+        """Move the target by a number of steps (Clockwise positive)."""
+        with self._lock:
+            self._move(self.target + int(steps))
+
+    def index(self, gripper):
+        """Advance the target to the next of gripper evenly spaced slots."""
+        with self._lock:
+            slot = math.floor(self.target*gripper/float(self.steps_per_rev)
+                              + 1e-9)
+            self._move(round((slot + 1)*self.steps_per_rev/float(gripper)))
+
+    def jog(self, rate):
+        """Run continuously at a signed step rate (velocity mode).
+
+        Args:
+            rate:       A Float specifying the step rate [steps/sec],
+                        Clockwise positive, limited to rate_max. Rates
+                        below rate_min stop the stepper (with a ramp).
+        """
+        speed = min(abs(rate), self.rate_max)
+        with self._lock:
+            if speed < self.rate_min:
+                # Stop as soon as the deceleration allows.
+                self.target = self._clamp(
+                    self.position + self._direction
+                    *int(math.ceil(self._stop_steps(self._rate))))
+                return
+
+            # Run to the soft end stop; the profile decelerates in time
+            # to stop on it (see _next_rate()).
+            self.rate_limit = speed
+            self.target = self.limits[1] if rate > 0.0 else self.limits[0]
+
+    def busy(self):
+        """Return True while the stepper is moving or has steps to go."""
+        return self._direction != 0 or self.target != self.position
+
+    def angle(self):
+        """Return the current angle [degrees, 0 - 360]."""
+        return (self.position*360.0/self.steps_per_rev) % 360.0
+
+    def _clamp(self, target):
+        return min(max(int(target), self.limits[0]), self.limits[1])
+
+    def _move(self, target):
+        self.rate_limit = self.rate_max
+        self.target = self._clamp(target)
+
+    def _stop_steps(self, rate):
+        # Steps needed to decelerate from rate to rate_min.
+        return max((rate*rate - self.rate_min*self.rate_min)
+                   /(2.0*self.accel), 0.0)
+
+    def _next_rate(self):
+        # Rate of the next step, or 0.0 when there is none (lock held).
+        # Each step changes the squared rate by 2*accel at most, and is
+        # only taken at a rate that can still stop within the steps left
+        # after it, so a reachable target is never overrun.
+        rate = self._rate
+        if self._direction != 0:
+            ahead = (self.target - self.position)*self._direction
+            if ahead > 0 or self._stop_steps(rate) > 1.0:
+                up = min(math.sqrt(rate*rate + 2.0*self.accel),
+                         self.rate_limit)
+                down = math.sqrt(max(rate*rate - 2.0*self.accel,
+                                     self.rate_min*self.rate_min))
+                if self._stop_steps(up) <= ahead - 1:
+                    rate = max(up, down)
+                elif (rate > self.rate_limit
+                      or self._stop_steps(rate) > ahead - 1):
+                    rate = down
+                self._rate = rate
+                return rate
+
+            # Arrived (within one step of the start/stop rate).
+            self._direction = 0
+            self._rate = 0.0
+
+        remaining = self.target - self.position
+        if remaining == 0:
+            return 0.0
+
+        # Start a new move.
+        self._direction = 1 if remaining > 0 else -1
+        self._dir.write(0 if self._direction > 0 else 1)
+        self._rate = self.rate_min
+        return self._rate
+
+    def _run(self):
+        while True:
+            # The step is decided and counted under the lock, so halt()
+            # and new targets never interleave with it.
+            with self._lock:
+                rate = self._next_rate()
+                if rate:
+                    # Pulse "STEP" (rising edge).
+                    self._step.write(1)
+                    self.position += self._direction
+                    self.steps += 1
+            if not rate:
+                yield STEP_IDLE_TIME
+                continue
+
+            # Half a step period each level.
+            yield 0.5/rate
+            self._step.write(0)
+            yield 0.5/rate
+
+async def move_shoulder_async(cmd, out):
+    """Move the Shoulder Stepper without blocking the event loop.
+
+    Awaitable counterpart of SRS.move_shoulder(). Refer to
+    SRS.move_shoulder() for the arguments.
+    """
+    if cmd == 2 or cmd == 0:
+        SRS.command_outputs(out, SRS.SS_COMMANDS).write(cmd)
+        await asyncio.sleep(SRS.SS_DRIVE_STEP_PERSIST)
+
+        SRS.command_outputs(out[1:2], SRS.PIN_LEVELS).write(0)
+        await asyncio.sleep(SRS.SS_DRIVE_STEP_PERSIST)
+
+    else:
+        # Hold Shoulder Stepper at desired Position.
+        SRS.command_outputs(out, SRS.SS_COMMANDS).write(1)
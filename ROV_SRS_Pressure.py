@@ -0,0 +1,168 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Pressure
+#
+#
+# Overview: Fixed-rate pressure transducer acquisition, decoupled from
+#     the control loop. The transducer is oversampled at evenly spaced
+#     times by a background Worker and decimated with an averaging
+#     filter into a lower-noise series at a guaranteed rate.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+from ROV_SRS_Hardware import ADC
+from ROV_SRS_Hardware import Worker
+from ROV_SRS_Hardware import clock
+
+#
+# Constant Definitions.
+#
+
+PT_OVERSAMPLE = 16          # ADC reads averaged per output sample.
+
+class PressureSampler(object):
+    """Oversampled, fixed-rate acquisition of the pressure transducer.
+
+    The ADC is read at freq*oversample by a background Worker, on an
+    absolute schedule (no drift). Every block of oversample reads is
+    averaged (a boxcar filter, whose nulls at multiples of freq reject
+    aliases) into one output sample, passed to callback(t, value).
+
+    BUG: Adafruit_BBIO ADC Library requires two read operations to
+    obtain an updated analog signal value. With evenly spaced reads,
+    each read returns the previous read's conversion, so the workaround
+    is applied once per acquisition run (the first read is discarded)
+    and timestamps are shifted back one read period.
+
+    With a buffered ADC (ROV_SRS_Iio), the ADC converts continuously on
+    its own: each output sample, every 1/freq, is the average of all the
+    conversions made since the previous one, read in bulk.
+
+    Attributes:
+        count:      The number of output samples produced.
+        overruns:   The number of reads that fell behind schedule.
+    """
+
+    def __init__(self, pin, freq, oversample=PT_OVERSAMPLE, callback=None,
+                 calibration=None):
+        """Set up the acquisition.
+
+        Args:
+            pin:        A String specifying the pin name on which the
+                        pressure sensor signal is expected.
+            freq:       A Float specifying the output sample rate [Hz].
+            oversample: An Integer specifying the ADC reads averaged
+                        per output sample.
+            callback:   A callable run as callback(t, value) with each
+                        output sample (monotonic time [sec], value), or
+                        None.
+            calibration: A ROV_SRS_Calibration PressureCalibration
+                        converting the output samples to pressure [psi],
+                        or None to keep the normalized values.
+        """
+        self.pin = pin
+        self.freq = float(freq)
+        self.oversample = oversample
+        self.callback = callback
+        self.calibration = calibration
+        self.count = 0
+        self.overruns = 0
+        self._latest = (None, 0.0)
+        self._buffered = False
+        self._worker = Worker(self._run, name="PressureSampler")
+
+    def start(self):
+        """Start the background acquisition."""
+        self._worker.start()
+
+    def stop(self):
+        """Stop the background acquisition."""
+        self._worker.stop()
+
+    def latest(self):
+        """Return the newest output sample as (time [sec], value)."""
+        return self._latest
+
+    def read(self):
+        """Read the transducer conversions due now.
+
+        Returns:
+            total:      The sum of the readings [normalized].
+            count:      The number of readings: 1, or with a buffered ADC,
+                        all the conversions made since the last read.
+        """
+        if self._buffered:
+            return ADC.take(self.pin)
+        return ADC.read(self.pin), 1
+
+    def _run(self):
+        self._buffered = hasattr(ADC, "take")
+        if self._buffered:
+            yield from self._run_buffered()
+            return
+
+        period = 1.0/(self.freq*self.oversample)
+
+        # Discard the stale conversion left from before this run.
+        self.read()
+
+        due = clock.monotonic()
+        total = 0.0
+        reads = 0
+        while True:
+            total += self.read()[0]
+            reads += 1
+
+            if reads == self.oversample:
+                # Centre of the block's conversions (one read behind).
+                t = due - period*(self.oversample + 1)/2.0
+                value = total/reads
+                if self.calibration is not None:
+                    value = self.calibration.convert(value)
+                self._latest = (t, value)
+                self.count += 1
+                if self.callback is not None:
+                    self.callback(t, value)
+                total = 0.0
+                reads = 0
+
+            due += period
+            delay = due - clock.monotonic()
+            if delay < 0.0:
+                # Fell behind: keep the spacing, restart the schedule.
+                self.overruns += 1
+                due -= delay
+                delay = 0.0
+            yield delay
+
+    def _run_buffered(self):
+        period = 1.0/self.freq
+
+        # Discard the conversions made before this run.
+        self.read()
+
+        due = clock.monotonic()
+        while True:
+            due += period
+            delay = due - clock.monotonic()
+            if delay < 0.0:
+                self.overruns += 1
+                due -= delay
+                delay = 0.0
+            yield delay
+
+            total, count = self.read()
+            if count == 0:
+                continue
+            # Centre of the conversions since the last output sample.
+            t = clock.monotonic() - period/2.0
+            value = total/count
+            if self.calibration is not None:
+                value = self.calibration.convert(value)
+            self._latest = (t, value)
+            self.count += 1
+            if self.callback is not None:
+                self.callback(t, value)
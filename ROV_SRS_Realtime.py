@@ -0,0 +1,196 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Realtime
+#
+#
+# Overview: Real-time execution support for main() (Linux). enter()
+#     moves the control process to the SCHED_FIFO scheduling class,
+#     pins it to a set of CPUs and locks its memory, with the heap grown
+#     and faulted in up front so the loop never waits on a page fault;
+#     threads started afterwards inherit all of it. freeze() moves the
+#     objects created during set-up out of reach of the garbage
+#     collector before the loop starts.
+#
+#     The Watchdog enforces the deadline of every ROV_SRS_Scheduler task
+#     from a background Worker of higher priority. When a cycle overruns
+#     its deadline (e.g. a stage hangs), the outputs are forced to the
+#     hold commands instead of being left in their last state.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import ctypes
+import ctypes.util
+import gc
+import os
+
+from ROV_SRS_Hardware import Worker
+from ROV_SRS_Hardware import clock
+
+#
+# Constant Definitions.
+#
+
+RT_PRIORITY = 40                # Default SCHED_FIFO priority (1 - 99).
+RT_HEAP_RESERVE = 8*1024*1024   # Heap grown and locked up front [bytes].
+RT_WATCHDOG_TIME = 0.005        # Watchdog check period [sec].
+RT_WATCHDOG_GRACE = 0.010       # Default allowed deadline overrun [sec].
+
+# Linux mlockall() flags and glibc mallopt() parameters.
+_MCL_CURRENT = 1
+_MCL_FUTURE = 2
+_M_TRIM_THRESHOLD = -1
+_M_MMAP_MAX = -4
+
+def _libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.malloc.restype = ctypes.c_void_p
+    libc.free.argtypes = [ctypes.c_void_p]
+    return libc
+
+def enter(priority=RT_PRIORITY, cpus=None, lock=True,
+          reserve=RT_HEAP_RESERVE):
+    """Switch the calling process to real-time execution.
+
+    Each step is applied independently; a step which is not permitted
+    (e.g. without root privileges) is reported and skipped.
+
+    Args:
+        priority:   An Integer specifying the SCHED_FIFO priority, or
+                    None to keep the scheduling class.
+        cpus:       A List of the CPU numbers to run on, or None for all.
+        lock:       A Boolean enabling memory locking.
+        reserve:    An Integer specifying the heap to grow and lock up
+                    front [bytes].
+
+    Returns:
+        failures:   A List of Strings describing the steps not applied.
+    """
+    failures = []
+
+    if cpus is not None:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except (AttributeError, OSError) as error:
+            failures.append("CPU affinity: {}".format(error))
+
+    if priority is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO,
+                                  os.sched_param(priority))
+        except (AttributeError, OSError) as error:
+            failures.append("SCHED_FIFO: {}".format(error))
+
+    if lock:
+        try:
+            libc = _libc()
+            # Keep freed heap memory (no trimming, no mmap chunks), so
+            # the reserve stays mapped and locked once released.
+            libc.mallopt(_M_TRIM_THRESHOLD, -1)
+            libc.mallopt(_M_MMAP_MAX, 0)
+            heap = libc.malloc(reserve)
+            if libc.mlockall(_MCL_CURRENT | _MCL_FUTURE) != 0:
+                failures.append("mlockall: {}".format(
+                    os.strerror(ctypes.get_errno())))
+            if heap:
+                ctypes.memset(heap, 0, reserve)
+                libc.free(heap)
+        except (AttributeError, OSError) as error:
+            failures.append("memory locking: {}".format(error))
+
+    return failures
+
+def freeze():
+    """Collect, then exempt all current objects from garbage collection.
+
+    Call once set-up is complete, just before the loop starts, so the
+    collector only ever scans the objects created by the loop itself.
+    """
+    gc.collect()
+    gc.freeze()
+
+def boost(priority):
+    """Set the SCHED_FIFO priority of the calling thread.
+
+    Returns:
+        applied:    False if it is not permitted.
+    """
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except (AttributeError, OSError):
+        return False
+    return True
+
+class Watchdog(object):
+    """Forces the hold commands when a Scheduler task misses its deadline.
+
+    A cycle misses its deadline when it has not completed deadline +
+    grace after its release. hold() is then called once for that cycle,
+    from the Watchdog's own Worker, so it must not wait on anything the
+    hung cycle may hold.
+
+    Attributes:
+        trips:      The number of deadline misses acted on.
+        last:       The name of the task which missed last, or None.
+    """
+
+    def __init__(self, scheduler, hold, grace=RT_WATCHDOG_GRACE,
+                 period=RT_WATCHDOG_TIME, priority=None):
+        """Set up the watchdog.
+
+        Args:
+            scheduler:  The ROV_SRS_Scheduler Scheduler to watch.
+            hold:       A callable forcing all outputs to hold.
+            grace:      A Float specifying the allowed overrun [sec].
+            period:     A Float specifying the check period [sec].
+            priority:   An Integer specifying the SCHED_FIFO priority of
+                        the Worker, or None to inherit it.
+        """
+        self.scheduler = scheduler
+        self.hold = hold
+        self.grace = grace
+        self.period = period
+        self.priority = priority
+        self.trips = 0
+        self.last = None
+        self._tripped = {}
+        self._worker = Worker(self._run, name="Watchdog")
+
+    def start(self):
+        """Start watching."""
+        self._worker.start()
+
+    def stop(self):
+        """Stop watching."""
+        self._worker.stop()
+
+    def check(self):
+        """Check every task once, holding on a missed deadline.
+
+        Returns:
+            tripped:    True if hold() was called.
+        """
+        now = clock.monotonic()
+        tripped = False
+        for task in self.scheduler.tasks:
+            release = task.pending
+            if (release is None
+                    or now - release <= task.deadline + self.grace
+                    or self._tripped.get(task.name) == release):
+                continue
+            self._tripped[task.name] = release
+            self.trips += 1
+            self.last = task.name
+            tripped = True
+        if tripped:
+            self.hold()
+        return tripped
+
+    def _run(self):
+        if self.priority is not None:
+            boost(self.priority)
+        while True:
+            yield self.period
+            self.check()
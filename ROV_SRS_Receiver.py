@@ -0,0 +1,185 @@
+#!/usr/bin/python
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Receiver
+#
+#
+# Overview: Topside receiver for the telemetry stream of ROV_SRS_Telemetry
+#     (set TELEM_ADDRESS in ROV_SRS_Main.py). Listens on UDP or TCP,
+#     prints the pressure, Position Commands and trends live along with
+#     the task timing of the control loop, counts frames lost on the
+#     tether from gaps in the sequence numbers, and optionally records
+#     the raw frames to a file which can be printed again later.
+#
+# Usage:    python ROV_SRS_Receiver.py --udp 5005 -o dive.telem
+#           python ROV_SRS_Receiver.py --tcp 5005
+#           python ROV_SRS_Receiver.py --read dive.telem
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import argparse
+import os
+import socket
+import sys
+import time
+
+os.environ.setdefault("ROV_SRS_BACKEND", "sim")
+
+import ROV_SRS_Telemetry as Telemetry
+
+#
+# Constant Definitions.
+#
+
+RX_BUFFER = 65536           # Largest datagram received [bytes].
+
+class Receiver(object):
+    """Decodes telemetry frames, tracking sequence gaps.
+
+    Attributes:
+        frames:     The number of frames received.
+        lost:       The number of frames missing from the sequence.
+        records:    The number of records received.
+    """
+
+    def __init__(self, out=None, record=None):
+        """Set up the receiver.
+
+        Args:
+            out:        A text file to print the records to (stdout by
+                        default).
+            record:     A binary file to append the raw frames to, or
+                        None.
+        """
+        self.out = sys.stdout if out is None else out
+        self.record = record
+        self.frames = 0
+        self.lost = 0
+        self.records = 0
+        self._next = None
+
+    def frame(self, data):
+        """Decode and print one frame (invalid frames are ignored)."""
+        try:
+            seq, sent, records = Telemetry.decode_frame(data)
+        except ValueError:
+            return
+        if self.record is not None:
+            self.record.write(data)
+
+        if self._next is not None and seq != self._next:
+            self.lost += (seq - self._next) & 0xFFFFFFFF
+            self.out.write("# lost {} frame(s)\n".format(
+                (seq - self._next) & 0xFFFFFFFF))
+        self._next = (seq + 1) & 0xFFFFFFFF
+        self.frames += 1
+        self.records += len(records)
+
+        for raw in records:
+            kind, fields = Telemetry.decode_record(raw)
+            if kind == Telemetry.TELEM_SAMPLE:
+                t, pressure, commands, trends = fields
+                self.out.write(
+                    "{}  P {:.5f}  cmd {:>2} {:>2} {:>2}  "
+                    "trend {:>2} {:>2} {:>2}  age {:.2f} s\n".format(
+                        _clock(t), pressure, *commands, *trends,
+                        time.time() - t))
+            elif kind == Telemetry.TELEM_TIMING:
+                t, period, latency, name, misses = fields
+                self.out.write("{}  task {:<4} period p99 {:.2f} ms  "
+                               "latency p99 {:.2f} ms  misses {}\n".format(
+                    _clock(t), name, 1e3*period, 1e3*latency, misses))
+        self.out.flush()
+
+def _clock(t):
+    return time.strftime("%H:%M:%S", time.localtime(t)) + (
+        "{:.2f}".format(t % 1.0)[1:])
+
+def _read_frames(stream):
+    # Split a byte stream (TCP connection or recording) into frames.
+    while True:
+        header = stream.read(Telemetry.FRAME_HEADER_SIZE)
+        if len(header) < Telemetry.FRAME_HEADER_SIZE:
+            return
+        size = Telemetry.frame_size(header)
+        body = stream.read(size - len(header))
+        if len(body) < size - len(header):
+            return
+        yield header + body
+
+def receive_udp(receiver, port, host=""):
+    """Receive frames on a UDP port until interrupted."""
+    __sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    __sock.bind((host, port))
+    try:
+        while True:
+            receiver.frame(__sock.recv(RX_BUFFER))
+    finally:
+        __sock.close()
+
+def receive_tcp(receiver, port, host=""):
+    """Accept TCP connections (one at a time) until interrupted."""
+    __server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    __server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    __server.bind((host, port))
+    __server.listen(1)
+    try:
+        while True:
+            __conn, __addr = __server.accept()
+            receiver.out.write("# connected {}:{}\n".format(*__addr))
+            with __conn, __conn.makefile("rb") as __stream:
+                try:
+                    for __frame in _read_frames(__stream):
+                        receiver.frame(__frame)
+                except ValueError:
+                    pass        # Out of step; wait for a reconnection.
+            receiver.out.write("# disconnected\n")
+    finally:
+        __server.close()
+
+def main():
+    __parser = argparse.ArgumentParser(
+        description="Receive, print and record the ROV SRS telemetry "
+                    "stream.")
+    __source = __parser.add_mutually_exclusive_group(required=True)
+    __source.add_argument("--udp", type=int, metavar="PORT",
+        help="listen for UDP frames on PORT")
+    __source.add_argument("--tcp", type=int, metavar="PORT",
+        help="accept a TCP stream on PORT")
+    __source.add_argument("--read", metavar="FILE",
+        help="print a recording made with -o")
+    __parser.add_argument("--host", default="",
+        help="address to listen on (default: all)")
+    __parser.add_argument("-o", "--output", metavar="FILE",
+        help="append the raw frames received to FILE")
+    __args = __parser.parse_args()
+
+    __record = None
+    if __args.output is not None:
+        __record = open(__args.output, "ab", buffering=0)
+    __receiver = Receiver(record = __record)
+
+    try:
+        if __args.read is not None:
+            with open(__args.read, "rb") as __stream:
+                for __frame in _read_frames(__stream):
+                    __receiver.frame(__frame)
+        elif __args.udp is not None:
+            receive_udp(__receiver, __args.udp, __args.host)
+        else:
+            receive_tcp(__receiver, __args.tcp, __args.host)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if __record is not None:
+            __record.close()
+
+    sys.stderr.write("{} frames, {} records, {} frames lost\n".format(
+        __receiver.frames, __receiver.records, __receiver.lost))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Replay
+#
+#
+# Overview: Replays a trace recorded by ROV_SRS_Trace through main() on
+#     the simulator, as fast as possible. The recorded input edges drive
+#     the RC inputs and the recorded ADC reads drive the analog inputs;
+#     the resulting actuator command stream (output level changes) is
+#     written as text, so the behaviour of two versions of the control
+#     code can be compared with diff. The throughput (simulated seconds
+#     per host CPU second) is reported on stderr.
+#
+# Usage:    python ROV_SRS_Replay.py dive.trace -o replay.txt
+#           python ROV_SRS_Replay.py dive.trace --recorded -o dive.txt
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import argparse
+from bisect import bisect_right
+import os
+import sys
+import time
+
+os.environ["ROV_SRS_BACKEND"] = "sim"
+
+import ROV_SRS_Bench as Bench
+import ROV_SRS_Main as Main
+import ROV_SRS_Trace as Trace
+from ROV_SRS_Sim import FALLING
+from ROV_SRS_Sim import HIGH
+from ROV_SRS_Sim import LOW
+from ROV_SRS_Sim import RISING
+from ROV_SRS_Sim import SIM
+from ROV_SRS_Sim import SimulationEnd
+
+class EdgeTrace(object):
+    """A recorded input signal, shaped like ROV_SRS_Sim.PwmSource."""
+
+    def __init__(self, clock, times, levels):
+        self._clock = clock
+        self._times = times
+        self._levels = levels
+
+    def flat(self):
+        return bisect_right(self._times, self._clock.now) >= len(self._times)
+
+    def level(self, t):
+        index = bisect_right(self._times, t) - 1
+        if index < 0:
+            return LOW if self._levels and self._levels[0] == HIGH else HIGH
+        return self._levels[index]
+
+    def next_edge(self, t, edge):
+        """Return the time of the first matching edge after t.
+
+        Returns None once the trace holds no further edges at all.
+        """
+        index = bisect_right(self._times, t)
+        if index >= len(self._times):
+            return None
+        for index in range(index, len(self._times)):
+            level = self._levels[index]
+            if (edge == RISING and level == HIGH
+                    or edge == FALLING and level == LOW
+                    or edge not in (RISING, FALLING)):
+                return self._times[index]
+        return float("inf")
+
+class SampleTrace(object):
+    """Recorded ADC reads, held between reads (a callable of time)."""
+
+    def __init__(self, times, values):
+        self._times = times
+        self._values = values
+
+    def __call__(self, t):
+        index = bisect_right(self._times, t) - 1
+        return self._values[max(index, 0)]
+
+def load(path):
+    """Read a trace and group its events by kind and pin.
+
+    Returns:
+        start:      The time of the first event [ns].
+        end:        The time of the last event [ns].
+        signals:    A Dict mapping (kind, pin) to Lists of times [sec
+                    since start] and of values.
+    """
+    events = Trace.read_trace(path)
+    if not events:
+        raise ValueError("Empty trace: {}".format(path))
+
+    start = events[0][0]
+    signals = {}
+    for t, kind, pin, value in events:
+        times, values = signals.setdefault((kind, pin), ([], []))
+        times.append((t - start)/1e9)
+        values.append(value)
+    return start, events[-1][0], signals
+
+def replay(path):
+    """Run main() against a recorded trace.
+
+    Returns:
+        commands:   A List of (time [sec], pin, level) output changes.
+        duration:   The simulated duration [sec].
+        cpu:        The host CPU time spent [sec].
+    """
+    start, end, signals = load(path)
+    duration = (end - start)/1e9
+
+    SIM.reset(duration)
+    SIM.adc.stale = False       # The recorded reads are already stale.
+    for (kind, pin), (times, values) in signals.items():
+        if kind == Trace.TRACE_EDGE:
+            SIM.gpio.sources[pin] = EdgeTrace(
+                SIM.clock, times, [int(value) for value in values])
+        elif kind == Trace.TRACE_ADC:
+            SIM.adc.sources[pin] = SampleTrace(times, values)
+
+    cpu = time.process_time()
+    with Bench.workdir():
+        try:
+            Main.main()
+        except SimulationEnd:
+            pass
+    cpu = time.process_time() - cpu
+
+    return list(SIM.gpio.log), duration, cpu
+
+def recorded(path):
+    """Return the output changes recorded in a trace, like replay().
+
+    Outputs are taken to start LOW, as set up by main().
+    """
+    start, end, signals = load(path)
+    commands = []
+    last = {}
+    for (kind, pin), (times, values) in signals.items():
+        if kind != Trace.TRACE_OUT:
+            continue
+        for t, value in zip(times, values):
+            if last.get(pin, LOW) != value:
+                commands.append((t, pin, int(value)))
+                last[pin] = value
+    commands.sort()
+    return commands
+
+def main():
+    __parser = argparse.ArgumentParser(
+        description="Replay an ROV SRS trace through main() on the "
+                    "simulator and print the actuator command stream.")
+    __parser.add_argument("trace", help="trace file (see ROV_SRS_Trace)")
+    __parser.add_argument("-o", "--output", metavar="FILE",
+        help="write the command stream to FILE instead of stdout")
+    __parser.add_argument("--recorded", action="store_true",
+        help="print the command stream recorded in the trace instead")
+    __args = __parser.parse_args()
+
+    if __args.recorded:
+        __commands = recorded(__args.trace)
+    else:
+        __commands, __duration, __cpu = replay(__args.trace)
+        sys.stderr.write(
+            "replayed {:.1f} s in {:.2f} s CPU ({:.0f}x real time)\n".format(
+                __duration, __cpu, __duration/max(__cpu, 1e-9)))
+
+    __out = sys.stdout if __args.output is None else open(__args.output, "w")
+    for __t, __pin, __level in __commands:
+        __out.write("{:.6f}\t{}\t{}\n".format(__t, __pin, __level))
+    if __out is not sys.stdout:
+        __out.close()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
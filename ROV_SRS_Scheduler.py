@@ -0,0 +1,191 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Scheduler
+#
+#
+# Overview: An asyncio runtime for the SRS control pipelines. Every
+#     pipeline runs as its own periodic task with its own rate and
+#     deadline, so a slow stage only delays its own pipeline.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import asyncio
+
+from ROV_SRS_Hardware import new_event_loop
+from ROV_SRS_Stats import Histogram
+
+class Task(object):
+    """A periodic task and its timing statistics.
+
+    Attributes:
+        name:       A String naming the task.
+        period:     The release period of the task [sec].
+        deadline:   The longest allowed time from release to completion
+                    of one cycle [sec].
+        delay:      The time from scheduler start to the first release
+                    [sec].
+        cycles:     The number of completed cycles.
+        misses:     The number of cycles completed past their deadline.
+        skipped:    The number of releases skipped after overruns.
+        exec_max:   The longest execution time of one cycle [sec].
+        periods:    A Histogram of the time between cycle starts [ns].
+        latency:    A Histogram of the time from release to completion
+                    of each cycle [ns], counting deadline misses.
+        pending:    The release time of the cycle in progress [sec], or
+                    None between cycles.
+    """
+
+    def __init__(self, name, freq, step, deadline=None, delay=0.0,
+                 recorder=None):
+        self.name = name
+        self.period = 1.0/freq
+        self.deadline = self.period if deadline is None else deadline
+        self.delay = delay
+        self.step = step
+        self.cycles = 0
+        self.misses = 0
+        self.skipped = 0
+        self.exec_max = 0.0
+        self.exec_total = 0.0
+        self.pending = None
+        self._first = None
+        self._last = None
+
+        if recorder is None:
+            self.periods = Histogram(name + ".period")
+            self.latency = Histogram(name + ".latency",
+                                     int(self.deadline*1e9))
+        else:
+            self.periods = recorder.histogram("task." + name + ".period")
+            self.latency = recorder.histogram("task." + name + ".latency",
+                                              self.deadline)
+
+    def record(self, release, start, end):
+        """Account for one completed cycle."""
+        if self._first is None:
+            self._first = start
+        else:
+            self.periods.record(int((start - self._last)*1e9))
+        self._last = start
+        self.cycles += 1
+        self.exec_total += end - start
+        self.exec_max = max(self.exec_max, end - start)
+        self.latency.record(max(int((end - release)*1e9), 0))
+        if end - release > self.deadline:
+            self.misses += 1
+
+    def rate(self):
+        """Return the achieved release rate [Hz] (0.0 if unknown)."""
+        if self.cycles < 2 or self._last == self._first:
+            return 0.0
+        return (self.cycles - 1)/(self._last - self._first)
+
+class Scheduler(object):
+    """Runs periodic tasks on an asyncio event loop.
+
+    A task step may be a plain function or a coroutine function. Plain
+    functions must not block; coroutines may await between stages. A
+    task that overruns its period skips the missed releases instead of
+    bursting to catch up.
+
+    Attributes:
+        tasks:      The List of scheduled Task objects.
+        recorder:   The ROV_SRS_Stats Recorder holding the timing
+                    Histograms of the tasks, or None.
+    """
+
+    def __init__(self, recorder=None):
+        self.tasks = []
+        self.recorder = recorder
+
+    def add(self, name, freq, step, deadline=None, delay=0.0):
+        """Schedule step() to run at freq [Hz]. Returns the Task."""
+        task = Task(name, freq, step, deadline, delay, self.recorder)
+        self.tasks.append(task)
+        return task
+
+    def run(self):
+        """Run all tasks until one of them raises an exception."""
+        loop = new_event_loop()
+        asyncio.set_event_loop(loop)
+        runners = [loop.create_task(self._run_task(task, loop))
+                   for task in self.tasks]
+        gathered = asyncio.gather(*runners)
+
+        try:
+            loop.run_until_complete(gathered)
+        finally:
+            # A failed gather() leaves the other tasks running.
+            for runner in runners:
+                runner.cancel()
+            try:
+                loop.run_until_complete(
+                    asyncio.gather(*runners, return_exceptions=True))
+            finally:
+                if gathered.done() and not gathered.cancelled():
+                    # Already raised above (if at all); mark it retrieved.
+                    gathered.exception()
+                asyncio.set_event_loop(None)
+                loop.close()
+
+    async def _run_task(self, task, loop):
+        release = loop.time() + task.delay
+        await asyncio.sleep(task.delay)
+
+        while True:
+            task.pending = release
+            start = loop.time()
+            result = task.step()
+            if asyncio.iscoroutine(result):
+                await result
+            end = loop.time()
+            task.record(release, start, end)
+            task.pending = None
+
+            release += task.period
+            if release < end:
+                missed = int((end - release)/task.period) + 1
+                task.skipped += missed
+                release += missed*task.period
+
+            await asyncio.sleep(release - loop.time())
+
+    def report(self):
+        """Return the timing statistics of every task.
+
+        Returns:
+            stats:      A List of Dicts, one per task, with the task
+                        name, target and achieved rates [Hz], deadline
+                        misses, skipped releases, the mean and
+                        maximum execution times and the 99th
+                        percentile period and latency [sec].
+        """
+        stats = []
+        for task in self.tasks:
+            stats.append({
+                "name": task.name,
+                "target_hz": 1.0/task.period,
+                "rate_hz": task.rate(),
+                "cycles": task.cycles,
+                "misses": task.misses,
+                "skipped": task.skipped,
+                "exec_mean": task.exec_total/max(task.cycles, 1),
+                "exec_max": task.exec_max,
+                "period_p99": task.periods.percentile(99)/1e9,
+                "latency_p99": task.latency.percentile(99)/1e9,
+                })
+        return stats
+
+    def format_report(self):
+        """Return report() as a printable table."""
+        lines = ["{:<10}{:>10}{:>10}{:>8}{:>8}{:>12}".format(
+            "task", "target", "rate", "misses", "skips", "exec max")]
+        for stat in self.report():
+            lines.append(
+                "{:<10}{:>9.1f} {:>9.1f} {:>8}{:>8}{:>10.2f}ms".format(
+                    stat["name"], stat["target_hz"], stat["rate_hz"],
+                    stat["misses"], stat["skipped"], 1e3*stat["exec_max"]))
+        return "\n".join(lines)
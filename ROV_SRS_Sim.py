@@ -0,0 +1,555 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Sim
+#
+#
+# Overview: A simulated stand-in for the Adafruit_BBIO GPIO and ADC
+#     modules. All signals are generated against a virtual clock, so
+#     the control scripts can run off the BeagleBone Black and faster
+#     than real time.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import asyncio
+import heapq
+import math
+import random
+import selectors
+import time
+
+#
+# Constant Definitions.
+#
+
+# Adafruit_BBIO compatible GPIO Constants.
+HIGH = 1
+LOW = 0
+OUT = 0
+IN = 1
+RISING = 1
+FALLING = 2
+BOTH = 3
+
+# Simulated Hardware Timing Constants.
+ADC_READ_TIME = 125e-6          # Time spent in a single ADC read [sec].
+EDGE_POLL_TIME = 0.005          # Edge re-check period on flat signals [sec].
+
+class SimulationEnd(Exception):
+    """Raised once the Virtual Clock reaches its configured end time."""
+
+class VirtualClock(object):
+    """A clock whose time only moves when the simulated program waits.
+
+    The clock mirrors the parts of the time module used by the control
+    scripts (time, sleep, monotonic, ...). Sleeping never blocks; it
+    advances the clock and runs any scheduled events on the way.
+
+    Attributes:
+        now:        The current simulated time [sec since reset].
+        end:        The simulated time at which SimulationEnd is
+                    raised, or None to run forever.
+        epoch:      The wall-clock time corresponding to now == 0.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, end=None, epoch=None):
+        self.now = 0.0
+        self.end = end
+        self.epoch = time.time() if epoch is None else epoch
+        self._events = []
+        self._seq = 0
+
+    def time(self):
+        return self.epoch + self.now
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def monotonic_ns(self):
+        return int(self.now * 1e9)
+
+    perf_counter_ns = monotonic_ns
+
+    def sleep(self, secs):
+        self.advance_to(self.now + max(secs, 0.0))
+
+    def schedule(self, when, callback):
+        """Run callback() once the clock reaches the given time."""
+        self._seq += 1
+        heapq.heappush(self._events, (when, self._seq, callback))
+
+    def advance_to(self, when):
+        """Move the clock forward, running due events in time order."""
+        while self._events and self._events[0][0] <= when:
+            event_time, seq, callback = heapq.heappop(self._events)
+            self._check_end(event_time)
+            self.now = max(self.now, event_time)
+            callback()
+
+        self._check_end(when)
+        self.now = max(self.now, when)
+
+    def _check_end(self, when):
+        if self.end is not None and when > self.end:
+            self.now = max(self.now, self.end)
+            raise SimulationEnd(self.end)
+        if when == math.inf:
+            raise RuntimeError("Simulation waits forever with no end set.")
+
+class Worker(object):
+    """Runs a background task on the Virtual Clock.
+
+    Mirrors ROV_SRS_Hardware's thread Worker: the task is a generator
+    function yielding the time to sleep [sec] before it is resumed. Each
+    resumption runs as a scheduled clock event.
+    """
+
+    def __init__(self, target, name=None):
+        self._target = target
+        self._task = None
+        self._stopped = False
+
+    def start(self):
+        self._task = self._target()
+        clock.schedule(clock.now, self._step)
+
+    def stop(self):
+        self._stopped = True
+
+    def alive(self):
+        return self._task is not None and not self._stopped
+
+    def _step(self):
+        if self._stopped:
+            return
+        try:
+            delay = next(self._task)
+        except StopIteration:
+            self._stopped = True
+            return
+        clock.schedule(clock.now + delay, self._step)
+
+class _SimSelector(selectors.SelectSelector):
+    """A selector that sleeps on the Virtual Clock instead of blocking."""
+
+    def select(self, timeout=None):
+        ready = super(_SimSelector, self).select(0)
+        if not ready and timeout is None:
+            raise RuntimeError("Event loop waits forever on the simulator.")
+        if not ready and timeout > 0:
+            clock.sleep(timeout)
+        return ready
+
+class _SimEventLoop(asyncio.SelectorEventLoop):
+    """An asyncio event loop timed by the Virtual Clock."""
+
+    def __init__(self):
+        super(_SimEventLoop, self).__init__(_SimSelector())
+
+    def time(self):
+        return clock.monotonic()
+
+def new_event_loop():
+    """Return an asyncio event loop running on the Virtual Clock."""
+    return _SimEventLoop()
+
+class PwmSource(object):
+    """A synthetic RC receiver PWM signal.
+
+    Attributes:
+        period:     The signal period [sec].
+        width:      The nominal Pulse Width [sec]. Widths of 0 or of a
+                    full period produce a flat (0 or 100% Duty Cycle)
+                    signal without edges.
+        phase:      Time of the first Rising Edge [sec].
+        noise:      Standard deviation of the Pulse Width noise [sec].
+    """
+
+    def __init__(self, freq, width, phase=0.0, noise=0.0, seed=0):
+        self.period = 1.0/freq
+        self.width = width
+        self.phase = phase
+        self.noise = noise
+        self._rand = random.Random(seed)
+
+    def flat(self):
+        return self.width <= 0.0 or self.width >= self.period
+
+    def level(self, t):
+        if self.flat():
+            return HIGH if self.width > 0.0 else LOW
+        return HIGH if (t - self.phase) % self.period < self.width else LOW
+
+    def next_edge(self, t, edge):
+        """Return the time of the first matching edge after t.
+
+        Returns None if the signal is flat and no edge will ever come.
+        """
+        if self.flat():
+            return None
+
+        if edge == BOTH:
+            return min(self.next_edge(t, RISING), self.next_edge(t, FALLING))
+
+        offset = self.phase
+        if edge == FALLING:
+            offset += self.width
+            if self.noise:
+                offset += self._rand.gauss(0.0, self.noise)
+
+        k = math.floor((t - offset)/self.period) + 1
+        when = offset + k*self.period
+        if when <= t:
+            # Rounding placed the edge at (or before) t itself.
+            when += self.period
+        return when
+
+class PressureModel(object):
+    """A slowly varying, noisy pressure transducer signal [normalized]."""
+
+    def __init__(self, mean=0.5, amplitude=0.05, freq=0.2,
+                 noise=0.002, seed=0):
+        self.mean = mean
+        self.amplitude = amplitude
+        self.freq = freq
+        self.noise = noise
+        self._rand = random.Random(seed)
+
+    def __call__(self, t):
+        value = self.mean + self.amplitude*math.sin(2*math.pi*self.freq*t)
+        value += self._rand.gauss(0.0, self.noise)
+        return min(max(value, 0.0), 1.0)
+
+class LinearActuatorModel(object):
+    """A constant-speed Linear Actuator with a position Potentiometer.
+
+    The shaft extends while out[0] is HIGH and out[1] is LOW, retracts
+    while out[0] is LOW and out[1] is HIGH, and stops otherwise. With
+    coast > 0, the shaft coasts to a stop with that time constant [sec].
+    """
+
+    def __init__(self, clock, gpio, out, max_stroke, max_time,
+                 position=0.0, coast=0.0):
+        self.max_stroke = max_stroke
+        self.speed = max_stroke/max_time
+        self.out = list(out)
+        self.velocity = 0.0
+        self.coast = coast
+        self._clock = clock
+        self._gpio = gpio
+        self._x = position
+        self._t = clock.now
+        self._coast_velocity = 0.0
+
+        for pin in self.out:
+            gpio.listeners.setdefault(pin, []).append(self._drive)
+
+    def position(self, t=None):
+        t = self._clock.now if t is None else t
+        x = self._x + self.velocity*(t - self._t)
+        if self._coast_velocity:
+            x += self._coast_velocity*self.coast*(
+                1.0 - math.exp(-(t - self._t)/self.coast))
+        return min(max(x, 0.0), self.max_stroke)
+
+    def pot(self, t):
+        return self.position(t)/self.max_stroke
+
+    def place(self, position):
+        """Put the shaft at a position [inch] at once, at rest."""
+        self._x = position
+        self._t = self._clock.now
+        self.velocity = 0.0
+        self._coast_velocity = 0.0
+
+    def _drive(self, pin, value):
+        self._x = self.position()
+        self._t = self._clock.now
+
+        levels = [self._gpio.levels.get(p, LOW) for p in self.out]
+        velocity = self.velocity
+        if levels == [HIGH, LOW]:
+            self.velocity = self.speed
+        elif levels == [LOW, HIGH]:
+            self.velocity = -self.speed
+        else:
+            self.velocity = 0.0
+
+        self._coast_velocity = 0.0
+        if self.coast > 0.0 and self.velocity == 0.0:
+            self._coast_velocity = velocity
+
+class StepperModel(object):
+    """A Stepper Driver counting STEP rising edges.
+
+    A LOW "DIR" signal steps Clockwise (+1), a HIGH one Counter-Clockwise.
+    """
+
+    def __init__(self, clock, gpio, out):
+        self.dir_pin, self.step_pin = out
+        self.position = 0
+        self.steps = 0
+        self.last_step = None
+        self._clock = clock
+        self._gpio = gpio
+
+        gpio.listeners.setdefault(self.step_pin, []).append(self._step)
+
+    def _step(self, pin, value):
+        if value == HIGH:
+            if self._gpio.levels.get(self.dir_pin, LOW) == LOW:
+                self.position += 1
+            else:
+                self.position -= 1
+            self.steps += 1
+            self.last_step = self._clock.now
+
+class SimGPIO(object):
+    """Simulated Adafruit_BBIO.GPIO module.
+
+    Attributes:
+        sources:    Dict mapping input pin names to PwmSource objects.
+        levels:     Dict mapping output pin names to their current level.
+        listeners:  Dict mapping output pin names to lists of callables,
+                    called as listener(pin, value) on every level change.
+        log:        List of (time, pin, value) output level changes.
+
+    Edge detection callbacks run on the simulated clock at the exact
+    time of each edge, and input() returns the level of the edge being
+    reported while they run.
+    """
+    HIGH = HIGH
+    LOW = LOW
+    OUT = OUT
+    IN = IN
+    RISING = RISING
+    FALLING = FALLING
+    BOTH = BOTH
+
+    def __init__(self, clock):
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        self.sources = {}
+        self.levels = {}
+        self.directions = {}
+        self.listeners = {}
+        self.log = []
+        self._detect = {}
+        self._latched = {}
+
+    def setup(self, pin, direction, pull_up_down=0, initial=0):
+        self.directions[pin] = direction
+        if direction == OUT:
+            self.levels.setdefault(pin, initial)
+
+    def cleanup(self):
+        self.directions.clear()
+
+    def output(self, pin, value):
+        if self.levels.get(pin) != value:
+            self.levels[pin] = value
+            self.log.append((self._clock.now, pin, value))
+            for listener in self.listeners.get(pin, ()):
+                listener(pin, value)
+
+    def input(self, pin):
+        if pin in self._latched:
+            return self._latched[pin]
+        if pin in self.sources:
+            return self.sources[pin].level(self._clock.now)
+        return self.levels.get(pin, LOW)
+
+    def wait_for_edge(self, pin, edge, timeout=-1):
+        source = self.sources.get(pin)
+        when = None if source is None else source.next_edge(
+            self._clock.now, edge)
+
+        if timeout is not None and timeout >= 0:
+            limit = self._clock.now + timeout/1000.0
+            if when is None or when > limit:
+                self._clock.advance_to(limit)
+                return None
+
+        self._clock.advance_to(math.inf if when is None else when)
+        return pin
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=0):
+        if pin in self._detect:
+            raise RuntimeError(
+                "Edge detection already enabled for this GPIO channel")
+
+        detect = _EdgeDetect(edge, callback)
+        self._detect[pin] = detect
+        self._arm(pin, detect)
+
+    def add_event_callback(self, pin, callback, bouncetime=0):
+        self._detect[pin].callbacks.append(callback)
+
+    def remove_event_detect(self, pin):
+        self._detect.pop(pin, None)
+        self._latched.pop(pin, None)
+
+    def event_detected(self, pin):
+        detect = self._detect.get(pin)
+        if detect is None or not detect.flag:
+            return False
+        detect.flag = False
+        return True
+
+    def _arm(self, pin, detect):
+        if self._detect.get(pin) is not detect:
+            return          # Removed: stop polling the source.
+        source = self.sources.get(pin)
+        now = self._clock.now
+
+        if source is None or source.flat():
+            self._clock.schedule(
+                now + EDGE_POLL_TIME, lambda: self._arm(pin, detect))
+            return
+
+        rise = source.next_edge(now, RISING)
+        fall = source.next_edge(now, FALLING)
+        if detect.edge == RISING or (detect.edge == BOTH and rise < fall):
+            when, level = rise, HIGH
+        else:
+            when, level = fall, LOW
+
+        self._clock.schedule(
+            when, lambda: self._fire(pin, detect, level))
+
+    def _fire(self, pin, detect, level):
+        if self._detect.get(pin) is not detect:
+            return
+
+        self._latched[pin] = level
+        detect.flag = True
+        for callback in detect.callbacks:
+            callback(pin)
+        self._arm(pin, detect)
+
+class _EdgeDetect(object):
+    """Edge detection settings and pending flag of one input pin."""
+
+    def __init__(self, edge, callback):
+        self.edge = edge
+        self.callbacks = [] if callback is None else [callback]
+        self.flag = False
+
+class SimADC(object):
+    """Simulated Adafruit_BBIO.ADC module.
+
+    Each read takes ADC_READ_TIME of simulated time. With stale set,
+    a read returns the value converted by the previous read of the same
+    pin, reproducing the Adafruit_BBIO double-read bug.
+
+    Attributes:
+        sources:    Dict mapping pin names to callables of time
+                    returning a normalized (0.0 - 1.0) value.
+        reads:      Total number of reads performed.
+    """
+
+    def __init__(self, clock):
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        self.sources = {}
+        self.stale = True
+        self.read_time = ADC_READ_TIME
+        self.reads = 0
+        self._held = {}
+
+    def setup(self):
+        pass
+
+    def read(self, pin):
+        self._clock.sleep(self.read_time)
+        self.reads += 1
+
+        source = self.sources.get(pin)
+        value = 0.0 if source is None else source(self._clock.now)
+        if self.stale:
+            value, self._held[pin] = self._held.get(pin, 0.0), value
+
+        return value
+
+    def read_raw(self, pin):
+        return self.read(pin)*1800.0
+
+class Simulator(object):
+    """The simulated BeagleBone: clock, GPIO, ADC and attached hardware.
+
+    Attributes:
+        clock:      The VirtualClock shared by all simulated hardware.
+        gpio:       The SimGPIO module stand-in.
+        adc:        The SimADC module stand-in.
+        actuators:  Dict mapping Potentiometer pins to attached
+                    LinearActuatorModel objects.
+        steppers:   Dict mapping STEP pins to attached StepperModel objects.
+    """
+
+    def __init__(self):
+        self.clock = VirtualClock()
+        self.gpio = SimGPIO(self.clock)
+        self.adc = SimADC(self.clock)
+        self.actuators = {}
+        self.steppers = {}
+
+    def reset(self, end=None):
+        """Remove all attached hardware and restart the clock at 0."""
+        self.clock.reset(end)
+        self.gpio.reset()
+        self.adc.reset()
+        self.actuators = {}
+        self.steppers = {}
+
+    def attach_pwm(self, pin, freq, width, phase=0.0, noise=0.0, seed=0):
+        source = PwmSource(freq, width, phase, noise, seed)
+        self.gpio.sources[pin] = source
+        return source
+
+    def attach_linear(self, out, pot, max_stroke, max_time, position=0.0,
+                      coast=0.0):
+        model = LinearActuatorModel(
+            self.clock, self.gpio, out, max_stroke, max_time, position,
+            coast)
+        self.adc.sources[pot] = model.pot
+        self.actuators[pot] = model
+        return model
+
+    def attach_stepper(self, out):
+        model = StepperModel(self.clock, self.gpio, out)
+        self.steppers[model.step_pin] = model
+        return model
+
+    def attach_pressure(self, pin, model=None):
+        model = PressureModel() if model is None else model
+        self.adc.sources[pin] = model
+        return model
+
+    def set_width(self, pin, width, when=None):
+        """Change an input Pulse Width, now or at a later simulated time."""
+        def apply():
+            self.gpio.sources[pin].width = width
+
+        if when is None:
+            apply()
+        else:
+            self.clock.schedule(when, apply)
+
+#
+# Module-level stand-ins, shaped like "from Adafruit_BBIO import GPIO".
+#
+SIM = Simulator()
+clock = SIM.clock
+GPIO = SIM.gpio
+ADC = SIM.adc
@@ -0,0 +1,251 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Stats
+#
+#
+# Overview: Low-overhead instrumentation for the SRS control loop. Calls
+#     are timed with the monotonic nanosecond clock into fixed-memory
+#     latency histograms, which can be read while the loop runs: dumped
+#     to stderr on a signal (SIGUSR1 by default) or served as text on a
+#     local (UNIX domain) socket.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import asyncio
+import functools
+import os
+import signal
+import socket
+import sys
+import threading
+
+from ROV_SRS_Hardware import clock
+
+#
+# Constant Definitions.
+#
+
+STATS_BUCKETS = 40              # Histogram buckets (powers of 2 [ns]).
+STATS_SIGNAL = signal.SIGUSR1   # Signal dumping the stats to stderr.
+STATS_BACKLOG = 1               # Pending connections on the stats socket.
+
+class Histogram(object):
+    """Fixed-memory latency histogram.
+
+    Bucket n counts the durations d [ns] with d.bit_length() == n, i.e.
+    2^(n-1) <= d < 2^n, so the resolution is a factor of 2 from 1 ns up
+    to 2^(STATS_BUCKETS-1) ns (about 9 minutes). Updates from several
+    threads are not locked; a count may rarely be lost.
+
+    Attributes:
+        name:       A String naming the histogram.
+        count:      The number of recorded durations.
+        total:      The sum of the recorded durations [ns].
+        max:        The longest recorded duration [ns].
+        misses:     The number of durations over the deadline.
+        deadline:   The deadline [ns], or None.
+    """
+
+    def __init__(self, name, deadline=None):
+        self.name = name
+        self.deadline = deadline
+        self.buckets = [0]*STATS_BUCKETS
+        self.reset()
+
+    def reset(self):
+        """Clear the recorded durations."""
+        for n in range(STATS_BUCKETS):
+            self.buckets[n] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.misses = 0
+
+    def record(self, ns):
+        """Record one duration [ns]."""
+        self.buckets[min(ns.bit_length(), STATS_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        if self.deadline is not None and ns > self.deadline:
+            self.misses += 1
+
+    def percentile(self, pct):
+        """Return the upper bound [ns] of the pct [%] percentile bucket."""
+        if self.count == 0:
+            return 0
+        rank = self.count*pct/100.0
+        seen = 0
+        for n in range(STATS_BUCKETS):
+            seen += self.buckets[n]
+            if seen >= rank:
+                return min(1 << n, self.max) if n else 0
+        return self.max
+
+    def mean(self):
+        """Return the mean duration [ns] (0.0 if empty)."""
+        return self.total/float(self.count) if self.count else 0.0
+
+class Recorder(object):
+    """A named set of Histograms, and the means to read them at runtime.
+
+    Attributes:
+        histograms: A Dict of the Histograms, by name.
+        sources:    A List of callables returning extra report lines
+                    (e.g. a Scheduler's format_report).
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.sources = []
+        self._originals = []
+        self._server = None
+        self._path = None
+
+    def histogram(self, name, deadline=None):
+        """Return the Histogram of a name, creating it if needed.
+
+        Args:
+            name:       A String naming the histogram.
+            deadline:   A Float specifying the deadline [sec] over which
+                        durations count as misses, or None.
+        """
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram(
+                name, None if deadline is None else int(deadline*1e9))
+        return hist
+
+    def timed(self, name, func, deadline=None):
+        """Return func wrapped to record its duration under name.
+
+        Coroutine functions are timed from the first call to completion.
+        """
+        record = self.histogram(name, deadline).record
+        now = clock.monotonic_ns
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                start = now()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    record(now() - start)
+            return timed_async
+
+        @functools.wraps(func)
+        def timed_call(*args, **kwargs):
+            start = now()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(now() - start)
+        return timed_call
+
+    def instrument(self, owner, names, prefix=None):
+        """Replace functions or methods of a module or class in place.
+
+        Every caller looking the names up on owner (e.g. SRS.get_width)
+        is timed from then on.
+
+        Args:
+            owner:      The module or class holding the functions.
+            names:      A List of Strings naming the functions.
+            prefix:     A String prefixed to the histogram names, or None
+                        for the name of owner.
+        """
+        if prefix is None:
+            prefix = owner.__name__
+        for name in names:
+            func = getattr(owner, name)
+            self._originals.append((owner, name, owner.__dict__[name]))
+            setattr(owner, name, self.timed(prefix + "." + name, func))
+
+    def restore(self):
+        """Undo every instrument(), newest first."""
+        while self._originals:
+            owner, name, func = self._originals.pop()
+            setattr(owner, name, func)
+
+    def reset(self):
+        """Clear every Histogram."""
+        for hist in self.histograms.values():
+            hist.reset()
+
+    def format(self):
+        """Return the stats as a printable table [usec]."""
+        lines = ["{:<32}{:>9}{:>10}{:>10}{:>10}{:>10}{:>8}".format(
+            "timer", "count", "mean", "p50", "p99", "max", "misses")]
+        for name in sorted(self.histograms):
+            hist = self.histograms[name]
+            lines.append(
+                "{:<32}{:>9}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>8}".format(
+                    name, hist.count, hist.mean()/1e3,
+                    hist.percentile(50)/1e3, hist.percentile(99)/1e3,
+                    hist.max/1e3, hist.misses))
+        for source in self.sources:
+            lines.append(source())
+        return "\n".join(lines) + "\n"
+
+    def dump(self, out=None):
+        """Write the stats to out (stderr by default)."""
+        out = sys.stderr if out is None else out
+        out.write(self.format())
+        out.flush()
+
+    def install_signal(self, signum=STATS_SIGNAL):
+        """Dump the stats to stderr whenever signum is received.
+
+        Must be called from the main thread.
+        """
+        signal.signal(signum, lambda signum, frame: self.dump())
+
+    def serve(self, path):
+        """Serve the stats on a local socket from a background thread.
+
+        Every connection to path receives the current stats, and is then
+        closed (e.g. "socat - UNIX-CONNECT:path").
+
+        Args:
+            path:       A String specifying the socket file path. An
+                        existing file at path is replaced.
+        """
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen(STATS_BACKLOG)
+        self._path = path
+
+        thread = threading.Thread(target=self._serve, name="StatsServer")
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        """Stop serving the stats socket."""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            os.unlink(self._path)
+
+    def _serve(self):
+        server = self._server
+        while True:
+            try:
+                conn, addr = server.accept()
+            except OSError:
+                return
+            try:
+                conn.sendall(self.format().encode())
+            except OSError:
+                pass
+            finally:
+                conn.close()
+
+# Shared Recorder of the control loop.
+STATS = Recorder()
@@ -0,0 +1,522 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Telemetry
+#
+#
+# Overview: Out-of-process data logging and telemetry. main() pushes
+#     fixed-size telemetry records into a ring buffer in shared memory;
+#     a separate writer process formats them and writes the log file,
+#     and optionally streams them to the topside. File I/O,
+#     formatting and networking never hold the control process's GIL,
+#     and a slow storage device or tether only fills the ring: records
+#     pushed while it is full are dropped and counted.
+#
+#     The ring has a single producing process (the control process) and
+#     a single consumer (the writer process). Threads of the control
+#     process (the pressure sampler and the scheduler) may all push:
+#     they reserve and commit records under a lock, which the consumer
+#     never takes. The producer only advances the head and the consumer
+#     only advances the tail, each after its records are complete, so
+#     neither ever waits on the other. As the stores of one process may
+#     become visible to the other out of order, each record slot also
+#     has a commit word: the producer clears it, writes the record, then
+#     sets it to the record's sequence number + 1, all before advancing
+#     the head. The consumer only takes a record whose commit word holds
+#     its sequence number both before and after copying it (a sequence
+#     lock); any other record is left, with those after it, for the next
+#     pop.
+#
+#     Records (24 bytes, little-endian, kind in the last byte):
+#         Sample: Time (d) [sec], pressure (d), LA, CS, SS Position
+#                 Commands and LA, CS, SS trends (6b).
+#         Timing: Time (d) [sec], 99th percentile period and latency
+#                 (2f) [sec], task name (4s), deadline misses (H).
+#
+#     Log Format: HH:MM:SS<TAB>pressure<TAB>LA, CS, SS commands<TAB>
+#     LA, CS, SS trends (tab separated, Sample records only). With
+#     compact logging, the Sample records are written instead to compact
+#     binary log files kept within a disk quota (ROV_SRS_CompactLog).
+#
+#     Stream Format: frames of a header (magic, sequence number (I),
+#     send time (d) [Unix time, sec], record count (H)) followed by the
+#     records (timed in Unix time), as UDP datagrams or back to back on
+#     a TCP connection. Frames are sent within a bandwidth budget; frames
+#     held back beyond TELEM_BACKLOG are dropped, which shows as a gap in
+#     the sequence numbers. ROV_SRS_Receiver is the matching receiver.
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+from collections import deque
+from datetime import datetime
+import multiprocessing
+from multiprocessing import shared_memory
+import socket
+import struct
+import threading
+import time
+
+import ROV_SRS_CompactLog as CompactLog
+from ROV_SRS_Hardware import clock
+
+#
+# Constant Definitions.
+#
+
+TELEM_RING_SIZE = 4096      # Records held in the ring (power of 2).
+TELEM_POLL_TIME = 0.25      # Writer process check period [sec].
+TELEM_JOIN_TIME = 5.0       # Longest wait for the writer to finish [sec].
+
+TELEM_SAMPLE = 0            # Record kinds.
+TELEM_TIMING = 1
+
+TELEM_MAGIC = b"SRST"
+TELEM_FRAME_MAX = 1400      # Largest frame (one Ethernet datagram) [bytes].
+TELEM_BANDWIDTH = 2000.0    # Default tether budget [bytes/sec].
+TELEM_BURST = 1.0           # Budget that may accumulate while idle [sec].
+TELEM_BACKLOG = 64          # Frames held back before dropping the oldest.
+TELEM_RETRY_TIME = 2.0      # TCP reconnection period [sec].
+TELEM_SEND_TIMEOUT = 0.5    # Longest wait on a TCP send [sec].
+
+# Ring header: head, tail, dropped, closed, monotonic and wall-clock base.
+_HEADER = struct.Struct("<QQQQdd")
+_HEADER_SIZE = 64
+_HEAD = 0
+_TAIL = 8
+_DROPPED = 16
+_CLOSED = 24
+_INDICES = struct.Struct("<QQ")
+_COUNT = struct.Struct("<Q")
+
+_SAMPLE = struct.Struct("<dd6bxB")
+_TIMING = struct.Struct("<dff4sHxB")
+_RECORD_SIZE = 24
+_COMMIT_SIZE = 8            # Commit word of a record slot (Q).
+_TIME = struct.Struct("<d")
+
+_FRAME = struct.Struct("<4sIdH")
+_FRAME_RECORDS = (TELEM_FRAME_MAX - _FRAME.size)//_RECORD_SIZE
+FRAME_HEADER_SIZE = _FRAME.size
+
+class TelemetryRing(object):
+    """Fixed-size telemetry records in a shared-memory ring buffer.
+
+    Attributes:
+        size:       The number of records the ring holds.
+    """
+
+    def __init__(self, size=TELEM_RING_SIZE):
+        self.size = size
+        self._mask = size - 1
+        self._lock = threading.Lock()
+        # Header, records, then the commit word of every record slot.
+        self._commits = _HEADER_SIZE + size*_RECORD_SIZE
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=self._commits + size*_COMMIT_SIZE)
+        self._buf = self._shm.buf
+        self._buf[self._commits:] = bytes(size*_COMMIT_SIZE)
+        _HEADER.pack_into(self._buf, 0, 0, 0, 0, 0,
+                          clock.monotonic(), clock.time())
+
+    def push(self, t, pressure, commands, trends):
+        """Append one Sample record (producer side, any thread).
+
+        Args:
+            t:          The monotonic sample time [sec].
+            pressure:   The pressure sample.
+            commands:   A Sequence of the 3 Position Commands (LA, CS, SS).
+            trends:     A Sequence of the 3 trends (LA, CS, SS).
+
+        Returns:
+            pushed:     False if the ring was full and the record dropped.
+        """
+        buf = self._buf
+        with self._lock:
+            head, tail = _INDICES.unpack_from(buf, _HEAD)
+            if head - tail >= self.size:
+                dropped = _COUNT.unpack_from(buf, _DROPPED)[0]
+                _COUNT.pack_into(buf, _DROPPED, dropped + 1)
+                return False
+
+            # Clear the commit word, write the record, then commit it
+            # (see the Overview) and advance the head.
+            slot = head & self._mask
+            commit = self._commits + slot*_COMMIT_SIZE
+            _COUNT.pack_into(buf, commit, 0)
+
+            _SAMPLE.pack_into(
+                buf, _HEADER_SIZE + slot*_RECORD_SIZE,
+                t, pressure, commands[0], commands[1], commands[2],
+                trends[0], trends[1], trends[2], TELEM_SAMPLE)
+            _COUNT.pack_into(buf, commit, head + 1)
+            _COUNT.pack_into(buf, _HEAD, head + 1)
+        return True
+
+    def push_timing(self, t, stat):
+        """Append one Timing record (producer side, any thread).
+
+        Args:
+            t:          The monotonic time of the statistics [sec].
+            stat:       A task statistics Dict, as returned by
+                        ROV_SRS_Scheduler.Scheduler.report().
+
+        Returns:
+            pushed:     False if the ring was full and the record dropped.
+        """
+        buf = self._buf
+        with self._lock:
+            head, tail = _INDICES.unpack_from(buf, _HEAD)
+            if head - tail >= self.size:
+                dropped = _COUNT.unpack_from(buf, _DROPPED)[0]
+                _COUNT.pack_into(buf, _DROPPED, dropped + 1)
+                return False
+
+            # Clear the commit word, write the record, then commit it
+            # (see the Overview) and advance the head.
+            slot = head & self._mask
+            commit = self._commits + slot*_COMMIT_SIZE
+            _COUNT.pack_into(buf, commit, 0)
+
+            _TIMING.pack_into(
+                buf, _HEADER_SIZE + slot*_RECORD_SIZE,
+                t, stat["period_p99"], stat["latency_p99"],
+                stat["name"].encode()[:4], min(stat["misses"], 0xFFFF),
+                TELEM_TIMING)
+            _COUNT.pack_into(buf, commit, head + 1)
+            _COUNT.pack_into(buf, _HEAD, head + 1)
+        return True
+
+    def pop_all(self):
+        """Remove and return all pending records (consumer side).
+
+        Returns:
+            records:    A List of the raw records (Bytes), oldest first.
+        """
+        buf = self._buf
+        head, tail = _INDICES.unpack_from(buf, _HEAD)
+        records = []
+        for n in range(tail, head):
+            slot = n & self._mask
+            commit = self._commits + slot*_COMMIT_SIZE
+            if _COUNT.unpack_from(buf, commit)[0] != n + 1:
+                # Not visible yet: leave it for the next pop.
+                break
+            offset = _HEADER_SIZE + slot*_RECORD_SIZE
+            record = bytes(buf[offset:offset + _RECORD_SIZE])
+            if _COUNT.unpack_from(buf, commit)[0] != n + 1:
+                # Rewritten while copied.
+                break
+            records.append(record)
+        _COUNT.pack_into(buf, _TAIL, tail + len(records))
+        return records
+
+    def dropped(self):
+        """Return the number of records dropped on a full ring."""
+        return _COUNT.unpack_from(self._buf, _DROPPED)[0]
+
+    def pending(self):
+        """Return the number of records not yet removed."""
+        head, tail = _INDICES.unpack_from(self._buf, _HEAD)
+        return head - tail
+
+    def close(self):
+        """Mark the ring closed; the consumer drains it and exits."""
+        _COUNT.pack_into(self._buf, _CLOSED, 1)
+
+    def closed(self):
+        """Return True once the ring has been closed."""
+        return _COUNT.unpack_from(self._buf, _CLOSED)[0] != 0
+
+    def bases(self):
+        """Return the monotonic and wall-clock times at creation [sec]."""
+        return struct.unpack_from("<dd", self._buf, _CLOSED + 8)
+
+    def release(self):
+        """Free the shared memory (after the consumer has exited)."""
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+
+def decode_record(record):
+    """Unpack one raw record.
+
+    Returns:
+        kind:       TELEM_SAMPLE or TELEM_TIMING.
+        fields:     For a Sample, (time [sec], pressure, commands Tuple,
+                    trends Tuple); for a Timing, (time [sec], period p99
+                    [sec], latency p99 [sec], task name, misses). Times
+                    are monotonic in the ring and Unix time in frames.
+    """
+    kind = record[_RECORD_SIZE - 1]
+    if kind == TELEM_SAMPLE:
+        fields = _SAMPLE.unpack(record)
+        return kind, (fields[0], fields[1], fields[2:5], fields[5:8])
+    fields = _TIMING.unpack(record)
+    return kind, (fields[0], fields[1], fields[2],
+                  fields[3].rstrip(b"\0").decode(), fields[4])
+
+def encode_frame(seq, sent, records):
+    """Return a stream frame holding raw records (see the Overview)."""
+    return (_FRAME.pack(TELEM_MAGIC, seq, sent, len(records))
+            + b"".join(records))
+
+def frame_size(header):
+    """Return the full size of a frame from its header bytes [bytes].
+
+    Raises:
+        ValueError: The header is not a frame header.
+    """
+    magic, seq, sent, count = _FRAME.unpack_from(header)
+    if magic != TELEM_MAGIC:
+        raise ValueError("Invalid telemetry frame")
+    return _FRAME.size + count*_RECORD_SIZE
+
+def decode_frame(frame):
+    """Unpack a stream frame.
+
+    Returns:
+        seq:        The frame sequence number.
+        sent:       The send time of the frame [Unix time, sec].
+        records:    A List of the raw records it holds.
+
+    Raises:
+        ValueError: The data is not a complete frame.
+    """
+    if len(frame) < _FRAME.size or len(frame) != frame_size(frame):
+        raise ValueError("Invalid telemetry frame")
+    magic, seq, sent, count = _FRAME.unpack_from(frame)
+    return seq, sent, [
+        frame[offset:offset + _RECORD_SIZE]
+        for offset in range(_FRAME.size, len(frame), _RECORD_SIZE)]
+
+class Publisher(object):
+    """Streams telemetry records to the topside within a bandwidth budget.
+
+    Records are batched into frames of up to TELEM_FRAME_MAX bytes. Each
+    flush() sends the frames its budget allows; the rest are held back,
+    the oldest being dropped beyond TELEM_BACKLOG frames. A lost TCP
+    connection is retried every TELEM_RETRY_TIME.
+
+    Attributes:
+        sent:       The number of frames sent.
+        dropped:    The number of frames dropped (backlog or send errors).
+    """
+
+    def __init__(self, address, protocol="udp", bandwidth=TELEM_BANDWIDTH):
+        """Set up the stream.
+
+        Args:
+            address:    A (host, port) Tuple of the topside receiver.
+            protocol:   "udp" or "tcp".
+            bandwidth:  A Float specifying the tether budget [bytes/sec].
+        """
+        if protocol not in ("udp", "tcp"):
+            raise ValueError("Unknown protocol: {}".format(protocol))
+        self.address = address
+        self.protocol = protocol
+        self.bandwidth = bandwidth
+        self.sent = 0
+        self.dropped = 0
+        self._seq = 0
+        self._records = []
+        self._frames = deque()
+        self._budget = bandwidth*TELEM_BURST
+        self._last = time.monotonic()
+        self._socket = None
+        self._retry = 0.0
+
+    def add(self, record):
+        """Queue one raw record for the stream."""
+        self._records.append(record)
+        if len(self._records) >= _FRAME_RECORDS:
+            self._frame()
+
+    def flush(self):
+        """Send the queued records, as far as the budget allows."""
+        if self._records:
+            self._frame()
+
+        now = time.monotonic()
+        self._budget = min(self._budget + (now - self._last)*self.bandwidth,
+                           self.bandwidth*TELEM_BURST)
+        self._last = now
+
+        while self._frames and len(self._frames[0]) <= self._budget:
+            if not self._connect(now):
+                return
+            frame = self._frames.popleft()
+            try:
+                if self.protocol == "udp":
+                    self._socket.sendto(frame, self.address)
+                else:
+                    self._socket.sendall(frame)
+            except OSError:
+                self.dropped += 1
+                if self.protocol == "tcp":
+                    self._disconnect(now)
+                continue
+            self._budget -= len(frame)
+            self.sent += 1
+
+    def close(self):
+        """Send what the budget allows, drop the rest and disconnect."""
+        self.flush()
+        self.dropped += len(self._frames)
+        self._frames.clear()
+        self._disconnect(time.monotonic())
+
+    def _frame(self):
+        self._frames.append(encode_frame(
+            self._seq, time.time(), self._records))
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        self._records = []
+        while len(self._frames) > TELEM_BACKLOG:
+            self._frames.popleft()
+            self.dropped += 1
+
+    def _connect(self, now):
+        if self._socket is not None:
+            return True
+        if now < self._retry:
+            return False
+        self._retry = now + TELEM_RETRY_TIME
+        try:
+            if self.protocol == "udp":
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            else:
+                self._socket = socket.create_connection(
+                    self.address, TELEM_SEND_TIMEOUT)
+                self._socket.setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            self._socket = None
+            return False
+        return True
+
+    def _disconnect(self, now):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            self._retry = now + TELEM_RETRY_TIME
+
+class Telemetry(object):
+    """A TelemetryRing and the writer process draining it.
+
+    Attributes:
+        ring:       The TelemetryRing main() pushes records into.
+        path:       The log file path (the name, with the date prepended),
+                    or None with compact logging (the files are named by
+                    the LogStore).
+    """
+
+    def __init__(self, name, size=TELEM_RING_SIZE, address=None,
+                 protocol="udp", bandwidth=TELEM_BANDWIDTH, compact=False,
+                 quota=CompactLog.CL_QUOTA):
+        """Create the ring and name the log file.
+
+        Args:
+            name:       A String specifying the desired file name. The
+                        current date is prepended to this string.
+            size:       An Integer specifying the ring size [records].
+                        Must be a power of 2.
+            address:    A (host, port) Tuple of the topside receiver to
+                        stream the records to, or None.
+            protocol:   Refer to Publisher.
+            bandwidth:  Refer to Publisher.
+            compact:    True to log compactly (ROV_SRS_CompactLog.LogStore)
+                        rather than as text.
+            quota:      An Integer specifying the disk use of the compact
+                        log files [bytes].
+        """
+        self.ring = TelemetryRing(size)
+        self._dropped = 0
+        self.path = None
+        if compact:
+            store = (name, quota)
+        else:
+            store = None
+            self.path = datetime.now().strftime("%Y-%m-%d_") + name
+        self._process = multiprocessing.Process(
+            target=_write,
+            args=(self.ring, self.path, store, address, protocol,
+                  bandwidth),
+            name="TelemetryWriter")
+        self._process.daemon = True
+
+    def start(self):
+        """Start the writer process.
+
+        Start it before any background thread, as the process is forked.
+        """
+        self._process.start()
+
+    def close(self):
+        """Drain the ring, stop the writer process and free the ring."""
+        self.ring.close()
+        if self._process.is_alive():
+            self._process.join(TELEM_JOIN_TIME)
+        self._dropped = self.ring.dropped()
+        self.ring.release()
+        self.ring = None
+
+    def dropped(self):
+        """Return the number of records dropped on a full ring."""
+        if self.ring is None:
+            return self._dropped
+        return self.ring.dropped()
+
+def _write(ring, path, store, address, protocol, bandwidth):
+    # Writer process: drain the ring into the log file, or the compact
+    # log store (name, quota), and the stream until closed.
+    mono_base, wall_base = ring.bases()
+    stamp_sec = None
+    stamp = ""
+    publisher = None
+    if address is not None:
+        publisher = Publisher(address, protocol, bandwidth)
+
+    if store is not None:
+        store = CompactLog.LogStore(store[0], quota=store[1])
+        log = store
+    else:
+        log = open(path, "a")
+    try:
+        while True:
+            closed = ring.closed()
+            lines = []
+            for record in ring.pop_all():
+                # Monotonic to Unix time.
+                wall = wall_base + (_TIME.unpack_from(record)[0] - mono_base)
+                record = _TIME.pack(wall) + record[_TIME.size:]
+                if publisher is not None:
+                    publisher.add(record)
+                if record[_RECORD_SIZE - 1] != TELEM_SAMPLE:
+                    continue
+
+                # Log Format: Time, Pressure, Commands, Trends
+                fields = _SAMPLE.unpack(record)
+                if store is not None:
+                    store.add(wall, fields[1], fields[2:8])
+                    continue
+                sec = int(wall)
+                if sec != stamp_sec:
+                    stamp_sec = sec
+                    stamp = time.strftime("%H:%M:%S", time.localtime(sec))
+                lines.append("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(
+                    stamp, fields[1], *fields[2:8]))
+            if lines:
+                log.write("".join(lines))
+                log.flush()
+
+            if publisher is not None:
+                if closed:
+                    publisher.close()
+                else:
+                    publisher.flush()
+            if closed:
+                break
+            time.sleep(TELEM_POLL_TIME)
+    finally:
+        log.close()
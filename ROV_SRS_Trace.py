@@ -0,0 +1,261 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV_SRS_Trace
+#
+#
+# Overview: Recording of raw hardware events into a compact binary trace.
+#     While recording, the GPIO and ADC modules seen by the SRS modules
+#     are replaced by proxies which log every input edge, ADC read and
+#     output level change, with its monotonic time, before passing it on.
+#     Traces are replayed on the simulator by ROV_SRS_Replay.
+#
+#     Trace format (little-endian):
+#         Header: TRACE_MAGIC.
+#         Pin:    Kind (B), pin index (B), name length (B), name.
+#         Time:   Kind (B), absolute time (Q) [ns].
+#         Event:  Kind (B), pin index (B), time since the previous Time
+#                 or Event (I) [ns], value (f).
+#
+# Authors:  Giles Fernandes, Jonathan Lee
+#
+
+import struct
+import threading
+
+from ROV_SRS_Hardware import GPIO
+from ROV_SRS_Hardware import Worker
+from ROV_SRS_Hardware import clock
+
+#
+# Constant Definitions.
+#
+
+TRACE_MAGIC = b"SRSTRC1\n"
+
+# Record kinds.
+TRACE_PIN = 0               # Pin name definition.
+TRACE_TIME = 1              # Absolute time.
+TRACE_EDGE = 2              # Input edge (value: new level).
+TRACE_ADC = 3               # ADC read (value: normalized reading, or
+                            # the mean of the readings taken in bulk).
+TRACE_OUT = 4               # Output level change (value: new level).
+
+TRACE_FLUSH_TIME = 1.0      # Background write period [sec].
+
+_PIN = struct.Struct("<BBB")
+_TIME = struct.Struct("<BQ")
+_EVENT = struct.Struct("<BBIf")
+_DELTA_MAX = 0xFFFFFFFF
+
+class TraceWriter(object):
+    """Buffers trace records in memory and writes them in the background.
+
+    Records are appended from any thread (edge callbacks, Workers, the
+    control loop) under a lock; a background Worker writes the pending
+    bytes every TRACE_FLUSH_TIME.
+
+    Attributes:
+        records:    The number of events recorded.
+    """
+
+    def __init__(self, path):
+        """Open the trace file.
+
+        Args:
+            path:       A String specifying the trace file path.
+        """
+        self.records = 0
+        self._file = open(path, "wb")
+        self._file.write(TRACE_MAGIC)
+        self._pending = bytearray()
+        self._pins = {}
+        self._last = None
+        self._lock = threading.Lock()
+        self._installed = []
+        self._worker = Worker(self._run, name="TraceWriter")
+
+    def start(self):
+        """Start the background writer."""
+        self._worker.start()
+
+    def close(self):
+        """Uninstall the proxies, write pending records and close."""
+        self.uninstall()
+        self._worker.stop()
+        self.flush()
+        self._file.close()
+
+    def install(self, modules):
+        """Record the hardware events of modules from now on.
+
+        The GPIO and ADC globals of each module are replaced by recording
+        proxies (undone by uninstall()).
+
+        Args:
+            modules:    A List of the modules to record (e.g. Capture,
+                        Motion, Pressure and the SRS library).
+        """
+        gpio = TracedGPIO(GPIO, self)
+        adcs = {}
+        for module in modules:
+            for name in ("GPIO", "ADC"):
+                if not hasattr(module, name):
+                    continue
+                original = getattr(module, name)
+                if name == "GPIO":
+                    proxy = gpio
+                else:
+                    # The module's own ADC (e.g. a buffered reader).
+                    proxy = adcs.get(id(original))
+                    if proxy is None:
+                        proxy = adcs[id(original)] = TracedADC(original, self)
+                self._installed.append((module, name, original))
+                setattr(module, name, proxy)
+
+    def uninstall(self):
+        """Restore the modules' own GPIO and ADC globals."""
+        while self._installed:
+            module, name, original = self._installed.pop()
+            setattr(module, name, original)
+
+    def event(self, kind, pin, value):
+        """Record one event on a pin, timestamped now."""
+        now = clock.monotonic_ns()
+        with self._lock:
+            index = self._pins.get(pin)
+            if index is None:
+                index = self._pins[pin] = len(self._pins)
+                name = pin.encode()
+                self._pending += _PIN.pack(TRACE_PIN, index, len(name))
+                self._pending += name
+
+            if self._last is None or not 0 <= now - self._last <= _DELTA_MAX:
+                self._pending += _TIME.pack(TRACE_TIME, now)
+                self._last = now
+            self._pending += _EVENT.pack(kind, index, now - self._last, value)
+            self._last = now
+            self.records += 1
+
+    def flush(self):
+        """Write all pending records."""
+        with self._lock:
+            pending = self._pending
+            self._pending = bytearray()
+        if pending:
+            self._file.write(pending)
+            self._file.flush()
+
+    def _run(self):
+        while True:
+            yield TRACE_FLUSH_TIME
+            self.flush()
+
+class TracedGPIO(object):
+    """Recording proxy of the GPIO module (see TraceWriter.install())."""
+
+    def __init__(self, gpio, writer):
+        self._gpio = gpio
+        self._writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self._gpio, name)
+
+    def output(self, pin, value):
+        self._writer.event(TRACE_OUT, pin, value)
+        self._gpio.output(pin, value)
+
+    def wait_for_edge(self, pin, edge, *args, **kwargs):
+        result = self._gpio.wait_for_edge(pin, edge, *args, **kwargs)
+        if edge == self._gpio.RISING:
+            level = self._gpio.HIGH
+        elif edge == self._gpio.FALLING:
+            level = self._gpio.LOW
+        else:
+            level = self._gpio.input(pin)
+        self._writer.event(TRACE_EDGE, pin, level)
+        return result
+
+    def add_event_detect(self, pin, edge, callback=None, *args, **kwargs):
+        if callback is not None:
+            callback = self._traced(callback)
+        self._gpio.add_event_detect(pin, edge, callback, *args, **kwargs)
+
+    def add_event_callback(self, pin, callback, *args, **kwargs):
+        self._gpio.add_event_callback(
+            pin, self._traced(callback), *args, **kwargs)
+
+    def _traced(self, callback):
+        def traced(pin):
+            self._writer.event(TRACE_EDGE, pin, self._gpio.input(pin))
+            callback(pin)
+        return traced
+
+class TracedADC(object):
+    """Recording proxy of the ADC module (see TraceWriter.install())."""
+
+    def __init__(self, adc, writer):
+        self._adc = adc
+        self._writer = writer
+        if hasattr(adc, "take"):
+            # Only a buffered reader takes readings in bulk (refer to
+            # ROV_SRS_Pressure.PressureSampler).
+            self.take = self._take
+
+    def __getattr__(self, name):
+        return getattr(self._adc, name)
+
+    def read(self, pin):
+        value = self._adc.read(pin)
+        if value is not None:
+            # None: no conversion yet (a buffered reader), nothing read.
+            self._writer.event(TRACE_ADC, pin, value)
+        return value
+
+    def _take(self, pin):
+        # Readings accumulated by a buffered reader: recorded as their
+        # mean, which a replay reads back until the next take.
+        total, count = self._adc.take(pin)
+        if count:
+            self._writer.event(TRACE_ADC, pin, total/count)
+        return total, count
+
+def read_trace(path):
+    """Read the events of a trace file.
+
+    Args:
+        path:       A String specifying the trace file path.
+
+    Returns:
+        events:     A List of (time [ns], kind, pin name, value) Tuples,
+                    in recorded order.
+    """
+    with open(path, "rb") as trace:
+        data = trace.read()
+    if not data.startswith(TRACE_MAGIC):
+        raise ValueError("Not an SRS trace file: {}".format(path))
+
+    events = []
+    names = {}
+    now = 0
+    offset = len(TRACE_MAGIC)
+    try:
+        while offset < len(data):
+            kind = data[offset]
+            if kind == TRACE_PIN:
+                kind, index, size = _PIN.unpack_from(data, offset)
+                offset += _PIN.size
+                names[index] = data[offset:offset + size].decode()
+                offset += size
+            elif kind == TRACE_TIME:
+                kind, now = _TIME.unpack_from(data, offset)
+                offset += _TIME.size
+            else:
+                kind, index, delta, value = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                now += delta
+                events.append((now, kind, names[index], value))
+    except struct.error:
+        pass            # Truncated by a crash mid-write.
+    return events
@@ -0,0 +1,25 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# ROV SRS test configuration: the tests run against the virtual-clock
+# simulator (ROV_SRS_Sim), so they need no BeagleBone Black.
+#
+
+import os
+import sys
+
+import pytest
+
+os.environ["ROV_SRS_BACKEND"] = "sim"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from ROV_SRS_Sim import SIM
+
+@pytest.fixture
+def sim():
+    """The simulator, reset to time 0 with no hardware attached."""
+    SIM.reset()
+    yield SIM
+    SIM.reset()
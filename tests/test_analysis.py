@@ -0,0 +1,122 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Analysis.
+#
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import ROV_SRS_Analysis as Analysis
+import ROV_SRS_Bench as Bench
+import ROV_SRS_CompactLog as CompactLog
+import ROV_SRS_Main as Main
+
+COMMANDS = "\t1\t1\t-1\t0\t1\t0"
+
+def write(tmp_path, text, name="pressure.log"):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+def test_parse_log_columns(tmp_path):
+    path = write(tmp_path, "12:00:00\t0.5" + COMMANDS + "\n"
+                           "12:00:00\t0.6" + COMMANDS + "\n"
+                           "12:00:01\t0.7\t-1\t1\t1\t1\t1\t1\n")
+    times, values, commands = Analysis.parse_log(path, date=0.0)
+    assert times.tolist() == [43200.0, 43200.5, 43201.0]
+    assert values.dtype == np.float32
+    assert values.tolist() == pytest.approx([0.5, 0.6, 0.7])
+    assert commands.tolist() == [[1, 1, -1, 0, 1, 0], [1, 1, -1, 0, 1, 0],
+                                 [-1, 1, 1, 1, 1, 1]]
+
+def test_parse_log_without_commands(tmp_path):
+    path = write(tmp_path, "12:00:00\t0.5\n12:00:01\t0.6\n")
+    times, values, commands = Analysis.parse_log(path, date=0.0)
+    assert times.tolist() == [43200.0, 43201.0]
+    assert commands.shape == (2, 0)
+
+def test_parse_log_fractions(tmp_path):
+    path = write(tmp_path, "12:00:00.25\t0.5\n12:00:00.750000\t0.6\n")
+    times, values, commands = Analysis.parse_log(path, date=0.0)
+    assert times.tolist() == pytest.approx([43200.25, 43200.75])
+
+def test_parse_log_truncated_last_line(tmp_path):
+    path = write(tmp_path, "12:00:00\t0.5" + COMMANDS + "\n12:00:0")
+    times, values, commands = Analysis.parse_log(path, date=0.0)
+    assert times.tolist() == [43200.0]
+    assert len(values) == len(commands) == 1
+
+@pytest.mark.parametrize("line", [
+    "12:00:01\tbad" + COMMANDS,
+    "12:00:01\t" + COMMANDS,
+    "12:00:01\t1-" + COMMANDS,
+    "12:00:01\t0.5\t1\t1\tx\t0\t1\t0",
+    "12:00:01\t0.5\t1\t1\t-1",
+    "12:xx:01\t0.5" + COMMANDS,
+    "garbage",
+    "",
+    ])
+def test_parse_log_drops_malformed_lines(tmp_path, line):
+    path = write(tmp_path, "12:00:00\t0.5" + COMMANDS + "\n" + line + "\n"
+                           "12:00:02\t0.7" + COMMANDS + "\n")
+    times, values, commands = Analysis.parse_log(path, date=0.0)
+    assert times.tolist() == [43200.0, 43202.0]
+    assert values.tolist() == pytest.approx([0.5, 0.7])
+    assert commands.shape == (2, Analysis.AN_COMMANDS)
+
+def test_parse_log_unix_time(tmp_path):
+    path = write(tmp_path, "1400000000.5\t0.5\n1400000001.5\t0.6\n")
+    times, values, commands = Analysis.parse_log(path, date=0.0)
+    assert times.tolist() == [1400000000.5, 1400000001.5]
+
+def test_parse_log_midnight_rollover(tmp_path):
+    path = write(tmp_path, "23:59:59\t0.5\n00:00:00\t0.6\n")
+    times, values, commands = Analysis.parse_log(path, date=0.0)
+    assert times.tolist() == [86399.0, 86400.0]
+
+def test_parse_log_empty(tmp_path):
+    times, values, commands = Analysis.parse_log(write(tmp_path, ""),
+                                                 date=0.0)
+    assert len(times) == len(values) == len(commands) == 0
+
+def test_parse_log_compact(tmp_path):
+    path = str(tmp_path / "pressure.srsl")
+    writer = CompactLog.CompactLogWriter(path)
+    writer.add(1000.0, 0.5, (1, 1, -1, 0, 1, 0))
+    writer.add(1000.5, 0.25, (-1, 1, 1, 1, 1, 1))
+    writer.close()
+    times, values, commands = Analysis.parse_log(path)
+    assert times.tolist() == pytest.approx([1000.0, 1000.5])
+    assert values.tolist() == pytest.approx([0.5, 0.25])
+    assert commands.tolist() == [[1, 1, -1, 0, 1, 0], [-1, 1, 1, 1, 1, 1]]
+
+def test_load_caches(tmp_path):
+    path = write(tmp_path, "12:00:00\t0.5" + COMMANDS + "\n")
+    first = Analysis.load(path)
+    second = Analysis.load(path)
+    for parsed, cached in zip(first, second):
+        assert np.array_equal(parsed, cached)
+    assert second[2].shape == (1, Analysis.AN_COMMANDS)
+
+def test_closures(sim, tmp_path, monkeypatch):
+    # A dive logged by main(): the gripper is commanded closed from 6 s
+    # and open again at 12 s.
+    monkeypatch.chdir(tmp_path)
+    Bench.setup_sim(14.0)
+    sim.set_width(Main.PIN_LA_IN, Bench.BENCH_WIDTH_MIN, 6.0)
+    sim.set_width(Main.PIN_LA_IN, Bench.BENCH_WIDTH_MAX, 12.0)
+    sim.set_width(Main.PIN_LA_IN, Bench.BENCH_WIDTH_MID, 12.5)
+    with pytest.raises(Bench.SimulationEnd):
+        Main.main()
+    path, = tmp_path.glob("*" + CompactLog.CL_SUFFIX)
+    times, values, commands = Analysis.load(str(path))
+    times = times - sim.clock.epoch
+
+    window, = Analysis.closures(times, commands, margin=1.0)
+    # The first and last samples logged with the LA Command latched to 0.
+    assert window[0] == pytest.approx(6.0, abs=0.2)
+    assert window[1] == pytest.approx(12.0 + 1.0, abs=0.2)
+    assert Analysis.closures(times, commands[:, :0]) == []
@@ -0,0 +1,88 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Calibration.
+#
+
+import pytest
+
+import ROV_SRS_Calibration as Calibration
+import ROV_SRS_Library as SRS
+import ROV_SRS_Main as Main
+
+READINGS = [0.0, 0.1234, 0.5, 0.75, 0.9876, 1.0]
+POINTS = [(0.1, 0.0), (0.5, 40.0), (0.9, 100.0)]
+TABLE_TOL = 0.01    # Error of a point between two table entries [psi].
+
+def test_default_is_identity():
+    calibration = Calibration.PressureCalibration(
+        temperature = Main.PT_WATER_TEMP)
+    for value in READINGS:
+        assert calibration.convert(value) == pytest.approx(value, abs=1e-12)
+    assert list(calibration.convert_batch(READINGS)) == pytest.approx(
+        READINGS, abs=1e-12)
+
+def test_default_matches_uncalibrated_read(sim):
+    # Main's calibration leaves read_pressure() as it was without one.
+    sim.attach_pressure("AIN0")
+    raw = []
+    for n in range(20):
+        raw.append(SRS.read_pressure("AIN0"))
+        sim.clock.sleep(0.1)
+
+    sim.reset()
+    sim.attach_pressure("AIN0")
+    SRS.pressure_calibration = Calibration.PressureCalibration(
+        temperature = Main.PT_WATER_TEMP)
+    try:
+        calibrated = []
+        for n in range(20):
+            calibrated.append(SRS.read_pressure("AIN0"))
+            sim.clock.sleep(0.1)
+    finally:
+        SRS.pressure_calibration = None
+    assert calibrated == pytest.approx(raw, abs=1e-12)
+
+def test_points_interpolated():
+    calibration = Calibration.PressureCalibration(POINTS)
+    for x, p in POINTS:
+        assert calibration.convert(x) == pytest.approx(p, abs=TABLE_TOL)
+    assert calibration.convert(0.3) == pytest.approx(20.0)
+    assert calibration.convert(0.7) == pytest.approx(70.0)
+    # Extrapolated from the end segments.
+    assert calibration.convert(0.0) == pytest.approx(-10.0)
+    assert calibration.convert(1.0) == pytest.approx(115.0)
+
+def test_batch_matches_single():
+    calibration = Calibration.PressureCalibration(POINTS, offset=1.5,
+                                                  temperature=4.0,
+                                                  zero_coeff=0.1,
+                                                  span_coeff=0.2)
+    values = [n/997.0 for n in range(998)]
+    assert list(calibration.convert_batch(values)) == pytest.approx(
+        [calibration.convert(value) for value in values])
+
+def test_temperature_and_offset():
+    calibration = Calibration.PressureCalibration(
+        POINTS, offset=2.0, zero_coeff=0.5, span_coeff=1.0, temp_ref=20.0)
+    assert calibration.convert(0.5) == pytest.approx(38.0, abs=TABLE_TOL)
+    # 10 degC colder: span -10 %, zero -5 psi.
+    calibration.set_temperature(10.0)
+    assert calibration.convert(0.5) == pytest.approx(
+        0.9*40.0 - 5.0 - 2.0, abs=TABLE_TOL)
+
+def test_too_few_points():
+    with pytest.raises(ValueError):
+        Calibration.PressureCalibration([(0.0, 0.0)])
+
+def test_repeated_point_merged():
+    calibration = Calibration.PressureCalibration(POINTS + [POINTS[1]])
+    assert calibration.points == POINTS
+    assert calibration.convert(0.3) == pytest.approx(20.0)
+    with pytest.raises(ValueError):
+        Calibration.PressureCalibration([(0.5, 1.0), (0.5, 1.0)])
+
+def test_duplicate_reading_rejected():
+    with pytest.raises(ValueError):
+        Calibration.PressureCalibration(POINTS + [(0.5, 41.0)])
@@ -0,0 +1,89 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Capture.
+#
+
+import pytest
+
+import ROV_SRS_Capture as Capture
+import ROV_SRS_Library as SRS
+
+PIN = "P8_12"
+FREQ = 70.0
+MAX = 14.1
+MIN = 6.9
+TOL = 25.0
+WIDTH = 0.0015
+
+@pytest.fixture
+def capture(sim):
+    sim.attach_pwm(PIN, FREQ, WIDTH)
+    capture = Capture.EdgeCapture([PIN], FREQ, MAX, MIN, TOL)
+    capture.start()
+    yield capture
+    capture.stop()
+
+def test_widths(sim, capture):
+    sim.clock.sleep(0.5)
+    assert capture.count(PIN) >= 30
+    assert capture.width(PIN, 4) == pytest.approx(WIDTH, abs=1e-6)
+    assert not capture.lost(PIN)
+    assert capture.filtered(PIN) == (pytest.approx(WIDTH, abs=1e-6), 1)
+
+def test_loss_holds_and_reacquires(sim, capture):
+    channel = capture.channels[PIN]
+    sim.clock.sleep(0.2)
+    sim.set_width(PIN, 0.0)
+    sim.clock.sleep(capture.timeout + 0.05)
+    assert capture.lost(PIN)
+    assert capture.width(PIN) == channel.width_hold
+    assert capture.filtered(PIN) == (channel.width_hold, 1)
+
+    wide = channel.width_max
+    sim.set_width(PIN, wide)
+    sim.clock.sleep(1.5/FREQ)
+    assert not capture.lost(PIN)
+    assert capture.losses[PIN] == 1
+    # Only the Pulses since the signal returned are used.
+    assert capture.width(PIN, 8) == pytest.approx(wide, abs=1e-6)
+    assert capture.filtered(PIN) == (pytest.approx(wide, abs=1e-6), 2)
+
+def test_edge_order_not_level(sim):
+    # Edges are told apart by their order, whatever the pin level reads
+    # when the callback runs (here always LOW: no source attached).
+    capture = Capture.EdgeCapture([PIN], FREQ, MAX, MIN, TOL)
+    for n in range(4):
+        start = n/FREQ
+        sim.clock.advance_to(start)
+        capture._edge(PIN)
+        sim.clock.advance_to(start + WIDTH)
+        capture._edge(PIN)
+    assert capture.count(PIN) == 4
+    assert capture.width(PIN) == pytest.approx(WIDTH)
+
+def test_glitch_ignored(sim):
+    capture = Capture.EdgeCapture([PIN], FREQ, MAX, MIN, TOL)
+    # A Pulse, then a doubled Falling Edge: the second edge and the next
+    # (a glitch) do not make a Pulse.
+    for t in (0.0, WIDTH, WIDTH + 5e-6, WIDTH + 10e-6, 1/FREQ,
+              1/FREQ + WIDTH):
+        sim.clock.advance_to(t)
+        capture._edge(PIN)
+    assert capture.count(PIN) == 2
+    assert capture.width(PIN, 2) == pytest.approx(WIDTH)
+
+def test_missed_edge_resynchronizes(sim):
+    capture = Capture.EdgeCapture([PIN], FREQ, MAX, MIN, TOL)
+    # A Falling Edge first (started mid-Pulse), then a missed Falling
+    # Edge: each costs one Pulse only.
+    sim.clock.advance_to(0.0005)
+    capture._edge(PIN)
+    for start, edges in ((1/FREQ, (0.0, WIDTH)), (2/FREQ, (0.0,)),
+                         (3/FREQ, (0.0, WIDTH))):
+        for offset in edges:
+            sim.clock.advance_to(start + offset)
+            capture._edge(PIN)
+    assert capture.count(PIN) == 2
+    assert capture.width(PIN, 2) == pytest.approx(WIDTH)
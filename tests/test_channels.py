@@ -0,0 +1,162 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Channels.
+#
+
+import pytest
+
+import ROV_SRS_Capture as Capture
+import ROV_SRS_Channels as Channels
+import ROV_SRS_Library as SRS
+import ROV_SRS_Main as Main
+import ROV_SRS_Motion as Motion
+
+FREQ = Main.PWM_WID_FREQ
+PWM = (FREQ, Main.PWM_WID_MAX, Main.PWM_WID_MIN, Main.PWM_WID_TOL)
+WIDTH_MID = 0.0015
+WIDTH_MAX = 0.002
+WIDTH_MIN = Main.PWM_WID_MIN/100.0/FREQ
+OUT = ["LA0", "LA1"]
+POT = "AIN0"
+
+class RecordDriver(object):
+    """Records what the pipeline passes to a driver."""
+
+    def __init__(self):
+        self.calls = []
+
+    def actuate(self, trend, width, pwm):
+        self.calls.append((trend, width))
+
+@pytest.fixture
+def channels(sim):
+    table = []
+    for name, cont in (("a", False), ("b", True)):
+        sim.attach_pwm(name, FREQ, WIDTH_MID)
+        table.append([name, "t", FREQ, name, [], SRS.LA_COMMANDS, cont,
+                      True, ("none",)])
+    capture = Capture.EdgeCapture([row[3] for row in table], *PWM,
+                                  window=Main.PWM_FILTER_NUM,
+                                  trim=Main.PWM_TRIM_NUM)
+    capture.start()
+    channels = Channels.Channels(table, capture, Main.POS_HIST_NUM)
+    channels.drivers = [RecordDriver(), RecordDriver()]
+    yield channels
+    capture.stop()
+
+def run(sim, channels, passes):
+    for n in range(passes):
+        sim.clock.sleep(1.0/FREQ)
+        channels.step([0, 1])
+
+def test_trend_follows_filtered_command(sim, channels):
+    run(sim, channels, 10)
+    assert channels.trends == [1, 1]
+    sim.set_width("a", WIDTH_MAX)
+    sim.set_width("b", WIDTH_MAX)
+    # The median takes two Pulses; the trend stage adds no delay.
+    trends = []
+    for n in range(4):
+        run(sim, channels, 1)
+        trends.append(list(channels.trends))
+    assert trends[2] == [2, 2]
+    assert [trend[0] for trend in trends].count(2) == 1
+
+def test_glitch_never_reaches_driver(sim, channels):
+    # Every driver, the jog driver included, gets the filtered width: a
+    # single glitched Pulse changes neither the width nor the Command.
+    run(sim, channels, 10)
+    now = sim.clock.now
+    sim.set_width("b", WIDTH_MAX, now)
+    sim.set_width("b", WIDTH_MID, now + 1.0/FREQ)
+    run(sim, channels, 10)
+    widths = [width for trend, width in channels.drivers[1].calls]
+    assert widths == pytest.approx([WIDTH_MID]*len(widths), abs=1e-6)
+    assert channels.commands[1] == 1
+
+@pytest.mark.parametrize("cont, trends", [
+    (False, [1, 2, 1, 1, 1, 1]),
+    (True, [1, 2, 2, 2, 1, 1])])
+def test_default_history(cont, trends):
+    # The first differing (filtered) Command changes the trend, in both
+    # modes; no further agreeing Commands are waited for.
+    trend_filter = SRS.TrendFilter(Main.POS_HIST_NUM, cont)
+    assert [trend_filter.update(cmd)
+            for cmd in (1, 2, 2, 2, 1, 1)] == trends
+
+@pytest.fixture
+def gripper(sim):
+    sim.attach_pwm("la", FREQ, WIDTH_MID)
+    # Retracted to the stroke target (0.25 of the full stroke).
+    model = sim.attach_linear(OUT, POT, SRS.LA_MAX_STROKE, SRS.LA_MAX_TIME,
+                              position=0.5)
+    capture = Capture.EdgeCapture(["la"], *PWM, window=Main.PWM_FILTER_NUM,
+                                  trim=Main.PWM_TRIM_NUM)
+    channels = Channels.Channels(
+        [["la", "t", FREQ, "la", OUT, SRS.LA_COMMANDS, False, True,
+          ("linear", POT, Main.LA_STROKE_TARGET)]],
+        capture, Main.POS_HIST_NUM)
+    capture.start()
+    channels.start()
+    yield channels, model
+    channels.drivers[0].motion.stop()
+    capture.stop()
+
+def run_la(sim, channels, duration):
+    for n in range(int(round(duration*FREQ))):
+        sim.clock.sleep(1.0/FREQ)
+        channels.step([0])
+
+@pytest.mark.parametrize("width, position", [
+    (WIDTH_MID, 1.0),      # Latched Close: the move resumes.
+    (WIDTH_MAX, 0.25)])    # Open: a new Command replaces it.
+def test_hold_resumes_move(sim, gripper, width, position):
+    channels, model = gripper
+    sim.set_width("la", WIDTH_MIN)
+    run_la(sim, channels, 0.1)
+    sim.set_width("la", WIDTH_MID)
+    run_la(sim, channels, 0.4)
+    motion = channels.drivers[0].motion
+    assert motion.state == Motion.LA_EXTEND
+
+    # The watchdog holds mid-move, while the pipeline is overdue.
+    channels.hold()
+    held = model.pot(sim.clock.now)
+    sim.clock.sleep(0.1)
+    assert model.pot(sim.clock.now) == pytest.approx(held, abs=0.01)
+    assert 0.3 < held < 0.9
+
+    sim.set_width("la", width)
+    run_la(sim, channels, 2.0)
+    assert not motion.busy()
+    assert model.pot(sim.clock.now) == pytest.approx(position, abs=0.02)
+
+def test_hold_resumes_index(sim):
+    sim.attach_pwm("cs", FREQ, WIDTH_MID)
+    model = sim.attach_stepper(Main.PIN_CS_OUT)
+    capture = Capture.EdgeCapture(["cs"], *PWM, window=Main.PWM_FILTER_NUM,
+                                  trim=Main.PWM_TRIM_NUM)
+    channels = Channels.Channels(
+        [["cs", "t", FREQ, "cs", Main.PIN_CS_OUT, SRS.CS_COMMANDS, False,
+          False, Main.CS_DRIVER]], capture, Main.POS_HIST_NUM)
+    stepper = channels.drivers[0].stepper
+    slot = stepper.steps_per_rev//Main.CS_GRIPPER_NUM
+    capture.start()
+    channels.start()
+    try:
+        sim.set_width("cs", WIDTH_MAX)
+        run_la(sim, channels, 0.1)
+        sim.set_width("cs", WIDTH_MID)
+        while not 0 < stepper.position < slot//2:
+            run_la(sim, channels, 1.0/FREQ)
+        channels.hold()
+        held = model.position
+        sim.clock.sleep(0.1)
+        assert model.position == held
+        run_la(sim, channels, 2.0)
+    finally:
+        stepper.stop()
+        capture.stop()
+    assert model.position == stepper.position == slot
@@ -0,0 +1,154 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_CompactLog.
+#
+
+import os
+import random
+import time
+
+import pytest
+
+import ROV_SRS_CompactLog as CompactLog
+import ROV_SRS_Library as SRS
+
+EXTRAS = (1, 1, -1, 0, 1, 0)
+
+def write_log(path, count, start=1000.0, step=0.1, **kwargs):
+    writer = CompactLog.CompactLogWriter(path, **kwargs)
+    for n in range(count):
+        writer.add(start + n*step, 0.5 + 0.001*(n % 10), EXTRAS)
+    writer.close()
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "a.srsl")
+    write_log(path, 3000, block_records=256)
+    reader = CompactLog.CompactLogReader(path)
+    times, values, extras = reader.read()
+    assert reader.count() == len(times) == 3000
+    assert times[1234] == pytest.approx(1123.4)
+    assert values[1234] == pytest.approx(0.504)
+    assert extras[1234] == EXTRAS
+    assert reader.span() == pytest.approx((1000.0, 1299.9))
+    assert len(reader.blocks) == 12
+
+def test_read_range(tmp_path):
+    path = str(tmp_path / "a.srsl")
+    write_log(path, 3000, block_records=256)
+    times, values, extras = CompactLog.CompactLogReader(path).read(
+        1100.0, 1100.45)
+    assert times == pytest.approx([1100.0, 1100.1, 1100.2, 1100.3, 1100.4])
+
+def test_flush_time(tmp_path):
+    path = str(tmp_path / "a.srsl")
+    write_log(path, 100, step=1.0, flush_time=10.0)
+    assert len(CompactLog.CompactLogReader(path).blocks) == 10
+
+def test_damaged_block_skipped(tmp_path):
+    path = str(tmp_path / "a.srsl")
+    write_log(path, 1024, block_records=256)
+    offset = CompactLog.CompactLogReader(path).blocks[1][2]
+    with open(path, "r+b") as log:
+        log.seek(offset + CompactLog._BLOCK.size + 4)
+        byte = log.read(1)
+        log.seek(-1, os.SEEK_CUR)
+        log.write(bytes([byte[0] ^ 0xFF]))
+    reader = CompactLog.CompactLogReader(path)
+    times, values, extras = reader.read()
+    assert len(times) == 768
+    assert reader.errors == 1
+
+def test_index_rebuilt(tmp_path):
+    path = str(tmp_path / "a.srsl")
+    write_log(path, 1024, block_records=256)
+    blocks = CompactLog.CompactLogReader(path).blocks
+    os.remove(path + CompactLog.CL_INDEX_SUFFIX)
+    reader = CompactLog.CompactLogReader(path)
+    assert [block[2:] for block in reader.blocks] == [
+        block[2:] for block in blocks]
+    assert len(reader.read()[0]) == 1024
+
+def test_not_compact(tmp_path):
+    path = tmp_path / "a.log"
+    path.write_text("12:00:00\t0.5\n")
+    assert not CompactLog.is_compact(str(path))
+    with pytest.raises(ValueError):
+        CompactLog.CompactLogReader(str(path))
+
+def test_downsample(tmp_path):
+    path = str(tmp_path / "a.srsl")
+    write_log(path, 1000)
+    assert CompactLog.downsample(path) > 0
+    reader = CompactLog.CompactLogReader(path)
+    times, values, extras = reader.read()
+    assert reader.level == 2
+    assert len(times) == 500
+    assert times[1] == pytest.approx(1000.2)
+    assert values[0] == pytest.approx(0.5005)
+
+def test_downsample_streams_blocks(tmp_path, monkeypatch):
+    path = str(tmp_path / "a.srsl")
+    write_log(path, 1000, block_records=256)
+    times, values, extras = CompactLog.CompactLogReader(path).read()
+
+    # Never the whole file at once; runs of 3 straddle the blocks.
+    def read(self, start=None, end=None):
+        raise AssertionError("whole file read")
+
+    monkeypatch.setattr(CompactLog.CompactLogReader, "read", read)
+    assert CompactLog.downsample(path, 3) > 0
+    monkeypatch.undo()
+    reader = CompactLog.CompactLogReader(path)
+    assert reader.level == 3
+    low_times, low_values, low_extras = reader.read()
+    assert low_times == pytest.approx(times[::3])
+    assert low_values == pytest.approx(
+        [sum(values[n:n + 3])/len(values[n:n + 3])
+         for n in range(0, 1000, 3)], abs=CompactLog.CL_VALUE_QUANTUM)
+    assert low_extras == [extras[min(n + 3, 1000) - 1]
+                          for n in range(0, 1000, 3)]
+
+def test_store_within_quota(tmp_path):
+    quota = 128*1024
+    store = CompactLog.LogStore("p", str(tmp_path), quota=quota,
+                                file_size=quota//8, reserve=0)
+    noise = random.Random(1)
+    for n in range(200000):
+        store.add(1000.0 + 0.01*n, noise.random(), EXTRAS)
+    store.close()
+    assert store.usage() <= quota
+    assert all(CompactLog._size(path) <= quota//8 for path in store.files())
+    assert store.downsampled > 0
+    assert len(store.files()) > 1
+
+def test_store_write_lines(tmp_path):
+    store = CompactLog.LogStore("p", str(tmp_path), reserve=0)
+    stamp = time.strftime("%H:%M:%S", time.localtime())
+    store.write(stamp + "\t0.5\n" + stamp + "\t0.25\t1\t1\t-1\t0\t1\t0\n"
+                + stamp + "\tbad\n" + stamp + "\t0.7")
+    store.write("5\n")
+    store.close()
+    times, values, extras = CompactLog.CompactLogReader(store.path).read()
+    assert values == pytest.approx([0.5, 0.25, 0.75])
+    assert extras == [CompactLog._NO_EXTRAS, EXTRAS, CompactLog._NO_EXTRAS]
+    assert abs(times[0] - time.time()) < 2.0
+    assert store.malformed == 1
+
+def test_store_write_across_midnight(tmp_path):
+    store = CompactLog.LogStore("p", str(tmp_path), reserve=0)
+    now = time.time()
+    day = store._date("00:00:00", now)
+    assert abs(day - now) <= CompactLog.CL_DAY/2
+    assert store._date("23:59:59", day + 1.0) == day - 1.0
+    store.close()
+
+def test_logfile_to_store(tmp_path, sim):
+    store = CompactLog.LogStore("p", str(tmp_path), reserve=0)
+    SRS.setup_logfile("p", store)
+    for n in range(10):
+        SRS.log_buffer.push(0.1*n)
+    SRS.close_logfile()
+    times, values, extras = CompactLog.CompactLogReader(store.path).read()
+    assert values == pytest.approx([0.1*n for n in range(10)])
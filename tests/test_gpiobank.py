@@ -0,0 +1,72 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_GpioBank, on a file standing in for /dev/mem.
+#
+
+import pytest
+
+import ROV_SRS_GpioBank as GpioBank
+import ROV_SRS_Library as SRS
+
+# "DIR" and "STEP" in one bank (GPIO0), and a pair split across banks.
+SAME = ["P8_13", "P8_17"]
+SPLIT = ["P8_7", "P8_8"]    # GPIO2.
+OTHER = ["P8_11"]           # GPIO1.
+
+@pytest.fixture
+def banks(tmp_path):
+    banks = GpioBank.GpioBanks(str(tmp_path/"gpio.bin"))
+    yield banks
+    banks.uninstall()
+    banks.close()
+
+def test_bank_bit():
+    assert GpioBank.bank_bit("P8_13") == (0, 23)
+    assert GpioBank.bank_bit("P9_25") == (3, 21)
+    with pytest.raises(ValueError):
+        GpioBank.bank_bit("P9_39")
+
+def test_output_and_level(banks):
+    assert banks.emulated
+    banks.output("P8_13", 1)
+    banks.output("P8_17", 1)
+    assert banks.level("P8_13") == banks.level("P8_17") == 1
+    banks.output("P8_13", 0)
+    assert banks.level("P8_13") == 0
+    assert banks.level("P8_17") == 1
+
+def test_command_table(banks):
+    out = SAME
+    outputs = banks.command_outputs(out, SRS.LA_COMMANDS)
+    for cmd, row in enumerate(SRS.LA_COMMANDS):
+        outputs.write(cmd)
+        assert [banks.level(pin) for pin in out] == list(row)
+    # One CLEAR and one SET write per row (one bank), clearing first.
+    writes = outputs._writes[0]
+    assert [index*4 for registers, index, mask in writes] == [
+        GpioBank.GPIO_CLEARDATAOUT, GpioBank.GPIO_SETDATAOUT]
+
+def test_command_table_across_banks(banks):
+    out = SPLIT + OTHER
+    table = [[1, 0, 1], [0, 1, 0], [0, 0, 0]]
+    outputs = banks.command_outputs(out, table)
+    for cmd, row in enumerate(table):
+        outputs.write(cmd)
+        assert [banks.level(pin) for pin in out] == row
+    # The clear write comes before the sets of both banks.
+    offsets = [index*4 for registers, index, mask in outputs._writes[0]]
+    assert offsets == [GpioBank.GPIO_CLEARDATAOUT,
+                       GpioBank.GPIO_SETDATAOUT,
+                       GpioBank.GPIO_SETDATAOUT]
+
+def test_install(banks):
+    banks.install()
+    outputs = SRS.command_outputs(SAME, SRS.LA_COMMANDS)
+    assert isinstance(outputs, GpioBank.BankOutputs)
+    outputs.write(0)
+    assert [banks.level(pin) for pin in SAME] == list(SRS.LA_COMMANDS[0])
+    banks.uninstall()
+    assert not isinstance(SRS.command_outputs(SAME, SRS.LA_COMMANDS),
+                          GpioBank.BankOutputs)
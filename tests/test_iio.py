@@ -0,0 +1,77 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Iio, on the file-backed IIO stand-in.
+#
+
+import pytest
+
+import ROV_SRS_Iio as Iio
+import ROV_SRS_Library as SRS
+import ROV_SRS_Motion as Motion
+
+PINS = ["P9_40", "P9_39"]   # AIN1, AIN0: scanned as AIN0, AIN1.
+OUT = ["LA0", "LA1"]
+
+@pytest.fixture
+def adc(tmp_path):
+    stand_in = Iio.IioStandIn(str(tmp_path), PINS)
+    adc = Iio.BufferedADC(PINS, sysfs=stand_in.sysfs, dev=stand_in.dev)
+    adc.stand_in = stand_in
+    adc.setup()
+    yield adc
+    adc.uninstall()
+    adc.close()
+
+def test_setup_enables_pins(adc):
+    assert adc.pins == ["P9_39", "P9_40"]
+    assert sorted(adc.stand_in.enabled()) == sorted(PINS)
+
+def test_no_value_before_first_scan(adc):
+    assert adc.read("P9_39") is None
+    assert adc.read_raw("P9_40") is None
+    assert adc.take("P9_39") == (0.0, 0)
+
+def test_read_newest_scan(adc):
+    adc.stand_in.append([(0.25, 0.5), (0.75, 1.0)])
+    assert adc.read("P9_39") == pytest.approx(0.75, abs=1e-3)
+    assert adc.read_raw("P9_40") == pytest.approx(Iio.IIO_RAW_SCALE)
+    assert adc.scans == 2
+    # The newest value is kept until the next scan.
+    assert adc.read("P9_39") == pytest.approx(0.75, abs=1e-3)
+
+def test_take_accumulates(adc):
+    adc.stand_in.append([(0.2, 0.0)]*3)
+    adc.drain()
+    adc.stand_in.append([(0.4, 0.0)])
+    total, count = adc.take("P9_39")
+    assert count == 4
+    assert total == pytest.approx(1.0, abs=1e-3)
+    assert adc.take("P9_39") == (0.0, 0)
+
+def test_read_pressure_before_first_scan(adc):
+    adc.install([SRS])
+    assert SRS.read_pressure("P9_40") is None
+
+def test_linear_motion_waits_for_first_scan(sim, adc):
+    adc.install([Motion])
+    motion = Motion.LinearMotion(OUT, "P9_39", SRS.LA_MAX_STROKE)
+    motion.start()
+    try:
+        assert motion.position is None
+        motion.command(Motion.LA_EXTEND)
+        sim.clock.sleep(0.2)
+        # Not driven on a missing conversion.
+        assert motion.state == Motion.LA_HOLD
+        assert motion.position is None
+        assert [sim.gpio.levels.get(pin) for pin in OUT] == list(
+            SRS.LA_COMMANDS[1])
+
+        adc.stand_in.append([(0.0, 0.0)])
+        motion.command(Motion.LA_EXTEND)
+        sim.clock.sleep(0.02)
+        assert motion.position is not None
+        assert motion.state == Motion.LA_EXTEND
+    finally:
+        motion.stop()
@@ -0,0 +1,306 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Library.
+#
+
+from collections import deque
+import random
+import time
+
+import pytest
+
+import ROV_SRS_Library as SRS
+
+PIN = "P8_12"
+FREQ = 70.0
+MAX = 14.1
+MIN = 6.9
+TOL = 25.0
+
+@pytest.fixture
+def signal(sim):
+    SRS._signal_lost.clear()
+    yield sim.attach_pwm(PIN, FREQ, 0.0015)
+    SRS._signal_lost.clear()
+
+def test_get_width(sim, signal):
+    assert SRS.get_width(PIN, 5, FREQ, MAX, MIN, TOL) == pytest.approx(
+        0.0015, abs=1e-6)
+
+def test_get_width_signal_loss(sim, signal):
+    hold = SRS.pwm_channel(FREQ, MAX, MIN, TOL).width_hold
+    sim.set_width(PIN, 0.0)
+    start = sim.clock.now
+    assert SRS.get_width(PIN, 5, FREQ, MAX, MIN, TOL) == hold
+    assert sim.clock.now - start <= SRS.PWM_LOSS_PERIODS/FREQ + 1e-3
+    assert PIN in SRS._signal_lost
+
+    # While lost, a call only probes about one period.
+    start = sim.clock.now
+    assert SRS.get_width(PIN, 5, FREQ, MAX, MIN, TOL) == hold
+    assert sim.clock.now - start <= 1.2/FREQ
+
+    sim.set_width(PIN, 0.0019)
+    assert SRS.get_width(PIN, 5, FREQ, MAX, MIN, TOL) == pytest.approx(
+        0.0019, abs=1e-6)
+    assert PIN not in SRS._signal_lost
+
+def test_pulses_timeout(sim, signal):
+    sim.set_width(PIN, 0.0)
+    start = sim.clock.now
+    assert SRS._pulses(PIN, 1, 0.01, start + 1.0, 0.0025) == []
+    assert sim.clock.now - start == pytest.approx(0.01)
+    # Edge detection is released after each call.
+    assert SRS._pulses(PIN, 1, 1.0, start + 0.015, 0.0025) == []
+    assert sim.clock.now == pytest.approx(start + 0.015)
+
+def test_pulses_from_mid_pulse(sim, signal):
+    # Started while the pin is high: the partial Pulse is not measured,
+    # and every following Pulse is (one period each).
+    sim.clock.sleep(1.0/FREQ + 0.001)
+    assert SRS.GPIO.input(PIN) == SRS.GPIO.HIGH
+    start = sim.clock.now
+    widths = SRS._pulses(PIN, 5, 1.0, start + 1.0, 0.0025)
+    assert widths == pytest.approx([0.0015]*5, abs=1e-9)
+    assert sim.clock.now - start == pytest.approx(5.0/FREQ - 0.001 + 0.0015,
+                                                  abs=SRS.PWM_POLL_TIME)
+
+def test_pulses_resync_after_missed_edge(sim, signal, monkeypatch):
+    # The first edge seen is taken as Rising (the pin read low), but it
+    # is a Falling Edge: the gap to the next edge is longer than any
+    # Pulse, which makes that edge Rising again.
+    sim.clock.sleep(1.0/FREQ + 0.001)
+    monkeypatch.setattr(sim.gpio, "input", lambda pin: SRS.GPIO.LOW)
+    widths = SRS._pulses(PIN, 2, 1.0, sim.clock.now + 1.0, 0.0025)
+    assert widths == pytest.approx([0.0015]*2, abs=1e-9)
+
+def test_pulse_filter_median():
+    pulses = SRS.PulseFilter(3, 1)
+    assert pulses.update(0.0015) == 0.0015
+    assert pulses.update(0.0015) == 0.0015
+    # A single glitched Pulse is rejected outright.
+    assert pulses.update(0.0025) == 0.0015
+    assert pulses.update(0.0015) == 0.0015
+    assert pulses.update(0.0015) == 0.0015
+    # A stick change shows on its second Pulse.
+    assert pulses.update(0.0020) == 0.0015
+    assert pulses.update(0.0020) == 0.0020
+    assert pulses.width == 0.0020
+
+def test_pulse_filter_mean_and_reset():
+    pulses = SRS.PulseFilter(4)
+    for width in (1.0, 2.0, 3.0, 4.0, 5.0):
+        pulses.update(width)
+    assert pulses.width == pytest.approx(3.5)
+    pulses.reset()
+    assert pulses.width == pytest.approx(3.5)
+    assert pulses.update(1.0) == 1.0
+
+def test_pulse_filter_trims_too_much():
+    with pytest.raises(ValueError):
+        SRS.PulseFilter(3, 2)
+
+def loop_correct(sample, freq, max, min, tol):
+    # The original per-call correction loops of get_width().
+    width_max = (1/freq)*(max/100)
+    width_min = (1/freq)*(min/100)
+    width_tol = (width_max - width_min)*(tol/100)
+    while sample >= (1/freq):
+        sample -= (1/freq)
+    while sample > (width_max + width_tol):
+        sample -= width_tol
+    while sample < (width_min - width_tol):
+        sample += width_tol
+    return sample
+
+def bracket(width, freq, max, min, tol):
+    # The original Pulse Width brackets of set_position().
+    width_max = (1/freq)*(max/100)
+    width_min = (1/freq)*(min/100)
+    width_tol = (width_max - width_min)*(tol/100)
+    if width >= (width_max - width_tol):
+        return 2
+    elif width >= (width_min + width_tol):
+        return 1
+    elif width >= (width_min - width_tol):
+        return 0
+    return -1
+
+def test_pwm_channel_correct_matches_loops():
+    channel = SRS.PwmChannel(FREQ, MAX, MIN, TOL)
+    rand = random.Random(1)
+    # Widths within range, and measured across missed edges.
+    samples = [rand.uniform(0.0, 5.0/FREQ) for n in range(2000)]
+    samples += [0.0, channel.period, channel.width_max, channel.width_min]
+    for sample in samples:
+        expected = loop_correct(sample, FREQ, MAX, MIN, TOL)
+        assert channel.correct(sample) == pytest.approx(expected, abs=1e-12)
+        assert SRS.correct_width(sample, FREQ, MAX, MIN, TOL) == (
+            channel.correct(sample))
+
+def test_pwm_channel_classify_matches_brackets():
+    channel = SRS.PwmChannel(FREQ, MAX, MIN, TOL)
+    rand = random.Random(2)
+    widths = [rand.uniform(0.0, 1.2*channel.width_max) for n in range(2000)]
+    # The thresholds themselves (inclusive, as the brackets).
+    widths += list(channel._thresholds)
+    for width in widths:
+        assert channel.classify(width) == bracket(width, FREQ, MAX, MIN, TOL)
+        assert SRS.set_position(width, FREQ, MAX, MIN, TOL) == (
+            channel.classify(width))
+
+def test_pwm_channel_tolerance_range():
+    with pytest.raises(ValueError):
+        SRS.PwmChannel(FREQ, MAX, MIN, 50.0)
+    with pytest.raises(ValueError):
+        SRS.PwmChannel(FREQ, MAX, MIN, 0.0)
+
+def test_pwm_channel_deflection():
+    channel = SRS.PwmChannel(FREQ, MAX, MIN, TOL)
+    assert channel.deflection(channel.width_max) == pytest.approx(1.0)
+    assert channel.deflection(channel.width_min) == pytest.approx(-1.0)
+    assert channel.deflection(channel.width_hold) == 0.0
+    assert channel.deflection(0.0) is None
+
+def test_pwm_channel_learn():
+    channel = SRS.PwmChannel(FREQ, MAX, MIN, TOL, learn=3)
+    span = channel.width_max - channel.width_min
+    low = channel.width_min + 0.1*span
+    high = channel.width_max - 0.1*span
+    assert channel.learn(low)
+    assert channel.learn(channel.width_hold)
+    assert not channel.learn(high)
+    assert channel.learned
+    assert (channel.width_min, channel.width_max) == (low, high)
+    assert channel.classify(high) == 2
+
+def test_pwm_channel_learn_narrow_span_kept():
+    channel = SRS.PwmChannel(FREQ, MAX, MIN, TOL, learn=2)
+    nominal = (channel.width_min, channel.width_max)
+    channel.learn(channel.width_hold)
+    assert not channel.learn(channel.width_hold)
+    assert not channel.learned
+    assert (channel.width_min, channel.width_max) == nominal
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5, 8, 11])
+@pytest.mark.parametrize("cont", [True, False])
+def test_trend_filter_matches_check_trend(size, cont):
+    rand = random.Random(size)
+    trend_filter = SRS.TrendFilter(size, cont)
+    hist = deque([1]*size, maxlen=size)
+    # Runs of random lengths, so that trends form and break.
+    for n in range(400):
+        cmd = rand.choice((-1, 0, 1, 2))
+        for m in range(rand.randint(1, size + 1)):
+            hist.append(cmd)
+            assert trend_filter.update(cmd) == SRS.check_trend(hist, cont)
+            assert trend_filter.last == cmd
+
+def test_trend_filter_release():
+    # Glitched Commands end a continuous trend only after release of
+    # them in a row.
+    trends = {}
+    for release in (1, 3):
+        trend_filter = SRS.TrendFilter(6, True, release=release)
+        for n in range(6):
+            trend_filter.update(2)
+        trends[release] = [trend_filter.update(cmd) for cmd in (0, 1, 0)]
+    assert trends == {1: [1, 1, 1], 3: [2, 2, 1]}
+
+def test_trend_filter_dwell():
+    trend_filter = SRS.TrendFilter(2, True, dwell=5)
+    trends = [trend_filter.update(cmd) for cmd in (2, 0, 0, 0, 0, 0)]
+    assert trends == [2, 2, 2, 2, 2, 0]
+
+def test_trend_filter_reset():
+    trend_filter = SRS.TrendFilter(4, True)
+    for n in range(4):
+        trend_filter.update(2)
+    assert trend_filter.trend == 2
+    assert trend_filter.reset() == 1
+    assert trend_filter.last == 1
+    # The history was refilled: one Command does not form a trend.
+    assert trend_filter.update(2) == 1
+
+class LogFile(object):
+    """A log file recording each write (and the close)."""
+
+    def __init__(self):
+        self.writes = []
+        self.closed = False
+
+    def write(self, text):
+        self.writes.append(text)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def lines(self):
+        return "".join(self.writes).splitlines()
+
+def test_log_buffer_batches(sim):
+    log = LogFile()
+    buffer = SRS.LogBuffer(log, batch=10, period=2.0)
+    buffer.start()
+    try:
+        for n in range(9):
+            buffer.push(0.5 + n)
+        # The control loop never waits on the file.
+        assert log.writes == []
+        sim.clock.sleep(SRS.LOG_POLL_TIME)
+        assert log.writes == []
+        buffer.push(9.5)
+        sim.clock.sleep(SRS.LOG_POLL_TIME)
+        assert len(log.writes) == 1
+        assert buffer.written == 10
+
+        # A short batch is written once the flush period has passed.
+        buffer.push(10.5)
+        sim.clock.sleep(1.0)
+        assert buffer.written == 10
+        sim.clock.sleep(1.0 + SRS.LOG_POLL_TIME)
+        assert (len(log.writes), buffer.written) == (2, 11)
+    finally:
+        buffer.close()
+
+def test_log_buffer_format(sim):
+    log = LogFile()
+    buffer = SRS.LogBuffer(log)
+    buffer.push(0.25)
+    buffer.push(0.5, sim.clock.monotonic() + 1.0)
+    buffer.close()
+    assert log.lines() == [
+        time.strftime("%H:%M:%S", time.localtime(int(sim.clock.epoch + t)))
+        + "\t" + value for t, value in ((0.0, "0.25"), (1.0, "0.5"))]
+
+def test_log_buffer_full_drops(sim):
+    log = LogFile()
+    buffer = SRS.LogBuffer(log, size=4)
+    for n in range(6):
+        buffer.push(float(n))
+    assert buffer.dropped == 2
+    buffer.flush()
+    assert [line.split("\t")[1] for line in log.lines()] == [
+        "0.0", "1.0", "2.0", "3.0"]
+    # Room again once written.
+    buffer.push(4.0)
+    buffer.close()
+    assert (buffer.written, buffer.dropped) == (5, 2)
+
+def test_log_pressure_rate(sim):
+    log = LogFile()
+    SRS.setup_logfile("test.log", log=log)
+    try:
+        for n in range(95):
+            SRS.log_pressure(0.5, 10)
+            sim.clock.sleep(0.01)
+    finally:
+        SRS.close_logfile()
+    # 0.95 sec at 100 Hz, logged at 10 Hz; close writes the rest.
+    assert len(log.lines()) == 10
+    assert log.closed
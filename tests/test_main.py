@@ -0,0 +1,53 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Main.
+#
+
+import ROV_SRS_Bench as Bench
+import ROV_SRS_Iio as Iio
+import ROV_SRS_Main as Main
+from ROV_SRS_Stats import STATS
+
+# A short dive: close the gripper, index the carousel, tilt down.
+PROFILE = [(0.5, Main.PIN_LA_IN, Bench.BENCH_WIDTH_MIN),
+           (1.0, Main.PIN_CS_IN, Bench.BENCH_WIDTH_MAX),
+           (1.5, Main.PIN_CS_IN, Bench.BENCH_WIDTH_MID),
+           (1.5, Main.PIN_SS_IN, Bench.BENCH_WIDTH_MAX)]
+
+def test_instrumented_timers_record(sim, monkeypatch):
+    monkeypatch.setattr(STATS, "histograms", {})
+    Main.instrument()
+    timers = sorted(STATS.histograms)
+    STATS.restore()
+    assert "Pressure.PressureSampler.read" in timers
+    assert "Telemetry.TelemetryRing.push" in timers
+
+    # main() instruments the same calls again; every one is live.
+    Bench.run_main(3.0, PROFILE)
+    assert [name for name in timers
+            if STATS.histograms[name].count == 0] == []
+
+def test_adc_driver_set_up_before_buffer(sim, tmp_path, monkeypatch):
+    # The ADC driver creates the IIO device the buffered reader opens.
+    calls = []
+    stand_in = Iio.IioStandIn(str(tmp_path), [Main.PIN_LA_POT,
+                                              Main.PIN_PT_IN])
+
+    BufferedADC = Iio.BufferedADC
+
+    class StandInADC(BufferedADC):
+        def __init__(self, pins):
+            BufferedADC.__init__(self, pins, sysfs=stand_in.sysfs,
+                                 dev=stand_in.dev)
+
+        def setup(self):
+            calls.append("buffer")
+            BufferedADC.setup(self)
+
+    monkeypatch.setattr(Iio, "BufferedADC", StandInADC)
+    monkeypatch.setattr(Main.ADC, "setup", lambda: calls.append("driver"))
+    monkeypatch.setattr(Main, "ADC_BUFFERED", True)
+    Bench.run_main(0.5)
+    assert calls == ["driver", "buffer"]
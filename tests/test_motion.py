@@ -0,0 +1,275 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Motion.
+#
+
+import math
+
+import pytest
+
+import ROV_SRS_Library as SRS
+import ROV_SRS_Motion as Motion
+
+OUT = ["DIR", "STEP"]
+RATE_MAX = Motion.SS_STEP_RATE_MAX
+RATE_MIN = Motion.SS_STEP_RATE_MIN
+ACCEL = Motion.SS_STEP_ACCEL
+LIMITS = (-300, 300)
+LA_OUT = ["LA0", "LA1"]
+POT = "AIN0"
+STROKE = 1.5        # Stroke target [inch]: retracts to 0.25.
+LOWER = 1.0 - STROKE/SRS.LA_MAX_STROKE
+TOL = Motion.LA_POSITION_TOL
+
+@pytest.fixture
+def stepper(sim):
+    model = sim.attach_stepper(OUT)
+    engine = Motion.StepperEngine(OUT, 1.8, RATE_MAX, RATE_MIN, ACCEL,
+                                  LIMITS)
+    engine.model = model
+    engine.start()
+    yield engine
+    engine.stop()
+
+def run(sim, stepper, duration, period=0.02, jog=None):
+    """Run for a time, jogging every period; return the step rates."""
+    rates = []
+    end = sim.clock.now + duration
+    while sim.clock.now < end:
+        if jog is not None:
+            stepper.jog(jog)
+        tick = sim.clock.now + period
+        while sim.clock.now < tick:
+            sim.clock.sleep(0.001)
+            rates.append(stepper._rate)
+    return rates
+
+def test_move_to_exact(sim, stepper):
+    stepper.move_to(250)
+    run(sim, stepper, 3.0)
+    assert not stepper.busy()
+    assert stepper.position == stepper.model.position == 250
+
+def test_jog_stops_on_limit(sim, stepper):
+    rates = run(sim, stepper, 4.0, jog=RATE_MAX)
+    assert max(rates) == pytest.approx(RATE_MAX)
+    assert not stepper.busy()
+    assert stepper.position == stepper.model.position == LIMITS[1]
+
+    run(sim, stepper, 5.0, jog=-RATE_MAX)
+    assert stepper.position == stepper.model.position == LIMITS[0]
+
+@pytest.mark.parametrize("limit", range(20, 48))
+def test_jog_short_travel_no_overrun(sim, limit):
+    # Travel too short to reach the top rate: the stop begins while
+    # still accelerating.
+    model = sim.attach_stepper(OUT)
+    engine = Motion.StepperEngine(OUT, 1.8, RATE_MAX, RATE_MIN, ACCEL,
+                                  (-limit, limit))
+    engine.start()
+    try:
+        positions = []
+        for n in range(100):
+            run(sim, engine, 0.02, jog=RATE_MAX)
+            positions.append(model.position)
+    finally:
+        engine.stop()
+    assert max(positions) == engine.position == limit
+
+def test_jog_near_limit_no_overrun(sim, stepper):
+    # Start a few steps short of the limit, then speed up and reverse.
+    stepper.move_to(LIMITS[1] - 5)
+    run(sim, stepper, 3.0)
+    positions = []
+    for rate in (RATE_MIN, RATE_MAX, -RATE_MAX, RATE_MAX):
+        for n in range(20):
+            run(sim, stepper, 0.01, jog=rate)
+            positions.append(stepper.model.position)
+    run(sim, stepper, 2.0)
+    assert max(positions) <= LIMITS[1]
+    assert stepper.position == stepper.model.position == LIMITS[1]
+
+def test_jog_release_stops_within_limits(sim, stepper):
+    run(sim, stepper, 1.0, jog=RATE_MAX)
+    assert stepper.busy()
+    stepper.jog(0.0)
+    stop = stepper.target - stepper.position
+    run(sim, stepper, 2.0)
+    assert not stepper.busy()
+    assert stepper.position == stepper.model.position
+    # Stopped as soon as the deceleration allows.
+    assert 0 < stop <= math.ceil(RATE_MAX*RATE_MAX/(2.0*ACCEL))
+
+def test_profile_within_accel(sim, stepper):
+    stepper.move_to(LIMITS[1])
+    previous = None
+    while True:
+        sim.clock.sleep(0.0005)
+        rate = stepper._rate
+        if previous and rate:
+            assert abs(rate*rate - previous*previous) <= 2.0*ACCEL + 1e-6
+        previous = rate
+        if not stepper.busy():
+            break
+    assert stepper.position == LIMITS[1]
+
+def test_halt_holds_position(sim, stepper):
+    stepper.move_to(LIMITS[1])
+    run(sim, stepper, 0.5)
+    stepper.halt()
+    position = stepper.position
+    run(sim, stepper, 1.0)
+    assert not stepper.busy()
+    assert stepper.target == stepper.position == position
+    assert stepper.model.position == position
+
+@pytest.fixture
+def linear(sim):
+    model = sim.attach_linear(LA_OUT, POT, SRS.LA_MAX_STROKE,
+                              SRS.LA_MAX_TIME,
+                              position=SRS.LA_MAX_STROKE/2)
+    motion = Motion.LinearMotion(LA_OUT, POT, STROKE)
+    motion.model = model
+    motion.start()
+    yield motion
+    motion.stop()
+
+def settle(sim, motion, limit=3.0):
+    """Run until the move ends; return the final pot reading."""
+    end = sim.clock.now + limit
+    while motion.busy() and sim.clock.now < end:
+        sim.clock.sleep(0.001)
+    assert not motion.busy()
+    return motion.model.pot(sim.clock.now)
+
+def test_linear_command_does_not_block(sim, linear):
+    start = sim.clock.now
+    linear.command(Motion.LA_EXTEND)
+    assert sim.clock.now == start
+    assert linear.busy()
+    assert settle(sim, linear) == pytest.approx(1.0, abs=TOL)
+    assert linear.state == Motion.LA_HOLD
+    linear.command(Motion.LA_RETRACT)
+    assert settle(sim, linear) == pytest.approx(LOWER, abs=TOL)
+
+def test_linear_continue_keeps_moving(sim, linear):
+    linear.command(Motion.LA_EXTEND)
+    sim.clock.sleep(0.1)
+    # A latched Command (1) neither stops nor restarts the move.
+    linear.command(Motion.LA_HOLD)
+    assert linear.busy()
+    assert linear.state == Motion.LA_EXTEND
+    assert settle(sim, linear) == pytest.approx(1.0, abs=TOL)
+
+def test_linear_reversal(sim, linear):
+    linear.command(Motion.LA_EXTEND)
+    sim.clock.sleep(0.2)
+    turned = linear.model.pot(sim.clock.now)
+    assert turned > 0.55
+    linear.command(Motion.LA_RETRACT)
+    sim.clock.sleep(0.01)
+    assert linear.model.velocity < 0.0
+    assert linear.model.pot(sim.clock.now) < turned
+    assert settle(sim, linear) == pytest.approx(LOWER, abs=TOL)
+
+def test_linear_preempt_setpoint(sim, linear):
+    linear.move_to(0.9)
+    sim.clock.sleep(0.1)
+    linear.move_to(0.7)
+    assert linear.setpoint == 0.7
+    assert settle(sim, linear) == pytest.approx(0.7, abs=TOL)
+
+def test_linear_invalid_command_holds(sim, linear):
+    linear.command(Motion.LA_RETRACT)
+    sim.clock.sleep(0.1)
+    linear.command(-1)
+    assert not linear.busy()
+    held = linear.model.pot(sim.clock.now)
+    sim.clock.sleep(0.5)
+    assert linear.model.pot(sim.clock.now) == held < 0.5
+
+@pytest.fixture
+def coasting(sim):
+    # A shaft that runs on after the driver stops.
+    model = sim.attach_linear(LA_OUT, POT, SRS.LA_MAX_STROKE,
+                              SRS.LA_MAX_TIME,
+                              position=SRS.LA_MAX_STROKE/2, coast=0.01)
+    motion = Motion.LinearMotion(LA_OUT, POT, STROKE)
+    motion.model = model
+    motion.start()
+    yield motion
+    motion.stop()
+
+def test_setpoints_reached(sim, coasting):
+    for setpoint in (0.6, 0.35, 0.9, 0.8, 0.3, 0.95):
+        coasting.move_to(setpoint)
+        assert settle(sim, coasting) == pytest.approx(setpoint, abs=TOL)
+
+def test_overrun_learned(sim, coasting):
+    for setpoint in (0.9, 0.3)*3:
+        coasting.move_to(setpoint)
+        settle(sim, coasting)
+    # The run-on is speed times the coast time constant.
+    run_on = 0.01/SRS.LA_MAX_TIME
+    assert coasting.overrun == pytest.approx(run_on, rel=0.2)
+
+def test_sparse_reads(sim, linear):
+    # Polling the pot through a full stroke takes a read per ADC_READ_TIME.
+    reads = linear.reads
+    start = sim.clock.now
+    linear.command(Motion.LA_RETRACT)
+    settle(sim, linear)
+    linear.command(Motion.LA_EXTEND)
+    settle(sim, linear)
+    polled = (sim.clock.now - start)/sim.adc.read_time
+    assert linear.reads - reads < polled/50
+    assert linear.reads - reads < 100
+
+@pytest.fixture
+def carousel(sim):
+    model = sim.attach_stepper(OUT)
+    engine = Motion.StepperEngine(OUT, SRS.CS_STEP_ANGLE,
+                                  Motion.CS_STEP_RATE_MAX,
+                                  Motion.CS_STEP_RATE_MIN,
+                                  Motion.CS_STEP_ACCEL)
+    engine.model = model
+    engine.start()
+    yield engine
+    engine.stop()
+
+def test_index_next_slot(sim, carousel):
+    start = sim.clock.now
+    carousel.index(2)
+    assert sim.clock.now == start
+    assert carousel.target == 100
+    rates = run(sim, carousel, 1.5)
+    assert max(rates) <= Motion.CS_STEP_RATE_MAX
+    assert not carousel.busy()
+    assert carousel.position == carousel.model.position == 100
+    assert carousel.angle() == 180.0
+    # Faster than move_carousel()'s two CS_DRIVE_STEP_PERSIST per step.
+    assert (carousel.model.last_step - start
+            < 100*2*SRS.CS_DRIVE_STEP_PERSIST/2)
+
+def test_index_from_between_slots(sim, carousel):
+    carousel.move_to(30)
+    run(sim, carousel, 1.0)
+    carousel.index(4)
+    assert carousel.target == 50
+    carousel.index(4)
+    assert carousel.target == 100
+
+def test_index_during_move(sim, carousel):
+    carousel.index(2)
+    run(sim, carousel, 0.1)
+    assert 0 < carousel.position < 100
+    # A second index goes on from the target, not the position.
+    carousel.index(2)
+    assert carousel.target == 200
+    run(sim, carousel, 2.0)
+    assert carousel.model.position == 200
+    assert carousel.angle() == 0.0
+    rates = run(sim, carousel, 0.1)
+    assert max(rates) == 0.0
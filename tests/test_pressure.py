@@ -0,0 +1,88 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Pressure.
+#
+
+import pytest
+
+import ROV_SRS_Calibration as Calibration
+import ROV_SRS_Iio as Iio
+import ROV_SRS_Pressure as Pressure
+
+PIN = "P9_40"
+FREQ = 10.0
+
+def truth(model, t):
+    noise = model.noise
+    model.noise = 0.0
+    value = model(t)
+    model.noise = noise
+    return value
+
+def sample(sim, duration, **kwargs):
+    samples = []
+    sampler = Pressure.PressureSampler(
+        PIN, FREQ, callback=lambda t, value: samples.append((t, value)),
+        **kwargs)
+    sampler.start()
+    sim.clock.sleep(duration)
+    sampler.stop()
+    return sampler, samples
+
+def test_fixed_rate(sim):
+    sim.attach_pressure(PIN)
+    sampler, samples = sample(sim, 5.0)
+    assert sampler.count == len(samples) == pytest.approx(50, abs=1)
+    assert sampler.overruns == 0
+    for (t0, v0), (t1, v1) in zip(samples, samples[1:]):
+        assert t1 - t0 == pytest.approx(1.0/FREQ)
+    assert sampler.latest() == samples[-1]
+
+def test_oversampling_reduces_noise(sim):
+    model = sim.attach_pressure(PIN)
+    model.noise = 0.01
+    sampler, samples = sample(sim, 20.0)
+    errors = [value - truth(model, t) for t, value in samples]
+    rms = (sum(e*e for e in errors)/len(errors))**0.5
+    # 16 reads average the noise down by about 4 (the signal moves a
+    # little within a block).
+    assert rms < 0.5*model.noise
+
+def test_calibration_applied(sim):
+    sim.attach_pressure(PIN)
+    calibration = Calibration.PressureCalibration([(0.0, 0.0),
+                                                   (1.0, 100.0)])
+    sampler, raw = sample(sim, 1.0)
+    sim.reset()
+    sim.attach_pressure(PIN)
+    sampler, converted = sample(sim, 1.0, calibration=calibration)
+    assert [value for t, value in converted] == pytest.approx(
+        [100.0*value for t, value in raw], abs=0.01)
+
+def test_buffered_averages_every_conversion(sim, tmp_path):
+    stand_in = Iio.IioStandIn(str(tmp_path), [PIN])
+    adc = Iio.BufferedADC([PIN], sysfs=stand_in.sysfs, dev=stand_in.dev)
+    adc.setup()
+    adc.install([Pressure])
+    samples = []
+    sampler = Pressure.PressureSampler(
+        PIN, FREQ, callback=lambda t, value: samples.append(value))
+    try:
+        sampler.start()
+        stand_in.append([(1.0,)]*10)
+        sim.clock.sleep(0.01)
+        # Conversions before the run started are discarded.
+        stand_in.append([(0.2,)]*3 + [(0.4,)])
+        sim.clock.sleep(1.0/FREQ)
+        # No conversion in a period: no output sample.
+        sim.clock.sleep(1.0/FREQ)
+        stand_in.append([(0.6,)])
+        sim.clock.sleep(1.0/FREQ)
+    finally:
+        sampler.stop()
+        adc.uninstall()
+        adc.close()
+    assert samples == pytest.approx([0.25, 0.6], abs=1e-3)
+    assert sampler.count == 2
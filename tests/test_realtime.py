@@ -0,0 +1,71 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Realtime.
+#
+
+import types
+
+import pytest
+
+import ROV_SRS_Realtime as Realtime
+import ROV_SRS_Scheduler as Scheduler
+
+class Done(Exception):
+    """Ends a scheduler run."""
+
+def test_enter_reports_failures():
+    # Nothing requested: nothing to fail.
+    assert Realtime.enter(priority=None, lock=False) == []
+    failures = Realtime.enter(priority=None, cpus=[100000], lock=False)
+    assert len(failures) == 1
+    assert failures[0].startswith("CPU affinity")
+
+def test_watchdog_check(sim):
+    task = types.SimpleNamespace(name="la", deadline=0.01, pending=None)
+    holds = []
+    watchdog = Realtime.Watchdog(types.SimpleNamespace(tasks=[task]),
+                                 lambda: holds.append(sim.clock.now),
+                                 grace=0.005)
+    assert not watchdog.check()
+
+    task.pending = sim.clock.now
+    sim.clock.sleep(0.015)
+    assert not watchdog.check()
+    sim.clock.sleep(0.001)
+    assert watchdog.check()
+    # Once per missed cycle.
+    assert not watchdog.check()
+    assert (watchdog.trips, watchdog.last, len(holds)) == (1, "la", 1)
+
+    task.pending = sim.clock.now
+    sim.clock.sleep(0.02)
+    assert watchdog.check()
+    assert watchdog.trips == 2
+
+def test_watchdog_holds_hung_cycle(sim):
+    cycles = [0]
+    holds = []
+
+    def step():
+        cycles[0] += 1
+        if cycles[0] == 5:
+            # A stage hangs for 5 periods.
+            sim.clock.sleep(0.05)
+        elif cycles[0] > 10:
+            raise Done()
+
+    scheduler = Scheduler.Scheduler()
+    scheduler.add("la", 100.0, step)
+    watchdog = Realtime.Watchdog(scheduler,
+                                 lambda: holds.append(sim.clock.now))
+    watchdog.start()
+    start = sim.clock.now
+    with pytest.raises(Done):
+        scheduler.run()
+    watchdog.stop()
+    assert watchdog.trips == 1
+    # Held within the deadline, grace and one check period of the hang.
+    hang = start + 0.04
+    assert hang + 0.02 < holds[0] <= hang + 0.02 + Realtime.RT_WATCHDOG_TIME
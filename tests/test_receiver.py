@@ -0,0 +1,61 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Receiver.
+#
+
+import io
+
+import ROV_SRS_Receiver as Receiver
+import ROV_SRS_Telemetry as Telemetry
+
+def sample(t, pressure):
+    return Telemetry._SAMPLE.pack(t, pressure, 0, 1, 2, 1, 1, 0,
+                                  Telemetry.TELEM_SAMPLE)
+
+def timing(t):
+    return Telemetry._TIMING.pack(t, 0.015, 0.002, b"la", 3,
+                                  Telemetry.TELEM_TIMING)
+
+def frame(seq, *records):
+    return Telemetry.encode_frame(seq, 0.0, list(records))
+
+def test_frame_printed_and_recorded():
+    out = io.StringIO()
+    record = io.BytesIO()
+    receiver = Receiver.Receiver(out, record)
+    data = frame(0, sample(1000.25, 0.5), timing(1001.0))
+    receiver.frame(data)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 2
+    assert "P 0.50000" in lines[0]
+    assert "cmd  0  1  2  trend  1  1  0" in lines[0]
+    assert "task la" in lines[1] and "misses 3" in lines[1]
+    assert record.getvalue() == data
+    assert (receiver.frames, receiver.records, receiver.lost) == (1, 2, 0)
+
+def test_sequence_gaps():
+    out = io.StringIO()
+    receiver = Receiver.Receiver(out)
+    for seq in (0xFFFFFFFE, 0xFFFFFFFF, 0, 3, 4):
+        receiver.frame(frame(seq, sample(0.0, 0.0)))
+    # The gap across the wrap of the sequence number is not a loss.
+    assert receiver.lost == 2
+    assert "# lost 2 frame(s)" in out.getvalue()
+    assert receiver.frames == 5
+
+def test_invalid_frame_ignored():
+    record = io.BytesIO()
+    receiver = Receiver.Receiver(io.StringIO(), record)
+    receiver.frame(b"junk")
+    receiver.frame(frame(0, sample(0.0, 0.0))[:-1])
+    assert receiver.frames == 0
+    assert record.getvalue() == b""
+
+def test_read_recording():
+    frames = [frame(n, *[sample(float(m), 0.1*m) for m in range(n)])
+              for n in range(4)]
+    stream = io.BytesIO(b"".join(frames) + frames[3][:-5])
+    # A partial frame at the end of a recording is left out.
+    assert list(Receiver._read_frames(stream)) == frames
@@ -0,0 +1,82 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Scheduler.
+#
+
+import asyncio
+
+import pytest
+
+import ROV_SRS_Scheduler as Scheduler
+
+class Done(Exception):
+    """Ends a scheduler run."""
+
+def stop_after(cycles, step=None):
+    count = [0]
+
+    def stopper():
+        count[0] += 1
+        if count[0] > cycles:
+            raise Done()
+        if step is not None:
+            return step()
+
+    return stopper
+
+def run(scheduler):
+    with pytest.raises(Done):
+        scheduler.run()
+
+def test_rates(sim):
+    scheduler = Scheduler.Scheduler()
+    fast = scheduler.add("fast", 100.0, stop_after(200))
+    slow = scheduler.add("slow", 40.0, lambda: None)
+    run(scheduler)
+    assert fast.cycles == 200
+    assert fast.rate() == pytest.approx(100.0)
+    assert slow.rate() == pytest.approx(40.0)
+    assert slow.cycles == pytest.approx(80, abs=1)
+    assert fast.misses == slow.misses == 0
+
+def test_coroutine_step(sim):
+    async def stage():
+        await asyncio.sleep(0.004)
+
+    scheduler = Scheduler.Scheduler()
+    task = scheduler.add("co", 50.0, stop_after(20, stage))
+    run(scheduler)
+    assert task.cycles == 20
+    assert task.exec_max == pytest.approx(0.004)
+    assert task.rate() == pytest.approx(50.0)
+
+def test_overrun_skips_releases(sim):
+    cycles = [0]
+
+    def slow():
+        # Every 5th cycle runs for 2.5 periods.
+        cycles[0] += 1
+        if cycles[0] % 5 == 0:
+            sim.clock.sleep(0.025)
+
+    scheduler = Scheduler.Scheduler()
+    task = scheduler.add("la", 100.0, stop_after(50, slow))
+    run(scheduler)
+    assert task.misses == 10
+    # The releases 10 and 20 ms after each slow one.
+    assert task.skipped == 20
+    # Releases stay on the period grid instead of bursting.
+    assert task.periods.percentile(99)/1e9 == pytest.approx(0.03, abs=1e-3)
+
+def test_report(sim):
+    scheduler = Scheduler.Scheduler()
+    scheduler.add("la", 70.0, stop_after(10))
+    run(scheduler)
+    stat, = scheduler.report()
+    assert stat["name"] == "la"
+    assert stat["cycles"] == 10
+    assert stat["target_hz"] == pytest.approx(70.0)
+    assert stat["period_p99"] == pytest.approx(1.0/70.0, rel=0.05)
+    assert scheduler.format_report().splitlines()[1].startswith("la")
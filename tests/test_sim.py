@@ -0,0 +1,141 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Sim.
+#
+
+import pytest
+
+import ROV_SRS_Sim as Sim
+
+FREQ = 50.0
+WIDTH = 0.0015
+PHASE = 0.004
+OUT = ["LA0", "LA1"]
+STROKE = 2.0        # Linear Actuator stroke [inch].
+STROKE_TIME = 4.0   # Full stroke time [sec].
+
+def test_clock_runs_events_in_order(sim):
+    calls = []
+    sim.clock.schedule(0.3, lambda: calls.append(("b", sim.clock.now)))
+    sim.clock.schedule(0.1, lambda: calls.append(("a", sim.clock.now)))
+    sim.clock.sleep(0.2)
+    assert calls == [("a", 0.1)]
+    assert sim.clock.monotonic() == 0.2
+    assert sim.clock.time() == pytest.approx(sim.clock.epoch + 0.2)
+    sim.clock.sleep(0.2)
+    assert calls == [("a", 0.1), ("b", 0.3)]
+
+def test_clock_end(sim):
+    sim.reset(1.0)
+    sim.clock.sleep(0.75)
+    with pytest.raises(Sim.SimulationEnd):
+        sim.clock.sleep(0.5)
+    assert sim.clock.now == 1.0
+
+def test_worker_on_clock(sim):
+    ticks = []
+
+    def task():
+        while True:
+            ticks.append(sim.clock.now)
+            yield 0.25
+
+    worker = Sim.Worker(task)
+    worker.start()
+    sim.clock.sleep(1.0)
+    worker.stop()
+    sim.clock.sleep(1.0)
+    assert ticks == [0.0, 0.25, 0.5, 0.75, 1.0]
+    assert not worker.alive()
+
+def test_pwm_edges(sim):
+    sim.attach_pwm("in", FREQ, WIDTH, phase=PHASE)
+    assert sim.gpio.wait_for_edge("in", Sim.RISING) == "in"
+    assert sim.clock.now == pytest.approx(PHASE)
+    sim.gpio.wait_for_edge("in", Sim.FALLING)
+    assert sim.clock.now == pytest.approx(PHASE + WIDTH)
+    sim.gpio.wait_for_edge("in", Sim.RISING)
+    assert sim.clock.now == pytest.approx(PHASE + 1.0/FREQ)
+    sim.clock.sleep(WIDTH/2)
+    assert sim.gpio.input("in") == Sim.HIGH
+    sim.clock.sleep(WIDTH)
+    assert sim.gpio.input("in") == Sim.LOW
+
+def test_flat_pwm_times_out(sim):
+    sim.attach_pwm("in", FREQ, 0.0)
+    assert sim.gpio.wait_for_edge("in", Sim.RISING, timeout=100) is None
+    assert sim.clock.now == pytest.approx(0.1)
+    sim.set_width("in", WIDTH)
+    assert sim.gpio.wait_for_edge("in", Sim.RISING, timeout=100) == "in"
+    assert sim.clock.now == pytest.approx(0.1 + 1.0/FREQ)
+
+def test_edge_detect_callbacks(sim):
+    sim.attach_pwm("in", FREQ, WIDTH, phase=PHASE)
+    edges = []
+    sim.gpio.add_event_detect(
+        "in", Sim.BOTH,
+        lambda pin: edges.append((sim.clock.now, sim.gpio.input(pin))))
+    sim.clock.sleep(2.0/FREQ)
+    assert edges == pytest.approx([
+        (PHASE, Sim.HIGH), (PHASE + WIDTH, Sim.LOW),
+        (PHASE + 1.0/FREQ, Sim.HIGH), (PHASE + WIDTH + 1.0/FREQ, Sim.LOW)])
+    assert sim.gpio.event_detected("in")
+    assert not sim.gpio.event_detected("in")
+
+    sim.gpio.remove_event_detect("in")
+    sim.clock.sleep(1.0/FREQ)
+    assert len(edges) == 4
+    # No edge (or flat signal poll) is left scheduled.
+    assert sim.clock._events == []
+
+def test_adc_double_read(sim):
+    sim.adc.sources["AIN0"] = lambda t: t
+    assert sim.adc.read("AIN0") == 0.0
+    # Each read returns the conversion of the previous one.
+    assert sim.adc.read("AIN0") == pytest.approx(Sim.ADC_READ_TIME)
+    sim.adc.stale = False
+    assert sim.adc.read("AIN0") == pytest.approx(3*Sim.ADC_READ_TIME)
+    assert sim.adc.reads == 3
+
+def test_linear_actuator_speed(sim):
+    model = sim.attach_linear(OUT, "AIN0", STROKE, STROKE_TIME,
+                              position=1.0)
+    sim.gpio.output(OUT[0], Sim.HIGH)
+    sim.clock.sleep(1.0)
+    assert model.position() == pytest.approx(1.5)
+    # Stops at the end of the stroke.
+    sim.clock.sleep(10.0)
+    assert model.pot(sim.clock.now) == 1.0
+
+    sim.gpio.output(OUT[0], Sim.LOW)
+    sim.gpio.output(OUT[1], Sim.HIGH)
+    sim.clock.sleep(2.0)
+    assert model.position() == pytest.approx(1.0)
+    sim.gpio.output(OUT[1], Sim.LOW)
+    sim.clock.sleep(1.0)
+    assert model.position() == pytest.approx(1.0)
+
+    model.place(0.5)
+    sim.clock.sleep(1.0)
+    assert model.pot(sim.clock.now) == pytest.approx(0.25)
+
+def test_linear_actuator_coast(sim):
+    model = sim.attach_linear(OUT, "AIN0", STROKE, STROKE_TIME, coast=0.1)
+    sim.gpio.output(OUT[0], Sim.HIGH)
+    sim.clock.sleep(1.0)
+    sim.gpio.output(OUT[0], Sim.LOW)
+    sim.clock.sleep(1.0)
+    # Coasts on by speed times the time constant.
+    assert model.position() == pytest.approx(0.5 + 0.05, abs=1e-4)
+
+def test_stepper_counts_steps(sim):
+    model = sim.attach_stepper(["DIR", "STEP"])
+    for level in (Sim.LOW, Sim.LOW, Sim.LOW, Sim.HIGH):
+        sim.gpio.output("DIR", level)
+        sim.gpio.output("STEP", Sim.HIGH)
+        sim.clock.sleep(0.001)
+        sim.gpio.output("STEP", Sim.LOW)
+    assert (model.position, model.steps) == (2, 4)
+    assert model.last_step == pytest.approx(0.003)
@@ -0,0 +1,193 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Telemetry.
+#
+
+import socket
+import sys
+import threading
+
+import pytest
+
+import ROV_SRS_Telemetry as Telemetry
+
+STAT = {"name": "la", "period_p99": 0.0143, "latency_p99": 0.0021,
+        "misses": 70000}
+PUSHES = 20000
+
+@pytest.fixture
+def ring(sim):
+    ring = Telemetry.TelemetryRing(8)
+    yield ring
+    ring.release()
+
+def push(ring, n):
+    return ring.push(float(n), n/10.0, [n % 3, 1, -1], [1, n % 3, 2])
+
+def test_sample_round_trip(ring):
+    assert push(ring, 4)
+    records = ring.pop_all()
+    assert len(records) == 1
+    assert len(records[0]) == Telemetry._RECORD_SIZE
+    kind, fields = Telemetry.decode_record(records[0])
+    assert kind == Telemetry.TELEM_SAMPLE
+    assert fields == (4.0, 0.4, (1, 1, -1), (1, 1, 2))
+
+def test_timing_round_trip(ring):
+    assert ring.push_timing(2.5, STAT)
+    kind, fields = Telemetry.decode_record(ring.pop_all()[0])
+    assert kind == Telemetry.TELEM_TIMING
+    assert fields[0] == 2.5
+    assert fields[1] == pytest.approx(0.0143)
+    assert fields[2] == pytest.approx(0.0021)
+    # Name and misses are clipped to their fields.
+    assert fields[3:] == ("la", 0xFFFF)
+
+def test_full_ring_drops(ring):
+    for n in range(ring.size):
+        assert push(ring, n)
+    assert not push(ring, 99)
+    assert not ring.push_timing(0.0, STAT)
+    assert ring.dropped() == 2
+    assert ring.pending() == ring.size
+    records = ring.pop_all()
+    assert [Telemetry.decode_record(r)[1][0] for r in records] == [
+        float(n) for n in range(ring.size)]
+    assert ring.pending() == 0
+
+def test_order_across_laps(ring):
+    times = []
+    for n in range(5*ring.size):
+        push(ring, n)
+        if n % 3 == 0:
+            times.extend(Telemetry.decode_record(r)[1][0]
+                         for r in ring.pop_all())
+    times.extend(Telemetry.decode_record(r)[1][0] for r in ring.pop_all())
+    assert times == [float(n) for n in range(5*ring.size)]
+    assert ring.dropped() == 0
+
+def commit_offset(ring, n):
+    return ring._commits + (n & ring._mask)*Telemetry._COMMIT_SIZE
+
+def test_uncommitted_record_left(ring):
+    for n in range(3):
+        push(ring, n)
+    # The head is visible before the third record's commit word (e.g.
+    # stores seen out of order): the reader stops before it.
+    offset = commit_offset(ring, 2)
+    Telemetry._COUNT.pack_into(ring._buf, offset, 0)
+    assert len(ring.pop_all()) == 2
+    assert ring.pending() == 1
+    assert ring.pop_all() == []
+
+    Telemetry._COUNT.pack_into(ring._buf, offset, 3)
+    records = ring.pop_all()
+    assert [Telemetry.decode_record(r)[1][0] for r in records] == [2.0]
+
+def test_stale_lap_left(ring):
+    # A slot whose commit word is from the previous lap is not taken.
+    for n in range(ring.size + 1):
+        push(ring, n)
+        if n == 0:
+            ring.pop_all()
+    Telemetry._COUNT.pack_into(ring._buf, commit_offset(ring, ring.size),
+                               1)
+    assert len(ring.pop_all()) == ring.size - 1
+    assert ring.pending() == 1
+
+def test_frame_round_trip(ring):
+    for n in range(3):
+        push(ring, n)
+    records = ring.pop_all()
+    frame = Telemetry.encode_frame(7, 1234.5, records)
+    assert Telemetry.frame_size(frame) == len(frame)
+    assert len(frame) == (Telemetry.FRAME_HEADER_SIZE
+                          + 3*Telemetry._RECORD_SIZE)
+    assert Telemetry.decode_frame(frame) == (7, 1234.5, records)
+    assert Telemetry.decode_frame(Telemetry.encode_frame(0, 0.0, [])) == (
+        0, 0.0, [])
+
+def test_frame_invalid():
+    frame = Telemetry.encode_frame(1, 0.0, [bytes(Telemetry._RECORD_SIZE)])
+    with pytest.raises(ValueError):
+        Telemetry.decode_frame(frame[:-1])
+    with pytest.raises(ValueError):
+        Telemetry.decode_frame(frame[:Telemetry.FRAME_HEADER_SIZE - 1])
+    with pytest.raises(ValueError):
+        Telemetry.frame_size(b"XXXX" + frame[4:])
+
+def test_publisher_udp(ring):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1.0)
+    try:
+        publisher = Telemetry.Publisher(receiver.getsockname(), "udp",
+                                        bandwidth=1e6)
+        for n in range(3):
+            push(ring, n)
+        records = ring.pop_all()
+        for record in records:
+            publisher.add(record)
+        publisher.flush()
+        seq, sent, received = Telemetry.decode_frame(receiver.recv(2048))
+        publisher.close()
+    finally:
+        receiver.close()
+    assert seq == 0
+    assert received == records
+    assert (publisher.sent, publisher.dropped) == (1, 0)
+
+def test_publisher_backlog():
+    publisher = Telemetry.Publisher(("127.0.0.1", 9), "udp", bandwidth=0.0)
+    publisher._budget = 0.0
+    record = bytes(Telemetry._RECORD_SIZE)
+    for n in range(Telemetry.TELEM_BACKLOG + 5):
+        publisher.add(record)
+        publisher.flush()
+    assert publisher.sent == 0
+    assert publisher.dropped == 5
+    publisher.close()
+
+def test_two_producer_threads(sim):
+    # The sampler and scheduler threads both push: every record either
+    # reaches the consumer or is counted as dropped.
+    ring = Telemetry.TelemetryRing(256)
+    records = []
+    done = threading.Event()
+
+    def consume():
+        while not done.is_set() or ring.pending():
+            records.extend(ring.pop_all())
+
+    def produce(kind):
+        for n in range(PUSHES):
+            if kind == Telemetry.TELEM_SAMPLE:
+                push(ring, n)
+            else:
+                ring.push_timing(float(n), STAT)
+
+    threads = [threading.Thread(target=produce, args=(kind,))
+               for kind in (Telemetry.TELEM_SAMPLE, Telemetry.TELEM_TIMING)]
+    consumer = threading.Thread(target=consume)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        consumer.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        consumer.join()
+        dropped = ring.dropped()
+    finally:
+        sys.setswitchinterval(interval)
+        ring.release()
+    assert len(records) + dropped == 2*PUSHES
+    for kind in (Telemetry.TELEM_SAMPLE, Telemetry.TELEM_TIMING):
+        times = [Telemetry.decode_record(record)[1][0]
+                 for record in records if record[-1] == kind]
+        # Each producer's records arrive complete and in order.
+        assert times == sorted(set(times))
@@ -0,0 +1,158 @@
+# Copyright 2015, Giles Fernandes, Jonathan Lee
+# Distributed under the terms of the BSD 3-Clause License
+#
+#
+# Tests of ROV_SRS_Trace and ROV_SRS_Replay.
+#
+
+import os
+import types
+
+import pytest
+
+from ROV_SRS_Hardware import ADC
+from ROV_SRS_Hardware import GPIO
+import ROV_SRS_Bench as Bench
+import ROV_SRS_Iio as Iio
+import ROV_SRS_Main as Main
+import ROV_SRS_Replay as Replay
+import ROV_SRS_Trace as Trace
+from ROV_SRS_Sim import FALLING
+from ROV_SRS_Sim import HIGH
+from ROV_SRS_Sim import LOW
+from ROV_SRS_Sim import RISING
+
+IN = "P8_12"
+OUT = "P8_13"
+AIN = "P9_40"
+
+@pytest.fixture
+def traced(sim, tmp_path):
+    path = str(tmp_path/"dive.trace")
+    module = types.SimpleNamespace(GPIO=GPIO, ADC=ADC)
+    writer = Trace.TraceWriter(path)
+    writer.install([module])
+    yield writer, module, path
+    writer.uninstall()
+
+def test_events_recorded(sim, traced):
+    writer, module, path = traced
+    sim.attach_pwm(IN, 50.0, 0.005)
+    sim.attach_pressure(AIN)
+    edges = []
+    module.GPIO.add_event_detect(IN, RISING, callback=edges.append)
+    sim.clock.sleep(0.05)
+    module.GPIO.remove_event_detect(IN)
+    module.GPIO.output(OUT, HIGH)
+    value = module.ADC.read(AIN)
+    writer.close()
+    assert module.GPIO is GPIO and module.ADC is ADC
+
+    events = Trace.read_trace(path)
+    assert writer.records == len(events) == len(edges) + 2
+    kinds = [(kind, pin) for t, kind, pin, level in events]
+    assert kinds[:len(edges)] == [(Trace.TRACE_EDGE, IN)]*len(edges)
+    assert kinds[len(edges):] == [(Trace.TRACE_OUT, OUT),
+                                  (Trace.TRACE_ADC, AIN)]
+    assert events[-1][3] == pytest.approx(value)
+    # Rising edges every period, timed to the nanosecond.
+    times = [t for t, kind, pin, level in events[:len(edges)]]
+    for t0, t1 in zip(times, times[1:]):
+        assert t1 - t0 == pytest.approx(20e6, abs=1)
+
+def test_buffered_adc_recorded(sim, tmp_path):
+    stand_in = Iio.IioStandIn(str(tmp_path), [AIN])
+    adc = Iio.BufferedADC([AIN], sysfs=stand_in.sysfs, dev=stand_in.dev)
+    adc.setup()
+    path = str(tmp_path/"dive.trace")
+    module = types.SimpleNamespace(ADC=adc)
+    writer = Trace.TraceWriter(path)
+    writer.install([module])
+    try:
+        # No conversion yet: nothing to record.
+        assert module.ADC.read(AIN) is None
+        assert module.ADC.take(AIN) == (0.0, 0)
+        stand_in.append([(0.2,)]*3 + [(0.6,)])
+        total, count = module.ADC.take(AIN)
+        assert module.ADC.read(AIN) == pytest.approx(0.6, abs=1e-3)
+    finally:
+        writer.close()
+        adc.close()
+    assert count == 4
+    values = [value for t, kind, pin, value in Trace.read_trace(path)]
+    # The mean of the readings taken, then the newest reading.
+    assert values == pytest.approx([0.3, 0.6], abs=1e-3)
+
+def test_plain_adc_takes_nothing(traced):
+    writer, module, path = traced
+    assert not hasattr(module.ADC, "take")
+
+def test_long_gap_timed(sim, traced):
+    writer, module, path = traced
+    module.GPIO.output(OUT, HIGH)
+    sim.clock.sleep(10.0)
+    module.GPIO.output(OUT, LOW)
+    writer.close()
+    first, second = Trace.read_trace(path)
+    # Beyond the 32-bit delta: a new absolute time record.
+    assert second[0] - first[0] == pytest.approx(10e9, abs=1)
+
+def test_truncated_trace(sim, traced):
+    writer, module, path = traced
+    for n in range(5):
+        module.GPIO.output(OUT, n % 2)
+    writer.close()
+    with open(path, "rb+") as trace:
+        trace.truncate(os.path.getsize(path) - 3)
+    assert len(Trace.read_trace(path)) == 4
+
+def test_not_a_trace(tmp_path):
+    path = tmp_path/"junk"
+    path.write_bytes(b"junk")
+    with pytest.raises(ValueError):
+        Trace.read_trace(str(path))
+
+def test_recorded_commands(sim, traced):
+    writer, module, path = traced
+    for level in (LOW, HIGH, HIGH, LOW):
+        module.GPIO.output(OUT, level)
+        sim.clock.sleep(0.01)
+    writer.close()
+    commands = Replay.recorded(path)
+    # Unchanged levels are left out (outputs start LOW).
+    assert [(pin, level) for t, pin, level in commands] == [
+        (OUT, HIGH), (OUT, LOW)]
+    assert commands[1][0] - commands[0][0] == pytest.approx(0.02)
+
+def test_edge_trace(sim):
+    edges = Replay.EdgeTrace(sim.clock, [0.1, 0.2, 0.3], [HIGH, LOW, HIGH])
+    assert edges.level(0.0) == LOW
+    assert edges.level(0.25) == LOW
+    assert edges.next_edge(0.1, RISING) == 0.3
+    assert edges.next_edge(0.0, FALLING) == 0.2
+    assert edges.next_edge(0.2, FALLING) == float("inf")
+    assert edges.next_edge(0.3, RISING) is None
+    assert not edges.flat()
+
+def test_sample_trace():
+    samples = Replay.SampleTrace([0.0, 1.0], [0.25, 0.75])
+    assert samples(0.5) == 0.25
+    assert samples(1.0) == 0.75
+    assert samples(-1.0) == 0.25
+
+def test_replay_matches_recording(sim, tmp_path, monkeypatch):
+    path = str(tmp_path/"main.trace")
+    monkeypatch.setattr(Main, "TRACE_FILE", path)
+    Bench.run_main(2.0, [(0.5, Main.PIN_LA_IN, Bench.BENCH_WIDTH_MAX),
+                         (0.5, Main.PIN_CS_IN, Bench.BENCH_WIDTH_MAX)])
+    monkeypatch.setattr(Main, "TRACE_FILE", None)
+
+    recorded = Replay.recorded(path)
+    commands, duration, cpu = Replay.replay(path)
+    assert duration == pytest.approx(2.0, abs=0.01)
+    assert recorded
+    # The same command stream, timed from the first recorded event.
+    assert [command[1:] for command in commands] == [
+        command[1:] for command in recorded]
+    for expected, command in zip(recorded, commands):
+        assert command[0] == pytest.approx(expected[0], abs=1e-3)